@@ -338,9 +338,11 @@ def render_bottom_nav():
 
 
 def render_atleta_popup(atleta_id, ranking):
-    atleta_data = next((a for a in ranking if a["id"] == atleta_id), None)
-    if not atleta_data:
+    from data_manager import indice_ranking
+    i = indice_ranking(ranking).get(atleta_id)
+    if i is None:
         return
+    atleta_data = ranking[i]
     a = atleta_data
     foto = a["atleta"].get("foto_b64")
     foto_html = f'<img src="data:image/png;base64,{foto}" style="width:44px;height:44px;border-radius:50%;object-fit:cover;border:2px solid var(--accent1);flex-shrink:0">' if foto else '<div style="width:44px;height:44px;border-radius:50%;background:var(--bg-card);display:flex;align-items:center;justify-content:center;font-size:1.3rem;flex-shrink:0">👤</div>'
@@ -919,6 +921,8 @@ elif page == "ricalcola_stats":
             st.warning("Nessun atleta ha storico tornei. Completa prima un torneo.")
         else:
             st.markdown(f"**{len(atleti_con_storico)} atleti** con storico torneo trovati.")
+            st.caption(f"Ricalcolo deterministico (seme lega {state.get('seme_lega', '—')}): "
+                       "ripeterlo dà sempre gli stessi attributi, uguali a quelli assegnati a fine torneo.")
             with st.expander("👁 Anteprima storico", expanded=False):
                 for a in atleti_con_storico[:8]:
                     storico = a["stats"]["storico_posizioni"]
@@ -932,10 +936,32 @@ elif page == "ricalcola_stats":
                             st.caption(f"  → pos {pos}/{nsq}")
                 if len(atleti_con_storico) > 8:
                     st.caption(f"… e altri {len(atleti_con_storico)-8} atleti")
+            import career_engine
+            from data_manager import regole_punteggio
+            st.markdown("#### 🏅 Punti Ranking")
+            regole = regole_punteggio(state)
+            rc1, rc2, rc3 = st.columns(3)
+            with rc1:
+                formule = list(career_engine.FORMULE)
+                formula = st.selectbox("Formula piazzamento", formule, index=formule.index(regole["formula"]),
+                                       format_func=career_engine.ETICHETTE_FORMULE.get, key="ricalcola_formula")
+            with rc2:
+                totali = list(career_engine.ETICHETTE_TOTALI)
+                totale = st.selectbox("Totale ranking", totali, index=totali.index(regole["totale"]),
+                                      format_func=career_engine.ETICHETTE_TOTALI.get, key="ricalcola_totale")
+            with rc3:
+                if totale == "migliori_n":
+                    regole["migliori_n"] = st.number_input("Tornei contati per stagione", 1, 50,
+                                                           int(regole["migliori_n"]), key="ricalcola_migliori_n")
+                elif totale == "decadimento":
+                    regole["emivita_giorni"] = st.number_input("Giorni per dimezzare i punti", 30, 3650,
+                                                               int(regole["emivita_giorni"]), key="ricalcola_emivita")
             conf = st.checkbox("Confermo — ricalcola tutto da zero", key="conf_ricalcola_v2")
             if conf:
                 if st.button("🔄 RICALCOLA ORA", type="primary", use_container_width=True, key="btn_ricalcola_exec"):
                     from data_manager import ricalcola_stats_da_storico
+                    regole.update(formula=formula, totale=totale, riferimento=None)
+                    state["punteggio_ranking"] = regole
                     ricalcola_stats_da_storico(state)
                     save_state(state)
                     st.success(f"✅ Statistiche ricalcolate per {len(atleti_con_storico)} atleti!")
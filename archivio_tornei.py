@@ -0,0 +1,185 @@
+"""
+archivio_tornei.py — Archivio immutabile dei tornei conclusi
+Alla chiusura di un torneo (trasferisci_al_ranking) squadre, tutte le partite
+con i set, calendario (campo, orario, round) e posizioni finali vengono salvati
+in un record compatto, prima che Nuovo Torneo / avvio di un torneo programmato
+azzerino gironi, bracket e squadre. I record stanno fuori dallo state, non
+cambiano mai dopo la scrittura e si caricano solo quando servono.
+
+Righe:
+  archivio:<tid>       → record completo del torneo (JSON compatto, compresso dal codec),
+                         con l'Elo medio delle squadre a fine torneo
+  archivio_idx:<tid>   → voce d'indice: nome, data, luogo, n_squadre, atleti
+
+Le query (scontri diretti, replay dei rating, viste storiche) scorrono
+l'indice e caricano solo i tornei che interessano.
+"""
+import hashlib
+import json
+import secrets
+import threading
+
+ARCHIVIO_PREFIX = "archivio:"
+INDICE_PREFIX = "archivio_idx:"
+
+# Ordine dei campi di una partita archiviata (lista al posto del dict: righe più corte)
+CAMPI_PARTITA = ("id", "fase", "girone", "round", "sq1", "sq2", "punteggi",
+                 "set_sq1", "set_sq2", "vincitore", "campo", "orario_schedulato",
+                 "inizio_reale", "fine_reale", "classifica")
+_CAMPI_TORNEO = ("nome", "data", "luogo", "modalita", "tipo_gioco", "formato_set",
+                 "punteggio_max", "num_campi", "orario_inizio")
+
+_lock = threading.Lock()
+_indice_cache = {"righe": {}, "voci": {}}   # {chiave: valore grezzo} / {chiave: voce decodificata}
+_record_cache = {}                          # {tid: record}: i record non cambiano mai
+
+
+def nuovo_id_torneo(state):
+    """Assegna al torneo che parte il suo id (torneo["id"]): resta lo stesso fino all'archiviazione."""
+    t = state.setdefault("torneo", {})
+    t["id"] = f"{t.get('data', '')}_{secrets.token_hex(6)}"
+    return t["id"]
+
+
+def id_torneo(state):
+    """
+    Id stabile del torneo in corso (torneo["id"], salvato nello state e quindi
+    uguale anche nel replay). Non dipende dalle squadre: i BYE aggiunti dal
+    tabellone non lo cambiano. I tornei avviati prima di torneo["id"] lo
+    ricevono alla prima richiesta, dall'hash di nome, data e squadre.
+    """
+    t = state.setdefault("torneo", {})
+    if not t.get("id"):
+        firma = json.dumps([t.get("nome", ""), t.get("data", ""),
+                            sorted(sq["id"] for sq in state.get("squadre", []))], ensure_ascii=False)
+        t["id"] = f"{t.get('data', '')}_{hashlib.blake2b(firma.encode('utf-8'), digest_size=6).hexdigest()}"
+    return t["id"]
+
+
+def crea_record(state, posizioni, n_squadre):
+    """Record compatto del torneo: meta, squadre, partite e posizioni finali."""
+    t = state.get("torneo", {})
+    partite = [p for g in state.get("gironi", []) for p in g.get("partite", [])]
+    partite += state.get("bracket", []) + state.get("bracket_extra", [])
+    return {
+        "id": id_torneo(state),
+        "torneo": {k: t.get(k) for k in _CAMPI_TORNEO},
+        "n_squadre": n_squadre,
+        # [id, nome, [atleti], ghost]
+        "squadre": [[sq["id"], sq.get("nome", ""), list(sq.get("atleti", [])), bool(sq.get("is_ghost"))]
+                    for sq in state.get("squadre", [])],
+        "campi_partita": list(CAMPI_PARTITA),
+        "partite": [[p.get(c) for c in CAMPI_PARTITA] for p in partite
+                    if p.get("confermata") and not p.get("is_bye")],
+        "posizioni": posizioni,
+        # Elo medio delle squadre a fine torneo (divario di livello per durate_partite)
+        "elo_squadre": _elo_squadre(state),
+    }
+
+
+def _elo_squadre(state):
+    from data_manager import get_atleta_by_id
+    out = {}
+    for sq in state.get("squadre", []):
+        atleti = [a for a in (get_atleta_by_id(state, aid) for aid in sq.get("atleti", [])) if a]
+        if atleti and not sq.get("is_ghost"):
+            out[sq["id"]] = round(sum(a["stats"].get("rating", {}).get("elo", 1500.0)
+                                      for a in atleti) / len(atleti), 1)
+    return out
+
+
+def archivia(state, posizioni, n_squadre):
+    """
+    Salva il torneo in corso nell'archivio (una sola volta: un record già
+    presente non viene mai riscritto). Ritorna l'id del torneo.
+    """
+    from data_manager import storage_get, storage_write
+    record = crea_record(state, posizioni, n_squadre)
+    tid = record["id"]
+    state["torneo"]["archivio_id"] = tid
+    if storage_get(ARCHIVIO_PREFIX + tid):
+        return tid
+    atleti = sorted({aid for _sid, _nome, ids, ghost in record["squadre"] if not ghost for aid in ids})
+    voce = {"id": tid, **{k: record["torneo"][k] for k in ("nome", "data", "luogo")},
+            "n_squadre": n_squadre, "partite": len(record["partite"]), "atleti": atleti}
+    storage_write({
+        ARCHIVIO_PREFIX + tid: json.dumps(record, ensure_ascii=False, separators=(",", ":")),
+        INDICE_PREFIX + tid: json.dumps(voce, ensure_ascii=False, separators=(",", ":")),
+    })
+    with _lock:
+        _record_cache[tid] = record
+    import durate_partite
+    durate_partite.aggiungi_record(record)   # il modello delle durate impara dal torneo appena chiuso
+    return tid
+
+
+def indice(atleta_id=None):
+    """
+    Voci d'indice dei tornei archiviati in ordine cronologico, solo quelli
+    dell'atleta se indicato. Le voci già lette non vengono ridecodificate.
+    """
+    from data_manager import storage_read_all, _sheet_read_chunked
+    store = storage_read_all()
+    chiavi = [k for k in store if k.startswith(INDICE_PREFIX) and k.count(":") == 1]
+    with _lock:
+        righe, voci = dict(_indice_cache["righe"]), dict(_indice_cache["voci"])
+    nuove_righe, nuove_voci = {}, {}
+    for k in chiavi:
+        raw = store[k]
+        if righe.get(k) == raw:
+            nuove_righe[k], nuove_voci[k] = raw, voci[k]
+            continue
+        try:
+            nuove_voci[k] = json.loads(_sheet_read_chunked(store, k))
+            nuove_righe[k] = raw
+        except Exception:
+            continue
+    with _lock:
+        _indice_cache.update(righe=nuove_righe, voci=nuove_voci)
+    out = sorted(nuove_voci.values(), key=lambda v: (v.get("data") or "", v["id"]))
+    if atleta_id is not None:
+        out = [v for v in out if atleta_id in v.get("atleti", [])]
+    return out
+
+
+def carica(tid):
+    """Record completo di un torneo archiviato (None se non esiste), in cache."""
+    with _lock:
+        if tid in _record_cache:
+            return _record_cache[tid]
+    from data_manager import storage_get
+    raw = storage_get(ARCHIVIO_PREFIX + tid)
+    if not raw:
+        return None
+    record = json.loads(raw)
+    with _lock:
+        _record_cache[tid] = record
+    return record
+
+
+def partite(record):
+    """Partite di un record come dict (chiavi di CAMPI_PARTITA)."""
+    campi = record.get("campi_partita", CAMPI_PARTITA)
+    return [dict(zip(campi, p)) for p in record.get("partite", [])]
+
+
+def partite_rating(tornei=None):
+    """
+    Partite dei tornei archiviati (tutti, o le voci d'indice indicate) in ordine
+    cronologico, nel formato di rating_engine.riclassifica. Le simulate fuori
+    classifica restano escluse come nel calcolo incrementale.
+    """
+    out = []
+    for voce in (indice() if tornei is None else tornei):
+        record = carica(voce["id"])
+        if record is None:
+            continue
+        squadre = {sid: (ids, ghost) for sid, _nome, ids, ghost in record["squadre"]}
+        data = record["torneo"].get("data", "")
+        for p in partite(record):
+            s1, s2 = squadre.get(p["sq1"]), squadre.get(p["sq2"])
+            if not p.get("vincitore") or p.get("classifica") is False or not s1 or not s2 or s1[1] or s2[1]:
+                continue
+            out.append({"id": p["id"], "data": data, "sq1": s1[0], "sq2": s2[0],
+                        "vince_sq1": p["vincitore"] == p["sq1"]})
+    return out
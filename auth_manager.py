@@ -32,23 +32,28 @@ def _get_smtp_creds():
 
 
 # ─── PERSISTENZA UTENTI ───────────────────────────────────────────────────────
-# Chiave nel foglio Google Sheets: "users_db"
+# Storage di data_manager (Google Sheets + SQLite locale), una riga per utente:
+#   utente:<email>  → profilo utente
+# Il vecchio documento unico "users_db" viene ancora letto per migrazione.
 # ─────────────────────────────────────────────────────────────────────────────
 
 def _load_users() -> dict:
-    # 1. Prova Google Sheets
+    # 1. Storage (righe utente:<email>, oppure il vecchio users_db)
     try:
-        from data_manager import _get_gsheet, _sheet_read_all
-        sheet = _get_gsheet()
-        if sheet is not None:
-            store = _sheet_read_all(sheet)
-            from data_manager import _sheet_read_chunked
-            val = _sheet_read_chunked(store, "users_db")
-            if val:
-                return json.loads(val)
+        from data_manager import storage_read_all, _sheet_read_chunked
+        store = storage_read_all()
+        users = {}
+        for k in store:
+            if k.startswith("utente:") and not k.rpartition(":c")[2].isdigit():
+                users[k[len("utente:"):]] = json.loads(_sheet_read_chunked(store, k))
+        if users:
+            return users
+        val = _sheet_read_chunked(store, "users_db")
+        if val:
+            return json.loads(val)
     except Exception:
         pass
-    # 2. Fallback locale
+    # 2. Migrazione dal vecchio file locale
     if Path(USERS_FILE).exists():
         with open(USERS_FILE, "r", encoding="utf-8") as f:
             return json.load(f)
@@ -56,17 +61,15 @@ def _load_users() -> dict:
 
 
 def _save_users(users: dict):
-    # 1. Salva su Google Sheets
+    # Solo le righe degli utenti cambiati arrivano davvero al backend
     try:
-        from data_manager import _get_gsheet, _sheet_write
-        sheet = _get_gsheet()
-        if sheet is not None:
-            _sheet_write(sheet, {"users_db": json.dumps(users, ensure_ascii=False)})
+        from data_manager import storage_write, flush
+        storage_write({f"utente:{email}": json.dumps(u, ensure_ascii=False)
+                       for email, u in users.items()})
+        # Account e password: scrittura immediata, non aspettiamo il worker
+        flush()
     except Exception:
         pass
-    # 2. Backup locale silenzioso
-    with open(USERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(users, f, ensure_ascii=False, indent=2)
 
 
 def _hash_pw(pw: str) -> str:
@@ -0,0 +1,166 @@
+"""
+blob_store.py — Archivio immagini indirizzato per contenuto
+Foto atleti, copertine tornei, immagini carte Rivals/Draft, logo e banner del tema
+vengono salvati una sola volta, identificati dall'hash SHA-256 dei byte.
+Nei record resta solo il riferimento "blob:<hash>": un'immagine invariata
+non viene mai ricaricata, e la stessa immagine usata in due punti occupa
+un solo blob.
+
+Backend:
+  - locale:  file binari (niente base64, -25% di spazio) in BLOB_DIR, sempre attivo
+  - remoto:  pluggabile con set_remote_backend(); di default righe blob:<hash>
+             nello stesso Google Sheet, così gli altri dispositivi le vedono
+"""
+import base64
+import binascii
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+BLOB_DIR = "blob_store"
+REF_PREFIX = "blob:"
+
+_MEMO_MAX = 512   # voci massime nelle cache in memoria
+
+
+# ─── BACKEND ──────────────────────────────────────────────────────────────────
+# Un backend espone has(h) / get(h) -> bytes|None / put(h, data).
+# ─────────────────────────────────────────────────────────────────────────────
+
+class LocalDiskBackend:
+    """Blob come file binari in <root>/<h[:2]>/<h>."""
+
+    def __init__(self, root=BLOB_DIR):
+        self.root = Path(root)
+
+    def _path(self, h):
+        return self.root / h[:2] / h
+
+    def has(self, h):
+        return self._path(h).exists()
+
+    def get(self, h):
+        p = self._path(h)
+        try:
+            return p.read_bytes()
+        except OSError:
+            return None
+
+    def put(self, h, data):
+        p = self._path(h)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, p)   # scrittura atomica: mai un blob troncato
+
+
+class SheetBlobBackend:
+    """Blob come righe blob:<hash> (base64, chunkate) nel foglio condiviso."""
+
+    def _sheet(self):
+        from data_manager import _storage_sheet
+        return _storage_sheet()
+
+    def has(self, h):
+        return bool(self._raw(h))
+
+    def _raw(self, h):
+        sheet = self._sheet()
+        if sheet is None:
+            return ""
+        from data_manager import _sheet_get
+        return _sheet_get(sheet, REF_PREFIX + h)
+
+    def get(self, h):
+        raw = self._raw(h)
+        return base64.b64decode(raw) if raw else None
+
+    def put(self, h, data):
+        sheet = self._sheet()
+        if sheet is None:
+            return
+        from data_manager import _enqueue_write
+        _enqueue_write(sheet, {REF_PREFIX + h: base64.b64encode(data).decode()})
+
+
+_local = LocalDiskBackend()
+_remote = SheetBlobBackend()
+_lock = threading.Lock()
+_ref_memo = {}    # {b64: ref}  evita di ridecodificare/rihashare a ogni save
+_b64_memo = {}    # {hash: b64} evita di rileggere il disco a ogni load
+
+
+def set_remote_backend(backend):
+    """Sostituisce il backend remoto (None = solo disco locale)."""
+    global _remote
+    _remote = backend
+
+
+def _memo_put(memo, k, v):
+    with _lock:
+        if len(memo) >= _MEMO_MAX:
+            memo.clear()
+        memo[k] = v
+
+
+# ─── API ──────────────────────────────────────────────────────────────────────
+
+def is_ref(value):
+    return isinstance(value, str) and value.startswith(REF_PREFIX)
+
+
+def put_b64(b64):
+    """
+    Archivia un'immagine base64 e ritorna il riferimento "blob:<hash>".
+    Valori vuoti, già riferimenti o non base64 validi vengono restituiti invariati.
+    """
+    if not b64 or not isinstance(b64, str) or is_ref(b64):
+        return b64
+    ref = _ref_memo.get(b64)
+    if ref:
+        return ref
+    try:
+        data = base64.b64decode(b64, validate=True)
+    except (binascii.Error, ValueError):
+        return b64
+    h = hashlib.sha256(data).hexdigest()
+    if not _local.has(h):
+        try:
+            _local.put(h, data)
+        except OSError:
+            pass   # disco non scrivibile (es. cloud read-only): resta il remoto
+    if _remote is not None and not _remote.has(h):
+        _remote.put(h, data)
+    ref = REF_PREFIX + h
+    _memo_put(_ref_memo, b64, ref)
+    _memo_put(_b64_memo, h, b64)
+    return ref
+
+
+def get_b64(value):
+    """
+    Risolve un riferimento "blob:<hash>" nel base64 dell'immagine.
+    Valori che non sono riferimenti (righe legacy con il base64 inline) passano invariati.
+    Ritorna None se il blob non è disponibile in nessun backend.
+    """
+    if not is_ref(value):
+        return value
+    h = value[len(REF_PREFIX):]
+    b64 = _b64_memo.get(h)
+    if b64:
+        return b64
+    data = _local.get(h)
+    if data is None and _remote is not None:
+        data = _remote.get(h)
+        if data is not None:
+            try:
+                _local.put(h, data)
+            except OSError:
+                pass
+    if data is None:
+        return None
+    b64 = base64.b64encode(data).decode()
+    _memo_put(_b64_memo, h, b64)
+    _memo_put(_ref_memo, b64, value)
+    return b64
@@ -0,0 +1,410 @@
+"""
+calendario.py — Pianificazione di campi e orari del torneo
+Modello a vincoli risolto con list scheduling a priorità:
+  - campi:        un campo gioca una partita alla volta (con gironi == campi
+                  ogni girone resta sul suo campo, come prima)
+  - squadre:      una squadra non gioca due partite insieme e tra due partite
+                  riposa almeno torneo["riposo_minuti"]
+  - precedenze:   il primo turno playoff dopo la fine dei gironi, ogni partita
+                  successiva dopo le due partite da cui arrivano le sue squadre
+                  (non dopo tutto il turno), le finali dopo le semifinali
+  - confermate:   restano dove e quando sono state giocate (orari reali
+                  registrati alla conferma) e occupano il campo; il resto della
+                  giornata viene riproiettato da lì e mai prima di adesso
+
+Le partite playoff non ancora generate sono nodi "virtuali": servono solo a
+prevedere la fine della giornata e a dare priorità al cammino critico. La
+priorità di una partita è la durata del cammino più lungo da lei alla fine del
+torneo: così si minimizza la durata totale. A ogni passo il campo che si libera
+per primo prende la partita pronta con priorità più alta (gironi in ordine di
+giornata all'italiana). Costo O(partite × partite pronte): 128 squadre su 8
+campi in pochi centesimi di secondo.
+
+Il grafo (Piano) si tiene tra una chiamata e l'altra finché il torneo non
+cambia forma: una conferma fissa la sua partita in O(1) e la riproiezione
+lavora solo sulle partite rimanenti.
+"""
+import bisect
+import threading
+from collections import ChainMap
+
+RIPOSO_MINUTI = 10
+
+# Tipi di nodo
+_PARTITA, _VIRTUALE, _BARRIERA = "partita", "virtuale", "barriera"
+
+
+def riposo_minuti(state):
+    return max(0, int(state.get("torneo", {}).get("riposo_minuti", RIPOSO_MINUTI)))
+
+
+def giornate_round_robin(squadre):
+    """{frozenset(sq1, sq2): giornata} del calendario all'italiana (metodo del cerchio)."""
+    n = len(squadre) + len(squadre) % 2
+    giornata = {}
+    for i, a in enumerate(squadre):
+        for j in range(i + 1, len(squadre)):
+            if j == n - 1:
+                g = (2 * i) % (n - 1)
+            else:
+                g = (i + j) % (n - 1)
+            giornata[frozenset((a, squadre[j]))] = g
+    return giornata
+
+
+def ordine_tabellone(partite):
+    """Partite di un turno nell'ordine del tabellone (slot, o ordine di generazione)."""
+    return [p for _k, p in sorted(enumerate(partite), key=lambda x: (x[1].get("slot", x[0]), x[0]))]
+
+
+def per_slot(partite):
+    """{slot: partita} di un turno (le partite del primo turno non hanno slot: conta l'ordine)."""
+    return {p.get("slot", k): p for k, p in enumerate(partite)}
+
+
+def incroci_pronti(partite):
+    """
+    [(k, prima, seconda)] delle partite del turno successivo che si possono
+    generare: la k mette di fronte i vincitori degli slot 2k e 2k+1, solo se
+    esistono entrambi e sono conclusi (i turni si completano in qualsiasi ordine).
+    """
+    slot = per_slot(partite)
+    pronti = []
+    for k in range((max(slot, default=-1) + 2) // 2):
+        prima, seconda = slot.get(2 * k), slot.get(2 * k + 1)
+        if prima and seconda and prima.get("vincitore") and seconda.get("vincitore"):
+            pronti.append((k, prima, seconda))
+    return pronti
+
+
+# ─── COSTRUZIONE DEL GRAFO ────────────────────────────────────────────────────
+
+def costruisci_nodi(state, durata):
+    """
+    Nodi da pianificare per lo state: partite reali, partite playoff virtuali e
+    la barriera di fine gironi. durata(partita) → minuti.
+    """
+    torneo = state.get("torneo", {})
+    ghost = {sq["id"] for sq in state.get("squadre", []) if sq.get("is_ghost")}
+    gironi = state.get("gironi", [])
+    num_campi = max(1, int(torneo.get("num_campi", 1)))
+    dedicato = 0 < len(gironi) == num_campi
+    nodi = []
+
+    def nodo(tipo, partita=None, durata_min=0, dopo=(), campo=None, ordine=()):
+        nodi.append({"tipo": tipo, "partita": partita, "durata": durata_min, "dopo": list(dopo),
+                     "campo": campo, "ordine": ordine})
+        return len(nodi) - 1
+
+    def da_giocare(p):
+        return not p.get("is_bye") and p.get("sq1") not in ghost and p.get("sq2") not in ghost
+
+    # Gironi
+    fine_gironi = []
+    for g_idx, g in enumerate(gironi):
+        giornata = giornate_round_robin(list(g.get("squadre", [])))
+        for k, p in enumerate(g.get("partite", [])):
+            if not da_giocare(p):
+                continue
+            gg = giornata.get(frozenset((p.get("sq1"), p.get("sq2"))), k)
+            fine_gironi.append(nodo(_PARTITA, p, durata(p), campo=g_idx if dedicato else None,
+                                    ordine=(0, gg, g_idx, k)))
+    barriera = nodo(_BARRIERA, dopo=fine_gironi)
+
+    if torneo.get("modalita") == "Girone Unico":
+        return nodi
+
+    # Playoff: turni reali in ordine di generazione, poi turni virtuali fino alle finali
+    bracket = state.get("bracket", [])
+    turni, nomi = {}, []
+    for p in bracket:
+        r = p.get("round", "Playoff")
+        if r not in turni:
+            turni[r] = []
+            nomi.append(r)
+        turni[r].append(p)
+    durata_tipo = durata({"fase": "eliminazione"})
+
+    def nodo_playoff(p, dopo, livello, k):
+        if p is None:
+            return nodo(_VIRTUALE, None, durata_tipo, dopo, ordine=(1, livello, k))
+        if p.get("is_bye") or not da_giocare(p):
+            return nodo(_BARRIERA, p, 0, dopo, ordine=(1, livello, k))
+        return nodo(_PARTITA, p, durata(p), dopo, ordine=(1, livello, k))
+
+    livello = []
+    if nomi:
+        primo = ordine_tabellone(turni[nomi[0]])
+        livello = [nodo_playoff(p, [barriera], 0, k) for k, p in enumerate(primo)]
+    else:
+        dimensione = int(torneo.get("bracket_size") or 0)
+        n_bye = int(torneo.get("n_bye_playoff") or 0)
+        for k in range(dimensione // 2):
+            if k < n_bye:
+                livello.append(nodo(_BARRIERA, None, 0, [barriera], ordine=(1, 0, k)))
+            else:
+                livello.append(nodo(_VIRTUALE, None, durata_tipo, [barriera], ordine=(1, 0, k)))
+
+    n_liv = 1
+    while len(livello) > 2:
+        reali = ordine_tabellone(turni[nomi[n_liv]]) if n_liv < len(nomi) else []
+        reali = per_slot(reali)
+        livello = [nodo_playoff(reali.get(k), livello[2 * k:2 * k + 2], n_liv, k)
+                   for k in range(len(livello) // 2)]
+        n_liv += 1
+
+    if len(livello) == 2:
+        extra = {p.get("round"): p for p in state.get("bracket_extra", [])}
+        for k, r in enumerate(("🏆 FINALE 1°/2° Posto", "🥉 Finale 3°/4° Posto")):
+            nodo_playoff(extra.get(r), livello, n_liv, k)
+    return nodi
+
+
+# ─── RISOLUZIONE ──────────────────────────────────────────────────────────────
+
+class Piano:
+    """
+    Grafo del calendario pronto da risolvere più volte. Si prepara una volta
+    (successori e priorità) e tiene gli effetti delle partite già giocate come
+    aggregati (campo libero da, squadra pronta da, rilascio dei successori):
+    fissa() costa O(successori) e risolvi() lavora solo sui nodi rimanenti.
+    """
+
+    def __init__(self, nodi, num_campi, riposo):
+        self.nodi = nodi
+        self.num_campi = num_campi
+        self.riposo = riposo
+        n = len(nodi)
+        self.seguenti = [[] for _ in range(n)]
+        self.mancanti = [0] * n
+        for i, nd in enumerate(nodi):
+            for d in nd["dopo"]:
+                self.seguenti[d].append(i)
+            self.mancanti[i] = len(nd["dopo"])
+        # Priorità: cammino più lungo fino alla fine (i nodi sono già in ordine topologico)
+        self.coda = [0.0] * n
+        for i in range(n - 1, -1, -1):
+            self.coda[i] = nodi[i]["durata"] + max((self.coda[s] for s in self.seguenti[i]), default=0.0)
+        self.fissi = {}
+        self.da_fare = set(range(n))
+        self.libero = [float("-inf")] * num_campi
+        self.pronte_squadra = {}
+        self.rilascio = [float("-inf")] * n
+
+    def fissa(self, i, campo, t0, fine):
+        """Segna il nodo i come giocato in (campo, t0, fine)."""
+        if i not in self.da_fare:
+            return
+        self.da_fare.discard(i)
+        self.fissi[i] = (campo, t0, fine)
+        if campo is not None and 0 <= campo < self.num_campi:
+            self.libero[campo] = max(self.libero[campo], fine)
+        p = self.nodi[i]["partita"]
+        for sq in (p.get("sq1"), p.get("sq2")):
+            self.pronte_squadra[sq] = max(self.pronte_squadra.get(sq, float("-inf")), fine + self.riposo)
+        for s in self.seguenti[i]:
+            self.rilascio[s] = max(self.rilascio[s], fine + self.riposo)
+            self.mancanti[s] -= 1
+
+    def risolvi(self, inizio=0.0):
+        """
+        {indice nodo: (campo o None, inizio, fine)} dei nodi rimanenti (più i
+        fissi, in sola lettura): nessuno parte prima di inizio.
+        """
+        nodi, coda, seguenti, riposo = self.nodi, self.coda, self.seguenti, self.riposo
+        libero = [max(inizio, t) for t in self.libero]
+        pronte_squadra = dict(self.pronte_squadra)
+        rilascio = {i: max(inizio, self.rilascio[i]) for i in self.da_fare}
+        mancanti = {i: self.mancanti[i] for i in self.da_fare}
+        esito = {}
+
+        # Code di nodi pronti: una per campo dedicato, una (None) per tutti i campi
+        code = {}
+        attese = []   # nodi senza campo pronti da chiudere
+
+        def rilascia(i):
+            if nodi[i]["tipo"] == _BARRIERA:
+                attese.append(i)
+                return
+            chiave = (-coda[i], nodi[i]["ordine"], i)
+            bisect.insort(code.setdefault(nodi[i]["campo"], []), chiave)
+
+        def completa(i, fine):
+            for s in seguenti[i]:
+                if s not in mancanti:
+                    continue
+                pausa = riposo if nodi[i]["tipo"] != _BARRIERA else 0
+                rilascio[s] = max(rilascio[s], fine + pausa)
+                mancanti[s] -= 1
+                if mancanti[s] == 0:
+                    rilascia(s)
+
+        for i in sorted(self.da_fare):
+            if mancanti[i] == 0:
+                rilascia(i)
+
+        def pronta(i):
+            p = nodi[i]["partita"]
+            t = rilascio[i]
+            if p is not None:
+                t = max(t, pronte_squadra.get(p.get("sq1"), inizio), pronte_squadra.get(p.get("sq2"), inizio))
+            return t
+
+        bloccati = set()
+        while True:
+            while attese:
+                # Una barriera finisce quando è rilasciata: il rilascio è già
+                # il massimo tra le fini delle partite da cui dipende
+                i = attese.pop()
+                esito[i] = (None, rilascio[i], rilascio[i])
+                completa(i, rilascio[i])
+            if not any(code.values()):
+                break
+            liberi = [c for c in range(self.num_campi) if c not in bloccati]
+            if not liberi:
+                break
+            c = min(liberi, key=lambda x: (libero[x], x))
+            t = libero[c]
+            scelta, scelta_t = None, None
+            for chiave_coda in (c, None):
+                for pos, (_p, _o, i) in enumerate(code.get(chiave_coda, [])):
+                    r = pronta(i)
+                    if r <= t:
+                        scelta, scelta_t = (chiave_coda, pos, i), t
+                        break
+                    if scelta_t is None or r < scelta_t:
+                        scelta, scelta_t = (chiave_coda, pos, i), r
+                if scelta_t is not None and scelta_t <= t:
+                    break
+            if scelta is None:
+                bloccati.add(c)   # niente da giocare su questo campo finché non si sblocca qualcosa
+                continue
+            chiave_coda, pos, i = scelta
+            code[chiave_coda].pop(pos)
+            inizio_i = max(t, scelta_t)
+            fine = inizio_i + nodi[i]["durata"]
+            esito[i] = (c, inizio_i, fine)
+            libero[c] = fine
+            p = nodi[i]["partita"]
+            if p is not None:
+                pronte_squadra[p.get("sq1")] = fine + riposo
+                pronte_squadra[p.get("sq2")] = fine + riposo
+            completa(i, fine)
+            bloccati.clear()
+        return ChainMap(esito, self.fissi)
+
+
+def pianifica(nodi, num_campi, riposo, inizio=0.0, fissi=None):
+    """
+    Risolve il calendario in un colpo solo. fissi = {indice nodo: (campo,
+    inizio, fine)} per le partite già giocate; nessuna partita da giocare
+    parte prima di inizio. Ritorna {indice nodo: (campo o None, inizio, fine)}
+    in minuti dall'inizio del torneo.
+    """
+    piano = Piano(nodi, num_campi, riposo)
+    for i, (campo, t0, fine) in (fissi or {}).items():
+        piano.fissa(i, campo, t0, fine)
+    return dict(piano.risolvi(inizio))
+
+
+# ─── APPLICAZIONE ALLO STATE ──────────────────────────────────────────────────
+
+def adesso():
+    """Timestamp da salvare in inizio_reale / fine_reale di una partita."""
+    from datetime import datetime
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _minuti(orario, base):
+    """Minuti da base per "HH:MM" (stesso giorno) o un timestamp ISO; None se illeggibile."""
+    from datetime import datetime
+    testo = str(orario or "")
+    if "T" in testo:
+        try:
+            return (datetime.fromisoformat(testo) - base).total_seconds() / 60
+        except ValueError:
+            return None
+    try:
+        h, m = map(int, testo.split(":"))
+    except ValueError:
+        return None
+    return (h * 60 + m) - (base.hour * 60 + base.minute)
+
+
+def _fisso(p, durata, base, num_campi):
+    """(campo, inizio, fine) di una partita confermata: orari reali se registrati, se no il piano."""
+    campo = p.get("campo")
+    campo = campo - 1 if isinstance(campo, int) and 1 <= campo <= num_campi else None
+    t_inizio, t_fine = _minuti(p.get("inizio_reale"), base), _minuti(p.get("fine_reale"), base)
+    if t_fine is not None:
+        if t_inizio is None or t_inizio > t_fine:
+            t_inizio = t_fine - durata
+        return campo, t_inizio, t_fine
+    t0 = _minuti(p.get("orario_schedulato"), base)
+    if t0 is not None and campo is not None:
+        return campo, t0, t0 + durata
+    return None, -durata, 0.0   # giocata senza orario: conta come già finita
+
+
+# Piano per state (le sessioni aperte sono pochi state): si riusa finché il
+# torneo ha le stesse liste di partite, cioè finché non ne vengono generate di nuove
+_PIANI_MAX = 4
+_piani = {}   # {id(state): (state, firma, piano)}
+_piani_lock = threading.Lock()
+
+
+def _firma(state):
+    """Cambia quando cambia la forma del grafo: partite aggiunte, liste rigenerate, impostazioni."""
+    torneo = state.get("torneo", {})
+    liste = [g.get("partite") for g in state.get("gironi", [])]
+    liste += [state.get("bracket"), state.get("bracket_extra")]
+    return (tuple((id(lista), len(lista)) if lista is not None else None for lista in liste),
+            len(state.get("squadre", [])),
+            max(1, int(torneo.get("num_campi", 1))), riposo_minuti(state), torneo.get("modalita"),
+            torneo.get("bracket_size"), torneo.get("n_bye_playoff"))
+
+
+def _piano(state, durata):
+    firma = _firma(state)
+    with _piani_lock:
+        voce = _piani.pop(id(state), None)
+        if voce is not None and voce[0] is state and voce[1] == firma:
+            _piani[id(state)] = voce
+            return voce[2]
+    piano = Piano(costruisci_nodi(state, durata), firma[2], firma[3])
+    with _piani_lock:
+        while len(_piani) >= _PIANI_MAX:
+            _piani.pop(next(iter(_piani)))
+        _piani[id(state)] = (state, firma, piano)
+    return piano
+
+
+def calcola(state, durata, base, ora=None):
+    """
+    Assegna campo e orario_schedulato alle partite da giocare dello state.
+    Le confermate restano fisse, con gli orari reali registrati alla conferma
+    (inizio_reale / fine_reale) se ci sono: le rimanenti vengono riproiettate
+    da lì, e nel giorno del torneo nessuna è prevista prima di ora. Ritorna
+    (nodi, esito), con le previsioni delle partite virtuali.
+
+    Il grafo e le priorità si costruiscono solo quando cambia la forma del
+    torneo (avvio, turni playoff generati): una conferma fissa la sua partita
+    nel piano esistente e si riproiettano solo le partite rimanenti.
+    """
+    from datetime import timedelta
+    piano = _piano(state, durata)
+    nodi = piano.nodi
+    for i in [i for i in piano.da_fare if nodi[i]["tipo"] == _PARTITA and nodi[i]["partita"].get("confermata")]:
+        piano.fissa(i, *_fisso(nodi[i]["partita"], nodi[i]["durata"], base, piano.num_campi))
+    minimo = 0.0
+    if ora is not None and ora.date() == base.date():
+        minimo = max(0.0, (ora - base).total_seconds() / 60)
+    esito = piano.risolvi(minimo)
+    for i in piano.da_fare:
+        p = nodi[i]["partita"]
+        if nodi[i]["tipo"] != _PARTITA or i not in esito:
+            continue
+        campo, inizio, _fine = esito[i]
+        p["campo"] = campo + 1
+        p["orario_schedulato"] = (base + timedelta(minutes=round(inizio))).strftime("%H:%M")
+    return nodi, esito
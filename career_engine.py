@@ -0,0 +1,339 @@
+"""
+career_engine.py — Motore statistiche carriera colonnare (pandas/NumPy)
+Appiattisce gli storico_posizioni di tutti gli atleti in un unico DataFrame
+(una riga per partecipazione a un torneo) e calcola con group-by vettoriali
+punti ranking, medaglie, win rate, quozienti e aggregati per stagione.
+Ranking materializzato, ricalcolo delle statistiche, trofei e classifica di
+fine torneo leggono tutti da qui: una sola formula per ogni numero mostrato.
+"""
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+ATTRIBUTI_FIFA = ("attacco", "difesa", "muro", "ricezione", "battuta", "alzata")
+_ATTRIBUTI_PARTECIPAZIONE = ("attacco", "difesa")   # almeno +1 per chi ha giocato
+_ATTRIBUTO_BASE = 40
+_ATTRIBUTO_MAX = 99
+_BOOST_MAX = 5
+_ATLETI_PER_PROCESSO = 2000   # sotto questa soglia il pool costa più di quanto fa risparmiare
+
+COLONNE = [
+    "atleta_id", "ordine", "torneo", "pos", "n_squadre",
+    "set_vinti", "set_persi", "punti_fatti", "punti_subiti",
+    "data", "luogo", "tipo_gioco",
+]
+_INTERE = ["ordine", "pos", "n_squadre", "set_vinti", "set_persi", "punti_fatti", "punti_subiti"]
+_SOMME = ["set_vinti", "set_persi", "punti_fatti", "punti_subiti", "punti_validi"]
+
+
+# ─── DATAFRAME STORICO ────────────────────────────────────────────────────────
+
+def storico_df(atleti, regole=None):
+    """
+    DataFrame con una riga per ogni voce di storico_posizioni degli atleti.
+    Le voci legacy (tuple) sono normalizzate con _parse_storico_entry.
+    punti_ranking: punti della voce (quelli salvati a fine torneo, oppure la
+    formula di regole per le voci che non li hanno); punti_validi: la parte
+    che conta nel totale secondo la regola di totale (vedi PUNTI RANKING).
+    """
+    from data_manager import _parse_storico_entry
+    righe = []
+    for a in atleti:
+        aid = a["id"]
+        for i, entry in enumerate(a["stats"].get("storico_posizioni", [])):
+            e = _parse_storico_entry(entry)
+            righe.append((
+                # Nome e data espliciti a None valgono "": sono chiavi dei semi (seme_voce)
+                aid, i, e.get("nome") or "", e.get("pos", 10), e.get("n_squadre", 10),
+                e.get("set_vinti", 0), e.get("set_persi", 0),
+                e.get("punti_fatti", 0), e.get("punti_subiti", 0),
+                e.get("data") or "", e.get("luogo", ""), e.get("tipo_gioco", ""),
+                e.get("punti_ranking"),
+            ))
+    df = pd.DataFrame.from_records(righe, columns=COLONNE + ["punti_salvati"])
+    df[_INTERE] = df[_INTERE].fillna(0).astype("int64")
+    df["stagione"] = pd.to_datetime(df["data"], errors="coerce").dt.year.astype("Int64")
+    regole = regole_punteggio(regole)
+    calcolati = punti_ranking(df["pos"].to_numpy(), df["n_squadre"].to_numpy(), regole["formula"])
+    salvati = pd.to_numeric(df.pop("punti_salvati"), errors="coerce")
+    df["punti_ranking"] = salvati.fillna(pd.Series(calcolati, index=df.index)).astype("int64")
+    df["punti_validi"] = _TOTALI[regole["totale"]](df, regole)
+    return df
+
+
+# ─── PUNTI RANKING ────────────────────────────────────────────────────────────
+# Pipeline unica dei punti ranking, in due passi:
+#   1. formula di piazzamento (pos, n_squadre) → punti della voce, calcolati una
+#      volta a fine torneo da trasferisci_al_ranking e salvati nella voce
+#   2. regola di totale: quali voci (e con che peso) formano rank_pts
+# Le regole della lega stanno in state["punteggio_ranking"]; cambiarle richiede
+# un ricalcolo (ricalcola_stats_da_storico), che riscrive i punti delle voci.
+# ─────────────────────────────────────────────────────────────────────────────
+
+PUNTEGGIO_DEFAULT = {
+    "formula": "lineare",     # chiave di FORMULE
+    "totale": "somma",        # chiave di _TOTALI
+    "migliori_n": 8,          # "migliori_n": voci contate per stagione
+    "emivita_giorni": 365,    # "decadimento": dopo quanti giorni una voce vale metà
+    "riferimento": None,      # "decadimento": data da cui si misura l'età (ultimo torneo chiuso)
+}
+
+# Tabella a fasce stile FIVB: (da posizione, punti); chi arriva oltre prende l'ultima fascia
+_TABELLA_FIVB = ((1, 100), (2, 90), (3, 80), (4, 70), (5, 60), (9, 45), (17, 30), (25, 20))
+_FIVB_SOGLIE = np.array([p for p, _ in _TABELLA_FIVB])
+_FIVB_PUNTI = np.array([v for _, v in _TABELLA_FIVB])
+
+
+def _lineare(pos, n_squadre):
+    # n_squadre × 10 al 1°, −10 per posizione, minimo 10
+    return np.maximum(10, n_squadre * 10 - (pos - 1) * 10)
+
+
+def _fivb(pos, n_squadre):
+    return _FIVB_PUNTI[np.searchsorted(_FIVB_SOGLIE, np.maximum(pos, 1), side="right") - 1]
+
+
+FORMULE = {
+    "lineare": _lineare,
+    "fivb":    _fivb,
+}
+ETICHETTE_FORMULE = {"lineare": "Lineare (n° squadre × 10)", "fivb": "Tabella a fasce stile FIVB"}
+
+
+def regole_punteggio(regole=None):
+    """PUNTEGGIO_DEFAULT completato con le regole indicate (dict o None)."""
+    return {**PUNTEGGIO_DEFAULT, **(regole or {})}
+
+
+def punti_ranking(pos, n_squadre, formula="lineare"):
+    """Punti ranking di uno o più piazzamenti con la formula indicata (vettoriale)."""
+    return FORMULE[formula](np.asarray(pos), np.asarray(n_squadre))
+
+
+def _totale_somma(df, regole):
+    return df["punti_ranking"]
+
+
+def _totale_decadimento(df, regole):
+    # Peso 0.5 ** (età / emivita); le voci senza data valgono per intero
+    date = pd.to_datetime(df["data"], errors="coerce")
+    rif = pd.to_datetime(regole.get("riferimento"), errors="coerce")
+    if pd.isna(rif):
+        rif = date.max()
+    eta = (rif - date).dt.days.clip(lower=0).fillna(0).to_numpy()
+    return df["punti_ranking"] * 0.5 ** (eta / max(regole["emivita_giorni"], 1))
+
+
+def _totale_migliori_n(df, regole):
+    # Solo le migliori N voci di ogni stagione (le voci senza data fanno stagione a sé)
+    stagione = df["stagione"].fillna(-1)
+    rango = df.groupby([df["atleta_id"], stagione], sort=False)["punti_ranking"].rank(
+        method="first", ascending=False)
+    return df["punti_ranking"].where(rango <= regole["migliori_n"], 0)
+
+
+_TOTALI = {
+    "somma":        _totale_somma,
+    "decadimento":  _totale_decadimento,
+    "migliori_n":   _totale_migliori_n,
+}
+ETICHETTE_TOTALI = {"somma": "Somma di tutti i tornei", "decadimento": "Decadimento con l'età del risultato",
+                    "migliori_n": "Migliori N per stagione"}
+TOTALI_NEL_TEMPO = {"decadimento"}   # regole che cambiano il totale di tutti a ogni torneo chiuso
+
+
+# ─── AGGREGATI ────────────────────────────────────────────────────────────────
+
+def _derivati(agg):
+    """Vittorie, sconfitte, podi, win rate e quozienti dai contatori (oro, tornei, set, punti)."""
+    agg["vittorie"] = agg["oro"]
+    agg["sconfitte"] = agg["tornei"] - agg["oro"]
+    agg["podi"] = agg["oro"] + agg["argento"] + agg["bronzo"]
+    set_giocati = (agg["set_vinti"] + agg["set_persi"]).clip(lower=1)
+    agg["win_rate"] = (agg["vittorie"] / agg["tornei"].clip(lower=1) * 100).round(1)
+    agg["quoziente_punti"] = (agg["punti_fatti"] / set_giocati).round(2)
+    agg["quoziente_set"] = (agg["set_vinti"] / agg["set_persi"].clip(lower=1)).round(2)
+    return agg
+
+
+def _medaglie(df):
+    return df.assign(oro=df["pos"].eq(1), argento=df["pos"].eq(2), bronzo=df["pos"].eq(3))
+
+
+def _aggrega(df, chiavi):
+    g = _medaglie(df).groupby(chiavi, sort=False)
+    agg = g[_SOMME + ["oro", "argento", "bronzo"]].sum()
+    agg["tornei"] = g.size()
+    agg = agg.rename(columns={"punti_validi": "rank_pts"})
+    agg["rank_pts"] = agg["rank_pts"].round().astype("int64")
+    return _derivati(agg)
+
+
+def aggregati_atleti(df):
+    """
+    Un record per atleta (indice atleta_id): rank_pts, oro, argento, bronzo, podi,
+    tornei, vittorie, sconfitte, set/punti e quozienti calcolati dallo storico.
+    """
+    return _aggrega(df, "atleta_id")
+
+
+def aggregati_stagione(df):
+    """Come aggregati_atleti ma per (atleta_id, stagione); voci senza data escluse."""
+    return _aggrega(df[df["stagione"].notna()], ["atleta_id", "stagione"])
+
+
+def per_id(frame):
+    """{indice: {colonna: valore}} con valori Python nativi (più rapido di to_dict)."""
+    colonne = {c: frame[c].tolist() for c in frame.columns}
+    return {k: {c: v[i] for c, v in colonne.items()} for i, k in enumerate(frame.index.tolist())}
+
+
+def aggregati_per_id(atleti, df=None, regole=None):
+    """aggregati_atleti come {atleta_id: {campo: valore}}, pronto per le viste."""
+    df = storico_df(atleti, regole) if df is None else df
+    return per_id(aggregati_atleti(df)) if not df.empty else {}
+
+
+def aggregati_progressivi(df):
+    """
+    Aggregati di carriera dopo ogni voce di storico (stesso ordine delle righe
+    di df): contatori cumulati dell'atleta fino alla voce compresa, con gli
+    stessi campi e quozienti di aggregati_atleti (senza rank_pts), più
+    atleta_id e data della voce. Servono a datare gli sblocchi dei trofei.
+    """
+    contatori = _SOMME[:-1] + ["oro", "argento", "bronzo"]
+    base = _medaglie(df)[["atleta_id"] + contatori].assign(tornei=1)
+    cum = base.groupby("atleta_id", sort=False).cumsum()
+    cum.insert(0, "atleta_id", df["atleta_id"])
+    cum["data"] = df["data"]
+    return _derivati(cum)
+
+
+def aggregati_da_contatori(stats):
+    """Aggregati di carriera (come aggregati_atleti) dai contatori salvati nelle stats di un atleta."""
+    riga = pd.DataFrame([{c: stats.get(c, 0) for c in ("tornei", "set_vinti", "set_persi",
+                                                       "punti_fatti", "punti_subiti")}])
+    riga["oro"] = stats.get("vittorie", 0)
+    # Argento e bronzo non sono salvati separatamente: conta solo che la somma dia i podi
+    riga["argento"] = stats.get("podi", 0) - riga["oro"]
+    riga["bronzo"] = 0
+    return per_id(_derivati(riga))[0]
+
+
+# ─── ATTRIBUTI FIFA ───────────────────────────────────────────────────────────
+# Gli incrementi casuali degli attributi sono estratti da un seme per voce
+# derivato da (seme lega, atleta, torneo, data, occorrenza): ogni voce ha
+# sempre gli stessi incrementi, qualunque sia l'ordine o il processo in cui
+# viene calcolata. Correggere un torneo cambia solo le voci di quel torneo,
+# e il ricalcolo da zero riproduce esattamente i valori assegnati a fine torneo.
+# ─────────────────────────────────────────────────────────────────────────────
+
+_MASCHERA = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def seme_voce(seme, atleta_id, torneo, data, occorrenza=0):
+    """
+    Seme a 64 bit di una voce di storico (occorrenza: n° di voci uguali già
+    presenti). torneo e data None valgono "", come nello storico_df.
+    """
+    chiave = f"{seme}|{atleta_id}|{torneo or ''}|{data or ''}|{int(occorrenza)}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(chiave, digest_size=8).digest(), "little")
+
+
+def _semi(df, seme):
+    occorrenza = df.groupby(["atleta_id", "torneo", "data"], sort=False, dropna=False).cumcount()
+    occorrenza = occorrenza.astype("int64").tolist()
+    return np.fromiter(
+        (seme_voce(seme, a, t, d, o) for a, t, d, o in
+         zip(df["atleta_id"].tolist(), df["torneo"].tolist(), df["data"].tolist(), occorrenza)),
+        dtype=np.uint64, count=len(df),
+    )
+
+
+def _estrai(semi, indice, massimo):
+    """Interi uniformi 0..massimo (inclusi), uno per seme: splitmix64 sul flusso indice."""
+    with np.errstate(over="ignore"):
+        x = (semi + np.uint64(0x9E3779B97F4A7C15) * np.uint64(indice + 1)) & _MASCHERA
+        x = ((x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)) & _MASCHERA
+        x = ((x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)) & _MASCHERA
+        x = x ^ (x >> np.uint64(31))
+    u = (x >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+    return np.floor(u * (np.asarray(massimo) + 1)).astype("int64")
+
+
+def boost_piazzamento(pos, n_squadre):
+    """Boost massimo per attributo: lineare da 5 (1°) a 0 (ultimo)."""
+    n = np.asarray(n_squadre)
+    n = np.where(n <= 1, 2, n)
+    frazione = (np.asarray(pos) - 1) / (n - 1)
+    return np.maximum(0, np.round(_BOOST_MAX * (1 - frazione))).astype("int64")
+
+
+def incrementi_voce(seme, boost):
+    """{attributo: incremento} di una singola voce (scalare, per trasferisci_al_ranking)."""
+    semi = np.array([seme], dtype=np.uint64)
+    return {
+        attr: int(_estrai(semi, i, max(boost, 1) if attr in _ATTRIBUTI_PARTECIPAZIONE else boost)[0])
+        for i, attr in enumerate(ATTRIBUTI_FIFA)
+    }
+
+
+def attributi_da_storico(df, rng=None, seme=None):
+    """
+    Attributi FIFA ricostruiti dallo storico: per ogni voce un incremento casuale
+    0..boost (boost lineare da 5 per il 1° a 0 per l'ultimo, minimo 1 su attacco
+    e difesa), sommati per atleta partendo da 40 e limitati a 99.
+    Con seme gli incrementi sono quelli deterministici di seme_voce, altrimenti
+    vengono da rng (default un generatore NumPy non seedato).
+    Ritorna un DataFrame indicizzato per atleta_id con una colonna per attributo.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=list(ATTRIBUTI_FIFA), dtype="int64")
+    boost = boost_piazzamento(df["pos"].to_numpy(), df["n_squadre"].to_numpy())
+    if seme is not None:
+        semi = _semi(df, seme)
+    else:
+        rng = rng if rng is not None else np.random.default_rng()
+    incrementi = {}
+    for i, attr in enumerate(ATTRIBUTI_FIFA):
+        b = np.maximum(boost, 1) if attr in _ATTRIBUTI_PARTECIPAZIONE else boost
+        incrementi[attr] = _estrai(semi, i, b) if seme is not None else rng.integers(0, b + 1)
+    # Gli incrementi sono >= 0: limitare la somma equivale a limitare a ogni passo
+    tot = pd.DataFrame(incrementi, index=df["atleta_id"]).groupby(level=0, sort=False).sum()
+    return (tot + _ATTRIBUTO_BASE).clip(upper=_ATTRIBUTO_MAX)
+
+
+# ─── RICALCOLO CARRIERE ───────────────────────────────────────────────────────
+
+def ricalcola_blocco(atleti, seme, regole=None):
+    """
+    Aggregati e attributi di un gruppo di atleti: ({id: aggregati}, {id: attributi}).
+    Funzione pura sui soli atleti passati, eseguibile in un processo separato.
+    """
+    df = storico_df(atleti, regole)
+    return aggregati_per_id(atleti, df), per_id(attributi_da_storico(df, seme=seme))
+
+
+def ricalcola_carriere(atleti, seme, processi=None, regole=None):
+    """
+    ricalcola_blocco su tutti gli atleti, diviso in blocchi su un pool di processi
+    (gli atleti sono indipendenti: il risultato non dipende dalla divisione).
+    processi None = automatico in base al numero di atleti, 1 = nel processo corrente.
+    """
+    if processi is None:
+        import os
+        processi = min(os.cpu_count() or 1, len(atleti) // _ATLETI_PER_PROCESSO)
+    if processi <= 1:
+        return ricalcola_blocco(atleti, seme, regole)
+    # Atleti in forma minima: al worker serve solo lo storico
+    leggeri = [{"id": a["id"], "stats": {"storico_posizioni": a["stats"].get("storico_posizioni", [])}}
+               for a in atleti]
+    blocchi = [leggeri[i::processi] for i in range(processi)]
+    agg, attributi = {}, {}
+    with ProcessPoolExecutor(max_workers=processi) as pool:
+        for a, t in pool.map(ricalcola_blocco, blocchi, [seme] * processi, [regole] * processi):
+            agg.update(a)
+            attributi.update(t)
+    return agg, attributi
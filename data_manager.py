@@ -1,14 +1,17 @@
 """
 data_manager.py — Gestione persistenza Google Sheets v6
 Nuovi atleti partono con overall 40 (bronzo_raro) anche senza tornei.
-Salvataggio automatico su Google Sheets invece di file JSON locale.
+Salvataggio automatico su Google Sheets con copia locale SQLite
+(storage_read_all / storage_get / storage_write / storage_delete_where).
 """
 import json, os, random
 import streamlit as st
+import blob_store
+import event_log
 from datetime import datetime
 from pathlib import Path
 
-DATA_FILE = "beach_volley_data.json"  # fallback locale se Sheets non disponibile
+DATA_FILE = "beach_volley_data.json"  # vecchio fallback locale, letto solo per migrazione
 
 SHEET_ID = "180VldT6RUNEYAo-N4EVkJouzChFTGcdJe5c8RazFUEg"
 SCOPES = [
@@ -52,6 +55,10 @@ def empty_state():
         "ranking_globale": [], "vincitore": None,
         "simulazione_al_ranking": True,
         "podio": [],
+        # Seme della lega per gli incrementi attributi (career_engine.seme_voce)
+        "seme_lega": random.getrandbits(32),
+        # Regole punti ranking della lega (career_engine.PUNTEGGIO_DEFAULT per i mancanti)
+        "punteggio_ranking": {},
     }
 
 def _migrate(data):
@@ -67,6 +74,10 @@ def _migrate(data):
     if "squadre_per_girone_passano" not in t: t["squadre_per_girone_passano"] = 2
     if "sistema_qualificazione" not in t: t["sistema_qualificazione"] = "Prime classificate"
     if "modalita" not in t: t["modalita"] = "Gironi + Playoff"
+    for a in data.get("atleti", []):
+        _migra_trofei(a)
+        if "ranking_mesi" not in a.get("stats", {}):
+            _bucket_da_storico(a["stats"], regole_punteggio(data)["formula"])
     return data
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -74,41 +85,118 @@ def _migrate(data):
 # Il foglio Google Sheets ha due colonne: A=chiave, B=valore
 # Ogni dato occupa una riga propria → nessuna cella supera mai 50k caratteri
 # Struttura righe:
-#   main_data          → dati torneo beach volley (senza immagini)
+#   main_data          → manifest torneo: campi generali + elenco chiavi entità
+#   atleta:<id>        → un atleta (senza foto)
+#   squadra:<id>       → una squadra
+#   partita:<id>       → una partita (gironi, bracket, bracket_extra)
+#   girone:<n>         → un girone (nome, squadre, chiavi partite)
 #   incassi            → dati incassi
 #   cover:<tid>        → copertina torneo (una riga per torneo)
-#   foto_atleta:<aid>  → foto atleta (una riga per atleta)
+#   foto_atleta:<aid>  → foto atleta (una riga per atleta, riferimento blob)
+#   blob:<hash>        → contenuto di un'immagine (vedi blob_store.py)
+#   evento:<id>        → evento del registro append-only (vedi event_log.py)
+#   archivio:<tid>     → torneo concluso, record immutabile (vedi archivio_tornei.py)
+#   archivio_idx:<tid> → voce d'indice del torneo archiviato
 #   rivals_data        → dati giocatore Rivals
 #   cards_db_meta      → carte Rivals senza foto
 #   foto_card:<id>     → foto di una carta Rivals (una riga per carta)
 #   draft_db_meta      → carte Draft/Limited senza foto
 # ─────────────────────────────────────────────────────────────────────────────
 
+import base64 as _base64
 import copy as _copy
+import hashlib as _hashlib
+import lzma as _lzma
+import threading as _threading
+import time as _time
+import zlib as _zlib
+
+# ─── CODEC VALORI ─────────────────────────────────────────────────────────────
+# Verso il foglio i valori lunghi (storico atleti, carte, utenti, rivals_data)
+# viaggiano compressi: zlib (o lzma) + base85, con un marcatore di formato in
+# testa al valore. Il JSON si riduce di 5-8 volte: meno celle chunkate e meno
+# byte in rete a ogni load/flush. _sheet_read_chunked riconosce il marcatore e
+# decomprime; i valori senza marcatore sono JSON semplice (righe legacy).
+# SQLite locale tiene il testo in chiaro (nessun limite di cella).
+# Codec: secrets [storage] codec = "zlib" (default) | "lzma" | "nessuno",
+# oppure variabile d'ambiente MBT_CODEC.
+# ─────────────────────────────────────────────────────────────────────────────
 
-def _sheet_read_all(sheet):
-    """Legge tutte le righe e ritorna un dict {chiave: valore}."""
-    try:
-        rows = sheet.get_all_values()
-        result = {}
-        for row in rows:
-            if len(row) >= 2 and row[0] and row[1]:
-                result[row[0]] = row[1]
-        return result
-    except Exception:
-        return {}
+_CODEC_MIN = 1024            # sotto questa lunghezza il valore resta in chiaro
+_CODEC = {
+    "zlib": ("<zlib85>", lambda b: _zlib.compress(b, 9), _zlib.decompress),
+    "lzma": ("<lzma85>", _lzma.compress, _lzma.decompress),
+}
 
 
-def _sheet_write(sheet, updates: dict):
-    """
-    Scrive un dict {chiave: valore} nel foglio.
-    Chunka automaticamente qualsiasi valore > _CELL_LIMIT caratteri.
-    Aggiorna righe esistenti, aggiunge quelle nuove.
-    """
-    if not updates:
-        return
+def _codec_mode():
+    mode = os.environ.get("MBT_CODEC")
+    if not mode:
+        try:
+            mode = st.secrets["storage"]["codec"]
+        except Exception:
+            mode = "zlib"
+    return str(mode).lower()
+
+
+def _codifica(value: str) -> str:
+    """Comprime un valore lungo col codec attivo; se non conviene lo lascia invariato."""
+    codec = _CODEC.get(_codec_mode())
+    # "<..." = già codificato o header chunk
+    if codec is None or len(value) < _CODEC_MIN or value.startswith("<"):
+        return value
+    marcatore, comprimi, _ = codec
+    out = marcatore + _base64.b85encode(comprimi(value.encode("utf-8"))).decode("ascii")
+    return out if len(out) < len(value) * 0.9 else value
+
+
+def _decodifica(value: str) -> str:
+    """Inverso di _codifica (qualunque codec); i valori senza marcatore passano invariati."""
+    if value.startswith("<"):
+        for marcatore, _, decomprimi in _CODEC.values():
+            if value.startswith(marcatore):
+                return decomprimi(_base64.b85decode(value[len(marcatore):])).decode("utf-8")
+    return value
+
+
+# ─── DIRTY TRACKING ───────────────────────────────────────────────────────────
+# Per ogni riga del foglio teniamo l'hash del contenuto come risultava
+# dall'ultimo load/save riuscito. _sheet_write invia solo le righe il cui hash
+# è cambiato: un click che tocca un punteggio non ricarica più tutte le foto.
+# Il dict è condiviso tra le sessioni (il foglio è uno solo) → protetto da lock.
+# ─────────────────────────────────────────────────────────────────────────────
+
+_row_hashes = {}
+_row_hashes_lock = _threading.Lock()
 
-    # Espandi i valori troppo grandi in chunk prima di scrivere
+
+def _hash_val(value: str) -> str:
+    return _hashlib.blake2b(value.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _remember_rows(rows: dict):
+    """Registra gli hash delle righe appena lette o scritte con successo."""
+    hashes = {k: _hash_val(v) for k, v in rows.items()}
+    with _row_hashes_lock:
+        _row_hashes.update(hashes)
+
+
+def _forget_rows(keys):
+    """Dimentica gli hash di righe cancellate dal foglio."""
+    with _row_hashes_lock:
+        for k in keys:
+            _row_hashes.pop(k, None)
+
+
+def _dirty_rows(rows: dict) -> dict:
+    """Ritorna solo le righe il cui contenuto differisce dall'ultimo load/save."""
+    with _row_hashes_lock:
+        known = dict(_row_hashes)
+    return {k: v for k, v in rows.items() if known.get(k) != _hash_val(v)}
+
+
+def _expand_chunks(updates: dict) -> dict:
+    """Espande i valori > _CELL_LIMIT in righe <chiave>:c<i> con header <chunk:N>."""
     expanded = {}
     for key, value in updates.items():
         if not isinstance(value, str):
@@ -120,13 +208,145 @@ def _sheet_write(sheet, updates: dict):
             expanded[key] = f"<chunk:{len(chunks)}>"
             for ci, chunk in enumerate(chunks):
                 expanded[f"{key}:c{ci}"] = chunk
+    return expanded
+
+
+# ─── SNAPSHOT CONDIVISO DEL FOGLIO ────────────────────────────────────────────
+# Tutti i loader (state, Rivals, Draft, utenti, tema) leggono dalla stessa copia
+# in memoria del foglio, condivisa tra le sessioni del processo. Il download
+# completo avviene al massimo una volta ogni _SNAPSHOT_TTL secondi; le nostre
+# scritture aggiornano lo snapshot in place (write-through) così non serve
+# riscaricarlo dopo ogni save.
+# ─────────────────────────────────────────────────────────────────────────────
+
+_SNAPSHOT_TTL = 60           # secondi prima di riscaricare il foglio
+_snapshot = {"store": None, "ts": 0.0}
+_snapshot_lock = _threading.Lock()
+
+
+def _sheet_download(sheet):
+    """Scarica tutte le righe del foglio e ritorna un dict {chiave: valore}."""
+    rows = sheet.get_all_values()
+    result = {}
+    for row in rows:
+        if len(row) >= 2 and row[0] and row[1]:
+            result[row[0]] = row[1]
+    _remember_rows(result)
+    _index_rows(rows)
+    return result
+
+
+def _sheet_read_all(sheet):
+    """
+    Ritorna un dict {chiave: valore} con tutte le righe del foglio.
+    Legge dallo snapshot condiviso; lo riscarica solo se più vecchio di _SNAPSHOT_TTL.
+    """
+    try:
+        with _snapshot_lock:
+            if _snapshot["store"] is None or _time.time() - _snapshot["ts"] > _SNAPSHOT_TTL:
+                store = _sheet_download(sheet)
+                # Le scritture ancora in coda valgono più del contenuto del foglio
+                store.update(_pending_overlay())
+                _snapshot["store"] = store
+                _snapshot["ts"] = _time.time()
+            return dict(_snapshot["store"])
+    except Exception:
+        return {}
+
+
+def _snapshot_apply(rows: dict = None, deleted=()):
+    """Riporta nello snapshot le righe appena scritte o cancellate da noi."""
+    with _snapshot_lock:
+        store = _snapshot["store"]
+        if store is None:
+            return
+        if rows:
+            store.update(rows)
+        for k in deleted:
+            store.pop(k, None)
+
+
+def invalidate_sheet_snapshot():
+    """Forza il riscaricamento del foglio alla prossima lettura."""
+    with _snapshot_lock:
+        _snapshot["store"] = None
+
+
+# ─── INDICE CHIAVE → RIGA ─────────────────────────────────────────────────────
+# _sheet_write non riscarica più il foglio per sapere in che riga sta ogni
+# chiave: l'indice si costruisce dallo stesso get_all_values dello snapshot e
+# si tiene aggiornato su append e cancellazioni. Prima di sovrascrivere o
+# cancellare righe per numero (batch_update, deleteDimension) si rilegge la
+# sola colonna delle chiavi: se un'altra istanza, un'altra cancellazione o
+# una modifica a mano hanno spostato le righe, si scrive su quelle giuste.
+# ─────────────────────────────────────────────────────────────────────────────
+
+_row_index = {"rows": None, "last": 0}   # rows: {chiave: riga 1-based}, last: ultima riga usata
+_row_index_lock = _threading.Lock()
+
+
+def _index_rows(rows):
+    """Ricostruisce l'indice dall'output di get_all_values (o dalla colonna delle chiavi)."""
+    idx = {}
+    for i, row in enumerate(rows, start=1):
+        if row and row[0]:
+            idx[row[0]] = i
+    with _row_index_lock:
+        _row_index["rows"] = idx
+        _row_index["last"] = len(rows)
+
+
+def _get_row_index(sheet):
+    """Ritorna (copia dell'indice, ultima riga); lo carica dal foglio la prima volta."""
+    with _row_index_lock:
+        if _row_index["rows"] is not None:
+            return dict(_row_index["rows"]), _row_index["last"]
+    _index_rows(sheet.get_all_values())
+    with _row_index_lock:
+        return dict(_row_index["rows"]), _row_index["last"]
+
+
+def _verifica_row_index(sheet):
+    """Riallinea l'indice alla colonna A attuale del foglio (solo le chiavi, non i valori)."""
+    _index_rows([[k] for k in sheet.col_values(1)])
+    with _row_index_lock:
+        return dict(_row_index["rows"]), _row_index["last"]
+
+
+def _reset_row_index():
+    with _row_index_lock:
+        _row_index["rows"] = None
+
+
+def _appended_start_row(resp):
+    """Prima riga scritta da append_rows, letta da updates.updatedRange (es. 'Foglio1!A12:B14')."""
+    try:
+        rng = resp["updates"]["updatedRange"].split("!")[-1].split(":")[0]
+        return int("".join(c for c in rng if c.isdigit()))
+    except Exception:
+        return None
+
+
+def _sheet_write(sheet, updates: dict):
+    """
+    Scrive un dict {chiave: valore} nel foglio.
+    Chunka automaticamente qualsiasi valore > _CELL_LIMIT caratteri.
+    Invia solo le righe cambiate rispetto all'ultimo load/save (dirty tracking).
+    Aggiorna righe esistenti (posizione presa dall'indice chiave → riga),
+    aggiunge quelle nuove.
+    Ritorna True se è stata scritta almeno una riga.
+    """
+    if not updates:
+        return False
+
+    # Espandi i valori troppo grandi in chunk, poi tieni solo le righe cambiate
+    expanded = _dirty_rows(_expand_chunks(updates))
+    if not expanded:
+        return False
 
     try:
-        rows = sheet.get_all_values()
-        key_to_row = {}
-        for i, row in enumerate(rows, start=1):
-            if row and row[0]:
-                key_to_row[row[0]] = i
+        # Le righe da aggiornare si indirizzano per numero: prima si verifica l'indice
+        key_to_row, _ = _verifica_row_index(sheet)
 
         to_update = []
         to_append = []
@@ -147,15 +367,208 @@ def _sheet_write(sheet, updates: dict):
             sheet.batch_update(cell_updates)
 
         if to_append:
-            sheet.append_rows(to_append, value_input_option="RAW")
+            resp = sheet.append_rows(to_append, value_input_option="RAW")
+            start = _appended_start_row(resp)
+            with _row_index_lock:
+                allineato = (_row_index["rows"] is not None
+                             and start == _row_index["last"] + 1)
+                if allineato:
+                    for i, (key, _v) in enumerate(to_append):
+                        _row_index["rows"][key] = start + i
+                    _row_index["last"] = start + len(to_append) - 1
+            if not allineato:
+                # Conflitto: il foglio è cambiato fuori da noi → riallinea l'indice
+                _index_rows(sheet.get_all_values())
+
+        _remember_rows(expanded)
+
+        # Chunk avanzati da una versione più lunga (o non compressa) dei valori riscritti
+        key_to_row, _ = _get_row_index(sheet)
+        orfani = _chunk_orfani(expanded, key_to_row)
+        if orfani:
+            _sheet_delete_keys(sheet, orfani, verifica=False)   # indice appena verificato
+        return True
 
     except Exception as e:
+        # Indice forse non più valido: alla prossima scrittura si ricarica dal foglio
+        _reset_row_index()
         raise e
 
 
+def _chunk_orfani(expanded: dict, key_to_row: dict) -> list:
+    """Righe <chiave>:c<i> nel foglio oltre il numero di chunk del nuovo valore di <chiave>."""
+    orfani = []
+    for key, value in expanded.items():
+        n = 0
+        if value.startswith("<chunk:"):
+            try:
+                n = int(value.split(":")[1].rstrip(">"))
+            except ValueError:
+                continue
+        while f"{key}:c{n}" in key_to_row:
+            orfani.append(f"{key}:c{n}")
+            n += 1
+    return orfani
+
+
+def _sheet_delete_keys(sheet, keys, verifica=True):
+    """
+    Cancella dal foglio le righe delle chiavi indicate con una sola richiesta
+    batch (intervalli contigui, dal basso verso l'alto) e aggiorna l'indice.
+    Le righe si prendono dalla colonna delle chiavi riletta ora (verifica=False
+    solo se l'indice è stato verificato nella stessa operazione).
+    Chiamare con _sheet_io_lock preso.
+    """
+    import bisect as _bisect
+    key_to_row, _ = _verifica_row_index(sheet) if verifica else _get_row_index(sheet)
+    keys = [k for k in keys if k in key_to_row]
+    if not keys:
+        return
+    rows = sorted({key_to_row[k] for k in keys}, reverse=True)
+    intervalli = []   # (prima, ultima) 1-based, in ordine decrescente
+    for r in rows:
+        if intervalli and intervalli[-1][0] == r + 1:
+            intervalli[-1] = (r, intervalli[-1][1])
+        else:
+            intervalli.append((r, r))
+    try:
+        sheet.spreadsheet.batch_update({"requests": [
+            {"deleteDimension": {"range": {
+                "sheetId": sheet.id, "dimension": "ROWS",
+                "startIndex": prima - 1, "endIndex": ultima,
+            }}}
+            for prima, ultima in intervalli
+        ]})
+    except Exception:
+        _reset_row_index()
+        raise
+
+    cancellate = set(rows)
+    ordinate = sorted(rows)
+    with _row_index_lock:
+        if _row_index["rows"] is not None:
+            _row_index["rows"] = {
+                k: r - _bisect.bisect_left(ordinate, r)
+                for k, r in _row_index["rows"].items() if r not in cancellate
+            }
+            _row_index["last"] -= len(cancellate)
+    _forget_rows(keys)
+    _snapshot_apply(deleted=keys)
+
+
+# ─── WRITE-BEHIND QUEUE ───────────────────────────────────────────────────────
+# I save non bloccano più il thread dello script: _enqueue_write mette le righe
+# in una coda che fonde le scritture ripetute sulla stessa chiave (vince
+# l'ultima) e un thread in background le invia al foglio ogni _FLUSH_INTERVAL
+# secondi, o subito se le righe pendenti superano _FLUSH_MAX_ROWS.
+# flush() svuota la coda in modo sincrono (chiusura torneo, registrazioni,
+# uscita del processo). Un flush fallito rimette le righe in coda senza
+# sovrascrivere valori più recenti arrivati nel frattempo → si ritenta.
+# ─────────────────────────────────────────────────────────────────────────────
+
+_FLUSH_INTERVAL = 1.5        # secondi tra un flush automatico e l'altro
+_FLUSH_MAX_ROWS = 40         # soglia righe pendenti che forza il flush
+_FLUSH_MAX_BACKOFF = 30.0    # attesa massima tra i tentativi dopo un errore
+
+_pending_rows = {}           # {chiave: valore} già chunkato, in attesa di flush
+_inflight_rows = {}          # batch in corso di scrittura (visibile ai lettori)
+_pending_sheet = None
+_pending_cond = _threading.Condition()
+_sheet_io_lock = _threading.Lock()   # serializza flush e cancellazioni righe
+_flush_worker = None
+
+
+def _enqueue_write(sheet, updates: dict):
+    """
+    Accoda {chiave: valore} per la scrittura in background.
+    Ritorna True se almeno una riga differisce da quanto già scritto o in coda.
+    """
+    global _pending_sheet
+    if sheet is None or not updates:
+        return False
+    expanded = _expand_chunks({k: _codifica(v if isinstance(v, str) else str(v))
+                               for k, v in updates.items()})
+    in_coda = _pending_overlay()
+    # Una riga già in coda si confronta col valore in coda, le altre con il foglio
+    changed = {k: v for k, v in expanded.items() if k in in_coda and in_coda[k] != v}
+    changed.update(_dirty_rows({k: v for k, v in expanded.items() if k not in in_coda}))
+    if not changed:
+        return False
+    _snapshot_apply(changed)
+    with _pending_cond:
+        _pending_sheet = sheet
+        _pending_rows.update(changed)
+        _start_flush_worker()
+        if len(_pending_rows) >= _FLUSH_MAX_ROWS:
+            _pending_cond.notify_all()
+    return True
+
+
+def _start_flush_worker():
+    """Avvia (una sola volta per processo) il thread di flush. Chiamare col lock preso."""
+    global _flush_worker
+    if _flush_worker is not None and _flush_worker.is_alive():
+        return
+    _flush_worker = _threading.Thread(target=_flush_loop, name="sheet-flush", daemon=True)
+    _flush_worker.start()
+
+
+def _flush_loop():
+    attesa = _FLUSH_INTERVAL
+    while True:
+        with _pending_cond:
+            _pending_cond.wait(timeout=attesa)
+            if not _pending_rows:
+                attesa = _FLUSH_INTERVAL
+                continue
+        if flush():
+            attesa = _FLUSH_INTERVAL
+        else:
+            attesa = min(_FLUSH_MAX_BACKOFF, attesa * 2)
+
+
+def flush():
+    """
+    Scrive subito sul foglio tutte le righe in coda.
+    Ritorna True se la coda è vuota al termine, False se il foglio ha dato errore
+    (le righe restano in coda e il worker ritenterà).
+    """
+    global _inflight_rows
+    with _sheet_io_lock:
+        with _pending_cond:
+            batch = dict(_pending_rows)
+            sheet = _pending_sheet
+            _pending_rows.clear()
+            _inflight_rows = batch
+        if not batch:
+            return True
+        try:
+            _sheet_write(sheet, batch)
+            return True
+        except Exception:
+            with _pending_cond:
+                # Non perdere mai l'ultimo valore: vince quello arrivato dopo
+                for k, v in batch.items():
+                    _pending_rows.setdefault(k, v)
+            return False
+        finally:
+            with _pending_cond:
+                _inflight_rows = {}
+
+
+def _pending_overlay() -> dict:
+    """Righe accodate o in scrittura: i lettori le vedono prima del flush."""
+    with _pending_cond:
+        return {**_inflight_rows, **_pending_rows}
+
+
+import atexit as _atexit
+_atexit.register(flush)
+
+
 def _sheet_read_chunked(store: dict, key: str) -> str:
     """
-    Legge una chiave dal foglio, riassemblando i chunk se necessario.
+    Legge una chiave dal foglio, riassemblando i chunk e decomprimendo se necessario.
     Usare al posto di store.get(key) per chiavi che potrebbero essere state chunkate.
     """
     val = store.get(key, "")
@@ -165,12 +578,131 @@ def _sheet_read_chunked(store: dict, key: str) -> str:
             val = "".join(store.get(f"{key}:c{i}", "") for i in range(n))
         except Exception:
             pass
-    return val
+    return _decodifica(val)
+
+
+def _sheet_get(sheet, key: str) -> str:
+    """Legge una sola chiave dallo snapshot condiviso, senza copiarlo tutto."""
+    with _snapshot_lock:
+        store = _snapshot["store"]
+    if store is None:
+        store = _sheet_read_all(sheet)
+    return _sheet_read_chunked(store, key)
+
+
+# ─── STORAGE: INTERFACCIA UNICA DI PERSISTENZA ────────────────────────────────
+# Tutti i moduli (state torneo, Rivals, Draft, utenti, incassi, tema) leggono e
+# scrivono righe chiave → valore stringa solo tramite queste funzioni.
+# Backend:
+#   - Google Sheets (remoto, condiviso tra i dispositivi) via coda write-behind
+#   - SQLite locale (storage_sqlite.py) aggiornato riga per riga a ogni save:
+#     sostituisce i vecchi backup JSON e basta da solo quando si lavora offline
+# Modalità: secrets [storage] backend = "sheets" (default) | "sqlite",
+# oppure variabile d'ambiente MBT_STORAGE. Senza credenziali Sheets → SQLite.
+# ─────────────────────────────────────────────────────────────────────────────
+
+_local_db_inst = None
+_local_db_lock = _threading.Lock()
+
+
+def _local_db():
+    """Store SQLite locale (uno per processo)."""
+    global _local_db_inst
+    with _local_db_lock:
+        if _local_db_inst is None:
+            from storage_sqlite import SqliteStore
+            _local_db_inst = SqliteStore()
+        return _local_db_inst
 
 
-def _save_local(state):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
+def _storage_mode():
+    mode = os.environ.get("MBT_STORAGE")
+    if not mode:
+        try:
+            mode = st.secrets["storage"]["backend"]
+        except Exception:
+            mode = "sheets"
+    return str(mode).lower()
+
+
+def _storage_sheet():
+    """Foglio remoto, oppure None in modalità solo SQLite o se Sheets non è disponibile."""
+    if _storage_mode() == "sqlite":
+        return None
+    return _get_gsheet()
+
+
+def storage_read_all() -> dict:
+    """Tutte le righe {chiave: valore}; i valori chunkati vanno letti con _sheet_read_chunked."""
+    sheet = _storage_sheet()
+    if sheet is not None:
+        store = _sheet_read_all(sheet)
+        if store:
+            return store
+    return _local_db().read_all()
+
+
+def storage_get(key: str) -> str:
+    """Valore di una chiave (chunk già riassemblati), "" se assente."""
+    sheet = _storage_sheet()
+    if sheet is not None:
+        val = _sheet_get(sheet, key)
+        if val:
+            return val
+    return _local_db().get(key) or ""
+
+
+def storage_write(updates: dict) -> bool:
+    """
+    Scrive {chiave: valore}: subito su SQLite (solo righe cambiate, in transazione),
+    in coda verso il foglio. Ritorna True se almeno una riga è cambiata.
+    """
+    if not updates:
+        return False
+    changed = _local_db().write(updates)
+    sheet = _storage_sheet()
+    if sheet is not None:
+        changed = _enqueue_write(sheet, updates) or changed
+    return changed
+
+
+def _is_chunk_of(key, match):
+    """True se key è una riga <base>:c<i> di una chiave base che soddisfa match."""
+    base, _, suffix = key.rpartition(":c")
+    return bool(base) and suffix.isdigit() and match(base)
+
+
+def storage_delete_where(match):
+    """Cancella le righe (e i loro chunk) la cui chiave soddisfa match(chiave)."""
+    db = _local_db()
+    db.delete([k for k in db.keys() if match(k)])
+    sheet = _storage_sheet()
+    if sheet is None:
+        return
+    def _da_cancellare(k):
+        return match(k) or _is_chunk_of(k, match)
+    # Le righe ancora in coda non vanno più scritte
+    with _pending_cond:
+        in_coda = [k for k in _pending_rows if _da_cancellare(k)]
+        for k in in_coda:
+            del _pending_rows[k]
+    _snapshot_apply(deleted=in_coda)
+    # Nel foglio le trova la colonna delle chiavi, senza scaricare i valori.
+    # Le cancellazioni spostano gli indici: niente flush concorrenti
+    with _sheet_io_lock:
+        try:
+            key_to_row, _ = _verifica_row_index(sheet)
+        except Exception:
+            return
+        chiavi = [k for k in key_to_row if _da_cancellare(k)]
+        if chiavi:
+            _sheet_delete_keys(sheet, chiavi, verifica=False)
+
+
+def storage_delete(keys):
+    keys = set(keys)
+    if keys:
+        storage_delete_where(lambda k: k in keys)
 
 
 # Limite sicuro per cella Google Sheets (max 50k, usiamo 40k per margine)
@@ -179,10 +711,11 @@ _CELL_LIMIT = 40000
 
 def _chunk_json(obj):
     """
-    Serializza obj in JSON. Se supera _CELL_LIMIT lo spezza in chunk numerati.
+    Serializza obj in JSON (compresso col codec attivo se lungo).
+    Se supera _CELL_LIMIT lo spezza in chunk numerati.
     Restituisce lista di stringhe: ["..."] oppure ["<chunk:3>", "parte1", "parte2", "parte3"]
     """
-    s = json.dumps(obj, ensure_ascii=False)
+    s = _codifica(json.dumps(obj, ensure_ascii=False))
     if len(s) <= _CELL_LIMIT:
         return [s]
     # Spezza in chunk
@@ -194,14 +727,14 @@ def _unchunk(parts):
     """
     Riassembla chunks. parts è la lista di valori letti dal foglio per una chiave.
     Se il primo valore inizia con <chunk:N> legge gli N valori successivi.
-    Altrimenti restituisce parts[0].
+    Altrimenti restituisce parts[0]. Il risultato è già decompresso.
     """
     if not parts:
         return None
     first = parts[0]
     if isinstance(first, str) and first.startswith("<chunk:"):
-        return "".join(parts[1:])
-    return first
+        return _decodifica("".join(parts[1:]))
+    return _decodifica(first) if isinstance(first, str) else first
 
 
 def _strip_images_state(state):
@@ -210,8 +743,10 @@ def _strip_images_state(state):
     - immagini (copertine tornei, foto atleti)
     - ogni torneo programmato → riga propria  (chiave: torneo_prog:<id>)
     Restituisce (state_light, extras) dove extras = {chiave: valore_stringa}
+    Copia solo i dict che modifica (niente deepcopy di tutto lo state):
+    il risultato serve solo per essere serializzato.
     """
-    s = _copy.deepcopy(state)
+    s = dict(state)
     extras = {}
 
     # Estrai ogni torneo programmato in una riga separata
@@ -219,40 +754,34 @@ def _strip_images_state(state):
     s["tornei_programmati"] = []          # svuota dal main_data
     for t in tornei:
         tid = t.get("id", "")
-        # Copertina → riga separata
+        # Copertina → blob store, nella riga resta solo il riferimento
         if t.get("copertina_b64"):
-            extras[f"cover:{tid}"] = t["copertina_b64"]
-            t["copertina_b64"] = None
-        # Torneo → riga separata (con chunking se necessario)
-        t_json = json.dumps(t, ensure_ascii=False)
-        if len(t_json) <= _CELL_LIMIT:
-            extras[f"torneo_prog:{tid}"] = t_json
-        else:
-            # Spezza: prima salva copertina già estratta, poi i chunk del torneo
-            chunks = [t_json[i:i+_CELL_LIMIT] for i in range(0, len(t_json), _CELL_LIMIT)]
-            extras[f"torneo_prog:{tid}"] = f"<chunk:{len(chunks)}>"
-            for ci, chunk in enumerate(chunks):
-                extras[f"torneo_prog:{tid}:c{ci}"] = chunk
+            extras[f"cover:{tid}"] = blob_store.put_b64(t["copertina_b64"])
+            t = dict(t, copertina_b64=None)
+        # Torneo → riga separata (il chunking lo fa _sheet_write)
+        extras[f"torneo_prog:{tid}"] = json.dumps(t, ensure_ascii=False)
 
-    # Foto atleti → righe separate (b64 + mime salvati insieme come JSON)
+    # Foto atleti → righe separate (riferimento blob + mime salvati insieme come JSON)
+    atleti_light = []
     for a in s.get("atleti", []):
         aid = a.get("id", "")
         if a.get("foto_b64"):
-            import json as _json
-            extras[f"foto_atleta:{aid}"] = _json.dumps({
-                "b64":  a["foto_b64"],
+            extras[f"foto_atleta:{aid}"] = json.dumps({
+                "b64":  blob_store.put_b64(a["foto_b64"]),
                 "mime": a.get("foto_mime", "image/jpeg")
             })
-            a["foto_b64"]  = None
-            a["foto_mime"] = None
+            a = dict(a, foto_b64=None, foto_mime=None)
+        atleti_light.append(a)
+    s["atleti"] = atleti_light
 
     return s, extras
 
 
-def _restore_images_state(state, store):
+def _restore_images_state(state, store, sync=None):
     """
     Ricostruisce il state completo a partire da state (senza tornei_programmati)
     e dal dict store (tutte le righe del foglio).
+    Se sync è un dict, vi registra versione e contenuto base delle righe lette.
     """
     # Ricostruisci tornei_programmati da righe torneo_prog:*
     tornei_ricostruiti = []
@@ -264,17 +793,16 @@ def _restore_images_state(state, store):
     ))
     for tid in tid_keys:
         base_key = f"torneo_prog:{tid}"
-        val = _sheet_read_chunked(store, base_key)
-        if val:
-            try:
-                t = json.loads(val)
+        try:
+            t = _leggi_riga(store, base_key, sync)
+            if isinstance(t, dict):
                 # Reinserisce copertina
                 cover_key = f"cover:{tid}"
                 if cover_key in store:
-                    t["copertina_b64"] = store[cover_key]
+                    t["copertina_b64"] = blob_store.get_b64(_leggi_riga(store, cover_key, sync))
                 tornei_ricostruiti.append(t)
-            except Exception:
-                pass
+        except Exception:
+            pass
     state["tornei_programmati"] = tornei_ricostruiti
 
     # Reinserisce foto atleti (con mime)
@@ -282,105 +810,305 @@ def _restore_images_state(state, store):
         aid = a.get("id", "")
         k = f"foto_atleta:{aid}"
         if k in store:
-            val = store[k]
-            try:
-                import json as _json
-                obj = _json.loads(val)
-                a["foto_b64"]  = obj.get("b64", val)
+            obj = _leggi_riga(store, k, sync)
+            if isinstance(obj, dict):
+                a["foto_b64"]  = blob_store.get_b64(obj.get("b64"))
                 a["foto_mime"] = obj.get("mime", "image/jpeg")
-            except Exception:
+            else:
                 # fallback: valore grezzo b64 senza mime
-                a["foto_b64"]  = val
+                a["foto_b64"]  = obj
                 a["foto_mime"] = "image/jpeg"
+
+    # Immagini di tornei e atleti già eliminati: lette nella base, il prossimo
+    # save le cancella (cover:/foto_atleta: sono in _FAMIGLIE_CANCELLABILI)
+    if sync is not None:
+        for k in store:
+            if k.startswith(("cover:", "foto_atleta:")) and k.count(":") == 1 and k not in sync:
+                _leggi_riga(store, k, sync)
     return state
 
 
-def load_state():
-    sheet = _get_gsheet()
-    if sheet is not None:
-        try:
-            store = _sheet_read_all(sheet)
-            val = _sheet_read_chunked(store, "main_data")
-            if val:
-                data = json.loads(val)
-                data = _restore_images_state(data, store)
-                return _migrate(data)
-        except Exception as e:
-            st.warning(f"⚠️ Errore lettura Sheets, uso file locale. ({e})")
+# ─── STATE A ENTITÀ ───────────────────────────────────────────────────────────
+# main_data non contiene più tutto il torneo: è un manifest con i campi generali
+# e l'elenco ordinato delle chiavi delle entità. Ogni atleta, squadra, partita e
+# girone sta in una riga propria → aggiornare un punteggio riscrive una sola
+# riga partita:<id>, non tutto lo storico degli atleti.
+# main_data senza "_formato" è il vecchio documento unico (letto per migrazione).
+# ─────────────────────────────────────────────────────────────────────────────
 
-    if Path(DATA_FILE).exists():
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return _migrate(data)
-    return empty_state()
+_STATE_FORMATO = 2
+_ENTITA_STATE = ("atleti", "squadre", "gironi", "bracket", "bracket_extra")
+
+
+def _split_state(s_light):
+    """Divide lo state (senza immagini) in {chiave riga: json} + manifest main_data."""
+    rows = {}
+    manifest = {k: v for k, v in s_light.items() if k not in _ENTITA_STATE}
+    manifest["_formato"] = _STATE_FORMATO
+
+    def _riga(prefisso, obj, fallback):
+        # Gli id partita sono casuali a 6 cifre: in caso di collisione la riga prende un suffisso
+        rid = str(obj.get("id") or fallback)
+        key, n = f"{prefisso}:{rid}", 1
+        while key in rows:
+            n += 1
+            key = f"{prefisso}:{rid}~{n}"
+        rows[key] = json.dumps(obj, ensure_ascii=False)
+        return key.split(":", 1)[1]
+
+    manifest["atleti"] = [_riga("atleta", a, i) for i, a in enumerate(s_light.get("atleti", []))]
+    manifest["squadre"] = [_riga("squadra", sq, i) for i, sq in enumerate(s_light.get("squadre", []))]
+    manifest["gironi"] = len(s_light.get("gironi", []))
+    for gi, g in enumerate(s_light.get("gironi", [])):
+        g_light = {k: v for k, v in g.items() if k != "partite"}
+        g_light["partite"] = [_riga("partita", p, f"g{gi}_{pi}") for pi, p in enumerate(g.get("partite", []))]
+        rows[f"girone:{gi}"] = json.dumps(g_light, ensure_ascii=False)
+    for campo in ("bracket", "bracket_extra"):
+        if campo in s_light:
+            manifest[campo] = [_riga("partita", p, f"{campo}_{pi}") for pi, p in enumerate(s_light[campo])]
+
+    rows["main_data"] = json.dumps(manifest, ensure_ascii=False)
+    return rows
+
+
+def _join_state(manifest, store, sync=None):
+    """Ricompone lo state dal manifest main_data e dalle righe entità."""
+    def _leggi(prefisso, rid):
+        obj = _leggi_riga(store, f"{prefisso}:{rid}", sync)
+        return obj if isinstance(obj, dict) else None
+
+    data = {k: v for k, v in manifest.items() if k != "_formato"}
+    data["atleti"] = [x for x in (_leggi("atleta", r) for r in manifest.get("atleti", [])) if x]
+    data["squadre"] = [x for x in (_leggi("squadra", r) for r in manifest.get("squadre", [])) if x]
+    gironi = []
+    for gi in range(manifest.get("gironi", 0)):
+        g = _leggi("girone", gi)
+        if g is None:
+            continue
+        g["partite"] = [x for x in (_leggi("partita", r) for r in g.get("partite", [])) if x]
+        gironi.append(g)
+    data["gironi"] = gironi
+    for campo in ("bracket", "bracket_extra"):
+        if campo in manifest:
+            data[campo] = [x for x in (_leggi("partita", r) for r in manifest[campo]) if x]
+    return data
 
 
-def save_state(state):
-    sheet = _get_gsheet()
-    if sheet is not None:
-        try:
-            s_light, extras = _strip_images_state(state)
+# ─── CONCORRENZA OTTIMISTICA ──────────────────────────────────────────────────
+# Tablet segnapunti, portatile admin e TV ospiti hanno ognuno la propria copia
+# dello state. Ogni riga JSON porta un numero di versione "_v"; ogni sessione
+# ricorda in state["_sync"] versione e contenuto base delle righe che ha letto.
+# Al save:
+#   - si scrivono solo le righe cambiate rispetto alla base della sessione
+#     (una riga non toccata non sovrascrive mai quella di un altro dispositivo)
+#   - compare-and-swap: se la versione nello storage è ancora quella base si
+#     scrive con versione+1, altrimenti merge a tre vie campo per campo con
+#     quanto salvato dall'altro dispositivo (es. due partite diverse confermate)
+#   - sui campi modificati da entrambi vince la versione già salvata e la
+#     sessione viene avvisata; dopo un merge lo state viene ricaricato
+# Il CAS è atomico rispetto allo storage del processo (snapshot del foglio +
+# SQLite), cioè rispetto a tutte le sessioni servite dalla stessa app.
+# ─────────────────────────────────────────────────────────────────────────────
+
+_VERSIONE = "_v"
+_FAMIGLIE_CANCELLABILI = ("atleta:", "squadra:", "partita:", "girone:", "torneo_prog:",
+                          "cover:", "foto_atleta:")
+_cas_lock = _threading.Lock()
+_MANCANTE = object()
 
-            # Chunking automatico di main_data se supera il limite cella
-            main_json = json.dumps(s_light, ensure_ascii=False)
-            updates = {}
-            if len(main_json) <= _CELL_LIMIT:
-                updates["main_data"] = main_json
+
+def _leggi_riga(store, key, sync=None):
+    """
+    Legge una riga: dict JSON senza "_v" oppure stringa grezza ("" se assente).
+    Se sync è un dict registra {key: (versione, contenuto base)}.
+    """
+    raw = _sheet_read_chunked(store, key)
+    if not raw:
+        return ""
+    versione, base, obj = _separa_versione(raw)
+    if sync is not None:
+        sync[key] = (versione, base)
+    return obj if obj is not None else raw
+
+
+def _separa_versione(raw):
+    """(versione, json senza versione, dict) per righe oggetto JSON; (0, raw, None) per le altre."""
+    if raw.startswith("{"):
+        try:
+            obj = json.loads(raw)
+        except Exception:
+            return 0, raw, None
+        if isinstance(obj, dict):
+            versione = obj.pop(_VERSIONE, 0)
+            return versione, json.dumps(obj, ensure_ascii=False), obj
+    return 0, raw, None
+
+
+def _con_versione(val, versione):
+    """Inserisce "_v" in testa a un oggetto JSON serializzato (le altre righe passano invariate)."""
+    if not val.startswith("{"):
+        return val
+    corpo = val[1:].lstrip()
+    sep = "" if corpo.startswith("}") else ", "
+    return f'{{"{_VERSIONE}": {versione}{sep}{corpo}'
+
+
+def _merge3(base, ours, theirs, percorso, conflitti):
+    """Merge a tre vie: tiene le modifiche non in conflitto di entrambi; sui conflitti vince theirs."""
+    if ours == theirs:
+        return ours
+    if ours == base:
+        return theirs
+    if theirs == base:
+        return ours
+    if isinstance(ours, dict) and isinstance(theirs, dict):
+        base_d = base if isinstance(base, dict) else {}
+        out = {}
+        for k in list(theirs) + [k for k in ours if k not in theirs]:
+            v = _merge3(base_d.get(k, _MANCANTE), ours.get(k, _MANCANTE),
+                        theirs.get(k, _MANCANTE), f"{percorso}.{k}", conflitti)
+            if v is not _MANCANTE:
+                out[k] = v
+        return out
+    if (isinstance(ours, list) and isinstance(theirs, list)
+            and all(isinstance(x, (str, int)) for x in ours + theirs)):
+        # Liste di chiavi (atleti, squadre, partite): aggiunte e rimozioni di entrambi
+        base_l = base if isinstance(base, list) else []
+        tolti = set(base_l) - set(ours)
+        out = [x for x in theirs if x not in tolti]
+        out += [x for x in ours if x not in set(base_l) and x not in set(out)]
+        return out
+    if percorso.endswith("." + event_log.MARCA):
+        # Marcatore del registro eventi: lo snapshot unito contiene gli eventi di entrambi
+        return max(ours or "", theirs or "") or None
+    if percorso == "main_data.ranking_globale":
+        # Tabella derivata dagli atleti: get_ranking riallinea da sé le righe superate
+        return theirs
+    if percorso == "main_data.seme_lega":
+        # Due migrazioni contemporanee: vale il seme già salvato
+        return theirs
+    conflitti.append(percorso.lstrip("."))
+    return theirs
+
+
+def _sync_da_storage():
+    """Base di sincronizzazione = contenuto attuale dello storage (state nuovo che sostituisce il torneo)."""
+    sync = {}
+    if storage_get("main_data"):
+        store = storage_read_all()
+        manifest = _leggi_riga(store, "main_data", sync)
+        if isinstance(manifest, dict) and manifest.get("_formato") == _STATE_FORMATO:
+            _restore_images_state(_join_state(manifest, store, sync), store, sync)
+    return sync
+
+
+def _scrivi_con_cas(rows, sync):
+    """
+    Scrive le righe cambiate rispetto alla base della sessione con compare-and-swap.
+    Ritorna (campi in conflitto, True se lo state va ricaricato).
+    """
+    conflitti, ricarica = [], False
+    da_scrivere = {}
+    with _cas_lock:
+        for key, val in rows.items():
+            v_base, base = sync.get(key, (None, None))
+            if val == base:
+                continue
+            raw = storage_get(key)
+            v_cur, cur, cur_obj = _separa_versione(raw) if raw else (0, None, None)
+            if cur is None or v_base is None or v_cur == v_base or cur == val:
+                # Nessuno ha scritto dopo la nostra lettura (o riga nuova): CAS riuscito
+                nuovo = val
+            elif cur_obj is not None and base.startswith("{"):
+                # Un altro dispositivo ha salvato questa riga: merge a tre vie
+                merged = _merge3(json.loads(base), json.loads(val), cur_obj, key, conflitti)
+                nuovo = json.dumps(merged, ensure_ascii=False)
+                ricarica = True
             else:
-                chunks = [main_json[i:i+_CELL_LIMIT]
-                          for i in range(0, len(main_json), _CELL_LIMIT)]
-                updates["main_data"] = f"<chunk:{len(chunks)}>"
-                for ci, chunk in enumerate(chunks):
-                    updates[f"main_data:c{ci}"] = chunk
+                # Riga non JSON (es. riferimento immagine) cambiata da entrambi: tiene la loro
+                conflitti.append(key)
+                nuovo = cur
+                ricarica = True
+            versione = max(v_cur, v_base or 0) + 1
+            da_scrivere[key] = _con_versione(nuovo, versione)
+            sync[key] = (versione, nuovo)
+
+        # Cancella solo righe che questa sessione aveva letto e poi rimosso:
+        # quelle create nel frattempo da altri dispositivi restano
+        cancellate = {k for k in sync if k.startswith(_FAMIGLIE_CANCELLABILI) and k not in rows}
+        storage_write(da_scrivere)
+        if cancellate:
+            storage_delete_where(lambda k: k in cancellate)
+            for k in cancellate:
+                sync.pop(k, None)
+    return conflitti, ricarica
 
-            updates.update(extras)
 
-            # Elimina righe orfane di tornei cancellati
-            _cleanup_deleted_tornei(sheet, state)
+def load_state():
+    try:
+        val = storage_get("main_data")
+        if val:
+            store = storage_read_all()
+            sync = {}
+            data = _leggi_riga(store, "main_data", sync)
+            if data.get("_formato") == _STATE_FORMATO:
+                data = _join_state(data, store, sync)
+            data = _restore_images_state(data, store, sync)
+            data = _migrate(data)
+            # Eventi registrati dopo lo snapshot (save perso, crash): si riapplicano
+            event_log.riapplica(data, "torneo", store)
+            data["_sync"] = sync
+            return data
+    except Exception as e:
+        st.warning(f"⚠️ Errore lettura dati, provo il vecchio file locale. ({e})")
 
-            _sheet_write(sheet, updates)
-            _save_local(state)
-            return
-        except Exception as e:
-            st.warning(f"⚠️ Errore salvataggio Sheets, salvo in locale. ({e})")
-    _save_local(state)
+    # Migrazione: vecchio backup JSON, salvato nello storage al primo save
+    if Path(DATA_FILE).exists():
+        with open(DATA_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return _migrate(data)
+    return empty_state()
 
 
-def _cleanup_deleted_tornei(sheet, state):
-    """Cancella dal foglio le righe torneo_prog:* di tornei non più presenti."""
+def save_state(state):
     try:
-        ids_attivi = {t.get("id","") for t in state.get("tornei_programmati", [])}
-        rows = sheet.get_all_values()
-        # Trova righe orfane (indice 0-based → riga foglio 1-based)
-        rows_to_delete = []
-        for i, row in enumerate(rows):
-            if not row or not row[0]:
-                continue
-            k = row[0]
-            if k.startswith("torneo_prog:"):
-                # Estrai tid: torneo_prog:<tid>  oppure  torneo_prog:<tid>:c0
-                parts = k.split(":")
-                tid = parts[1] if len(parts) >= 2 else ""
-                if tid and tid not in ids_attivi:
-                    rows_to_delete.append(i + 1)  # 1-based
-        # Elimina dal basso per non spostare indici
-        for row_num in sorted(rows_to_delete, reverse=True):
-            sheet.delete_rows(row_num)
-    except Exception:
-        pass  # Non bloccare il salvataggio per errori di pulizia
+        s_light, extras = _strip_images_state(state)
+        s_light.pop("_sync", None)
+
+        # Manifest main_data + una riga per entità; chunking e dirty tracking nello storage
+        updates = _split_state(s_light)
+        updates.update(extras)
+
+        # State senza base (nuovo torneo, vecchio file locale): sostituisce quello salvato
+        if "_sync" not in state:
+            state["_sync"] = _sync_da_storage()
+
+        conflitti, ricarica = _scrivi_con_cas(updates, state["_sync"])
+        if conflitti:
+            st.warning("⚠️ Alcune modifiche erano già state salvate da un altro dispositivo "
+                       f"e sono state mantenute: {', '.join(conflitti[:5])}")
+        if ricarica:
+            # Porta in questa sessione anche le modifiche degli altri dispositivi
+            fresco = load_state()
+            state.clear()
+            state.update(fresco)
+        event_log.compatta("torneo", state.get(event_log.MARCA))
+    except Exception as e:
+        st.warning(f"⚠️ Errore salvataggio dati. ({e})")
 
 
 # ─────────────────────────────────────────────────────────────────────────────
-# SCHEDULER CAMPI E ORARI  v2
-# Regola: se num_gironi == num_campi → ogni campo è dedicato a un girone.
-# Altrimenti distribuzione earliest-available su tutti i campi.
-# Fase eliminatoria: distribuzione round-robin sui campi disponibili.
+# SCHEDULER CAMPI E ORARI  v3
+# Il calendario è risolto da calendario.py: vincoli su campi, riposo minimo
+# delle squadre e precedenze tra partite playoff dipendenti, con priorità al
+# cammino critico. Se num_gironi == num_campi ogni girone resta sul suo campo.
+# Le durate delle partite vengono dal modello empirico di durate_partite.py.
 # ─────────────────────────────────────────────────────────────────────────────
 
 from datetime import datetime as _dt, timedelta as _td
 
 def _minuti_per_partita(formato_set):
-    """Durata stimata partita: 20 min a set."""
+    """Durata di riferimento: 20 min a set (prior di durate_partite, che la corregge con i dati)."""
     if formato_set == "Best of 3":  return 60
     if formato_set == "Best of 5":  return 100
     return 20  # Set Unico
@@ -397,93 +1125,103 @@ def _base_dt(data_str, orario_inizio):
 
 def calcola_schedule(state):
     """
-    Assegna campo e orario a tutte le partite del torneo.
+    Assegna campo e orario a tutte le partite del torneo (vedi calendario.py).
 
     GIRONI:
     - Se num_gironi == num_campi → ogni campo dedicato interamente a un girone.
-    - Altrimenti → distribuzione earliest-available su tutti i campi.
+    - Altrimenti → qualsiasi campo libero, in ordine di giornata all'italiana.
 
     ELIMINATORIE:
-    - Ogni round riparte dal primo slot libero, distribuito sui campi disponibili.
-    - Iniziano dopo la fine stimata della fase gironi.
+    - Il primo turno dopo la fine dei gironi; ogni partita successiva appena
+      finite le due partite da cui arrivano le sue squadre (+ riposo minimo).
+    - Le partite già confermate restano dove e quando sono state giocate
+      (orari reali se registrati alla conferma): il resto viene riproiettato
+      da lì, quindi va richiamata dopo ogni risultato.
     """
-    torneo        = state.get("torneo", {})
-    num_campi     = max(1, int(torneo.get("num_campi", 1)))
-    orario_inizio = torneo.get("orario_inizio", "09:00")
-    formato_set   = torneo.get("formato_set", "Set Unico")
-    data_str      = torneo.get("data", str(_dt.today().date()))
-    durata        = _minuti_per_partita(formato_set)
-    gironi        = state.get("gironi", [])
-    num_gironi    = len(gironi)
-
-    base = _base_dt(data_str, orario_inizio)
-
-    # ── cursori per campo: ogni campo ha il proprio orologio ─────────────────
-    # inizializzati tutti a base
-    cursori = [base] * num_campi
-
-    # ─── FASE GIRONI ──────────────────────────────────────────────────────────
-    girone_dedicato = (num_gironi > 0 and num_gironi == num_campi)
-
-    for g_idx, girone in enumerate(gironi):
-        partite = [p for p in girone.get("partite", []) if not p.get("is_bye")]
-
-        if girone_dedicato:
-            # Campo fisso = indice girone + 1
-            campo_n = g_idx + 1
-            for p in partite:
-                p["campo"] = campo_n
-                if not p.get("confermata"):
-                    p["orario_schedulato"] = cursori[campo_n - 1].strftime("%H:%M")
-                cursori[campo_n - 1] += _td(minutes=durata)
-        else:
-            # Earliest-available su tutti i campi
-            for p in partite:
-                campo_idx = cursori.index(min(cursori))
-                p["campo"] = campo_idx + 1
-                if not p.get("confermata"):
-                    p["orario_schedulato"] = cursori[campo_idx].strftime("%H:%M")
-                cursori[campo_idx] += _td(minutes=durata)
-
-    # ─── FASE ELIMINATORIA ────────────────────────────────────────────────────
-    # Tutti gli slot eliminatori partono dopo la fine stimata dei gironi
-    # (= il cursore più avanzato tra tutti i campi)
-    fine_gironi = max(cursori)
-    # Reset cursori per la fase eliminatoria, tutti a fine_gironi
-    cursori_playoff = [fine_gironi] * num_campi
-
-    # Raggruppa bracket per round per schedulare round dopo round
-    bracket_all = state.get("bracket", []) + state.get("bracket_extra", [])
-    rounds_order = []
-    rounds_map   = {}
-    for p in bracket_all:
-        r = p.get("round", "Playoff")
-        if r not in rounds_map:
-            rounds_map[r] = []
-            rounds_order.append(r)
-        rounds_map[r].append(p)
-
-    for rname in rounds_order:
-        partite_round = [p for p in rounds_map[rname] if not p.get("is_bye")]
-        # Ogni round: cursori reset al massimo dei cursori playoff correnti
-        # così le partite di un round non si sovrappongono al round precedente
-        inizio_round = max(cursori_playoff)
-        cursori_round = [inizio_round] * num_campi
-
-        for p in partite_round:
-            campo_idx = cursori_round.index(min(cursori_round))
-            p["campo"] = campo_idx + 1
-            if not p.get("confermata"):
-                p["orario_schedulato"] = cursori_round[campo_idx].strftime("%H:%M")
-            cursori_round[campo_idx] += _td(minutes=durata)
-
-        # Aggiorna cursori_playoff con la fine di questo round
-        for i in range(num_campi):
-            cursori_playoff[i] = cursori_round[i]
-
+    import calendario
+    import durate_partite
+    torneo   = state.get("torneo", {})
+    base     = _base_dt(torneo.get("data", str(_dt.today().date())), torneo.get("orario_inizio", "09:00"))
+    calendario.calcola(state, durate_partite.stimatore(state), base, ora=_dt.now())
     return state
 
 
+# ─── INDICE ENTITÀ ────────────────────────────────────────────────────────────
+# Lookup O(1) di atleti, squadre e partite per id. Un indice per state (le
+# sessioni aperte, es. admin e ospite, sono pochi state) con una mappa per tipo
+# di entità: id → (lista, posizione, oggetto). La mappa si costruisce una volta
+# e si riusa finché lo state ha le stesse liste: ogni risultato viene
+# verificato (stessa posizione, stesso oggetto, stesso id), e un id non
+# trovato ricade sulla scansione lineare che, se trova qualcosa, ricostruisce
+# la mappa. Così append, pop, scambi e liste rigenerate restano corretti
+# senza dover avvisare l'indice da ogni punto che le modifica.
+# ─────────────────────────────────────────────────────────────────────────────
+
+_STATI_MAX = 8    # state indicizzati in memoria (uno per sessione aperta)
+_indici = {}      # {id(state): (state, {tipo: (liste, {id: (lista, posizione, oggetto)})})}
+_indici_lock = _threading.Lock()
+
+
+def _mappe_state(state):
+    """Mappe per tipo dello state (LRU sugli state: quello usato va in fondo)."""
+    voce = _indici.pop(id(state), None)
+    if voce is None or voce[0] is not state:
+        voce = (state, {})
+        while len(_indici) >= _STATI_MAX:
+            _indici.pop(next(iter(_indici)))
+    _indici[id(state)] = voce
+    return voce[1]
+
+
+def _indicizza(state, tipo, liste):
+    mappa = {}
+    for lista in liste:
+        for i, x in enumerate(lista):
+            mappa.setdefault(x.get("id"), (lista, i, x))
+    with _indici_lock:
+        _mappe_state(state)[tipo] = (liste, mappa)
+    return mappa
+
+
+def _cerca_in(state, tipo, liste, eid):
+    with _indici_lock:
+        voce = _mappe_state(state).get(tipo)
+    stesse = (voce is not None and len(voce[0]) == len(liste)
+              and all(a is b for a, b in zip(voce[0], liste)))
+    mappa = voce[1] if stesse else _indicizza(state, tipo, liste)
+    hit = mappa.get(eid)
+    if hit is not None:
+        lista, i, x = hit
+        if i < len(lista) and lista[i] is x and x.get("id") == eid:
+            return x
+    # Lista cambiata dopo l'indicizzazione (o id assente): scansione e reindicizzazione
+    for lista in liste:
+        for x in lista:
+            if x.get("id") == eid:
+                _indicizza(state, tipo, liste)
+                return x
+    return None
+
+
+def _cerca(state, chiave, eid):
+    if eid is None:
+        return None
+    return _cerca_in(state, chiave, [state.get(chiave, [])], eid)
+
+
+def liste_partite(state):
+    """Le liste che contengono le partite del torneo: gironi, bracket, bracket_extra."""
+    return ([g.get("partite", []) for g in state.get("gironi", [])]
+            + [state.get("bracket", []), state.get("bracket_extra", [])])
+
+
+def get_partita_by_id(state, pid):
+    """Partita del torneo in corso (gironi, bracket o bracket_extra) per id, O(1)."""
+    if pid is None:
+        return None
+    return _cerca_in(state, "partite", liste_partite(state), pid)
+
+
 def new_atleta(nome, cognome=""):
     full_name = f"{nome} {cognome}".strip() if cognome else nome
     return {
@@ -491,12 +1229,19 @@ def new_atleta(nome, cognome=""):
         "nome": full_name,
         "nome_proprio": nome,
         "cognome": cognome,
+        "club": "",          # separazione dei club nei gironi (teste_di_serie.py)
         "foto_b64": None,
         "stats": {
             "tornei": 0, "vittorie": 0, "sconfitte": 0,
             "set_vinti": 0, "set_persi": 0,
             "punti_fatti": 0, "punti_subiti": 0,
+            "podi": 0,
             "storico_posizioni": [],
+            "trofei": {},        # {id trofeo: data di sblocco}
+            "ranking_mesi": {},  # {"AAAA-MM": bucket} per i ranking a finestra
+            "ranking_ultimi": [],  # ultime voci [pos, punti, set_vinti, set_persi]
+            "rating": {"elo": 1500.0, "partite": 0},   # vedi rating_engine.py
+            "rating_storico": [],
             # Attributi di partenza al minimo (overall ~40)
             "attacco": 40,
             "difesa": 40,
@@ -508,10 +1253,7 @@ def new_atleta(nome, cognome=""):
     }
 
 def get_atleta_by_id(state, aid):
-    for a in state["atleti"]:
-        if a["id"] == aid:
-            return a
-    return None
+    return _cerca(state, "atleti", aid)
 
 def new_squadra(nome, atleta_ids, quota_pagata=0.0, is_ghost=False):
     return {
@@ -524,10 +1266,7 @@ def new_squadra(nome, atleta_ids, quota_pagata=0.0, is_ghost=False):
     }
 
 def get_squadra_by_id(state, sid):
-    for s in state["squadre"]:
-        if s["id"] == sid:
-            return s
-    return None
+    return _cerca(state, "squadre", sid)
 
 def nome_squadra(state, sid):
     s = get_squadra_by_id(state, sid)
@@ -695,7 +1434,7 @@ def _calcola_posizioni_finali(state, podio):
     return posizioni, n_squadre
 
 
-def trasferisci_al_ranking(state, podio):
+def trasferisci_al_ranking(state, podio, rng=None):
     t = state["torneo"]
     nome_torneo = t.get("nome", "Torneo")
     meta_torneo = {
@@ -712,6 +1451,14 @@ def trasferisci_al_ranking(state, podio):
     # Calcola posizioni finali reali per tutte le squadre
     posizioni, n_squadre = _calcola_posizioni_finali(state, podio)
     meta_torneo["n_squadre"] = n_squadre
+    regole = regole_punteggio(state)
+
+    # Partite e squadre vanno nell'archivio prima che un nuovo torneo le azzeri
+    import archivio_tornei
+    try:
+        archivio_tornei.archivia(state, posizioni, n_squadre)
+    except Exception:
+        pass   # archivio non raggiungibile: il ranking si aggiorna comunque
 
     atleti_processati = set()
 
@@ -745,12 +1492,15 @@ def trasferisci_al_ranking(state, podio):
                 s["vittorie"]   += 1
             else:
                 s["sconfitte"]  += 1
+            if pos <= 3:
+                s["podi"] = s.get("podi", 0) + 1
 
             # Storico torneo
             s["storico_posizioni"].append({
                 "nome":          nome_torneo,
                 "pos":           pos,
                 "n_squadre":     n_squadre,
+                "punti_ranking": calcola_punti_ranking(pos, n_squadre, regole["formula"]),
                 "luogo":         meta_torneo["luogo"],
                 "data":          meta_torneo["data"],
                 "formato_set":   meta_torneo["formato_set"],
@@ -766,15 +1516,51 @@ def trasferisci_al_ranking(state, podio):
             })
 
             # Boost attributi FIFA proporzionale alla posizione (per TUTTI)
-            _aggiorna_attributi_fifa(atleta, pos, n_squadre)
+            seme = None
+            if rng is None:
+                import career_engine
+                voce = s["storico_posizioni"][-1]
+                chiave = (voce["nome"] or "", voce["data"] or "")
+                occorrenza = sum(1 for e in map(_parse_storico_entry, s["storico_posizioni"][:-1])
+                                 if (e.get("nome") or "", e.get("data") or "") == chiave)
+                seme = career_engine.seme_voce(state.get("seme_lega", 0), aid, voce["nome"], voce["data"], occorrenza)
+            _aggiorna_attributi_fifa(atleta, pos, n_squadre, rng, seme)
+
+            _aggiungi_a_bucket(s, s["storico_posizioni"][-1], regole["formula"])
+
+    # Gli aggregati di carriera sono cambiati: si valutano i trofei non ancora sbloccati
+    import career_engine
+    partecipanti = [get_atleta_by_id(state, aid) for aid in atleti_processati]
+    agg = career_engine.aggregati_per_id(partecipanti, regole=regole)
+    for atleta in partecipanti:
+        valuta_trofei(atleta, meta_torneo["data"], agg.get(atleta["id"], {}))
+
+    if regole["totale"] in career_engine.TOTALI_NEL_TEMPO:
+        # Il totale dipende dall'età dei risultati: cambia per tutti gli atleti
+        state.setdefault("punteggio_ranking", {})["riferimento"] = meta_torneo["data"]
+        aggiorna_ranking(state)
+    else:
+        # Solo le righe ranking dei partecipanti cambiano
+        aggiorna_ranking(state, atleti_processati, aggregati=agg)
 
-def _aggiorna_attributi_fifa(atleta, posizione, n_squadre=8):
+def _aggiorna_attributi_fifa(atleta, posizione, n_squadre=8, rng=None, seme=None):
     """
     Aggiorna attributi FIFA per tutti i partecipanti in proporzione al piazzamento.
     Formula: il 1° riceve il boost massimo, l'ultimo riceve +0.
     Boost va da 5 (1°) a 0 (ultimo), su scala lineare, minimo +1 per chi ha partecipato.
+    seme: seme della voce di storico (career_engine.seme_voce): incrementi
+    deterministici, identici a quelli di ricalcola_stats_da_storico.
+    rng: generatore casuale se non c'è seme (default il modulo random).
     """
     s = atleta["stats"]
+    if seme is not None:
+        import career_engine
+        boost = int(career_engine.boost_piazzamento(posizione, n_squadre))
+        for attr, inc in career_engine.incrementi_voce(seme, boost).items():
+            if attr in s:
+                s[attr] = min(99, s[attr] + inc)
+        return
+    rng = rng or random
     if n_squadre <= 1: n_squadre = 2
     # Scala lineare: pos=1 → boost_max, pos=n_squadre → 0
     boost_max = 5
@@ -788,57 +1574,317 @@ def _aggiorna_attributi_fifa(atleta, posizione, n_squadre=8):
         b = boost
         if b == 0 and attr in partecipazione_attrs:
             b = 1  # partecipazione minima
-        s[attr] = min(99, s[attr] + random.randint(0, b))
+        s[attr] = min(99, s[attr] + rng.randint(0, b))
 
-def ricalcola_stats_da_storico(state):
+def ricalcola_stats_da_storico(state, seme=None, processi=None):
     """
     Ricalcola da zero tutte le statistiche FIFA degli atleti
     a partire dallo storico_posizioni già salvato + dati partite squadre.
     Usare per correggere statistiche di tornei già conclusi.
     Azzera e ricostruisce: tornei, vittorie, sconfitte, set, punti, attributi.
+    Calcolo vettoriale su tutto lo storico (career_engine): stesse formule
+    di trasferisci_al_ranking / _aggiorna_attributi_fifa.
+    Deterministico: gli incrementi di ogni voce vengono dal seme della lega
+    (o da seme, se indicato), quindi ricalcolare due volte dà lo stesso
+    risultato e riproduce i valori assegnati a fine torneo. Gli atleti sono
+    indipendenti: con molti atleti il calcolo si divide su più processi.
     """
-    # Step 1: azzeramento completo stats di tutti gli atleti
-    for atleta in state.get("atleti", []):
+    import career_engine
+    atleti = state.get("atleti", [])
+    if seme is None:
+        seme = state.setdefault("seme_lega", random.getrandbits(32))
+    regole = regole_punteggio(state)
+    if regole["totale"] in career_engine.TOTALI_NEL_TEMPO and not regole["riferimento"]:
+        # Età misurata dall'ultimo torneo in storico, uguale per tutti gli atleti
+        date = [e.get("data") for a in atleti for e in a["stats"].get("storico_posizioni", [])
+                if isinstance(e, dict) and e.get("data")]
+        regole["riferimento"] = max(date, default=None)
+        state.setdefault("punteggio_ranking", {})["riferimento"] = regole["riferimento"]
+    _riscrivi_punti_storico(atleti, regole["formula"])
+    agg, attributi = career_engine.ricalcola_carriere(atleti, seme, processi, regole)
+    trofei = _trofei_da_storico(atleti)
+
+    for atleta in atleti:
         s = atleta["stats"]
-        s["tornei"]       = 0
-        s["vittorie"]     = 0
-        s["sconfitte"]    = 0
-        s["set_vinti"]    = 0
-        s["set_persi"]    = 0
-        s["punti_fatti"]  = 0
-        s["punti_subiti"] = 0
-        # Reset attributi al valore base 40
-        for attr in ["attacco","difesa","muro","ricezione","battuta","alzata"]:
-            s[attr] = 40
-
-    # Step 2: ricalcola da storico_posizioni
-    # Per ogni atleta con storico, ricalcola tornei/vit/sconf
-    # e riapplica i boost FIFA proporzionali
-    for atleta in state.get("atleti", []):
+        r = agg.get(atleta["id"], {})
+        for campo in ("tornei", "vittorie", "sconfitte", "set_vinti", "set_persi",
+                      "punti_fatti", "punti_subiti", "podi"):
+            s[campo] = int(r.get(campo, 0))
+        s["trofei"] = trofei[atleta["id"]]
+        _bucket_da_storico(s, regole["formula"])
+        attr = attributi.get(atleta["id"], {})
+        for a in career_engine.ATTRIBUTI_FIFA:
+            s[a] = int(attr.get(a, 40))
+
+    # Rating Elo: replay di tutte le partite archiviate (+ torneo in corso se non archiviato)
+    import archivio_tornei, rating_engine
+    partite = archivio_tornei.partite_rating()
+    if state.get("torneo", {}).get("archivio_id") != archivio_tornei.id_torneo(state):
+        partite += rating_engine.partite_da_state(state)
+    rating_engine.riclassifica(atleti, partite)
+
+    aggiorna_ranking(state, aggregati=agg)
+    return state
+
+
+def _riscrivi_punti_storico(atleti, formula):
+    """Ricalcola con la formula indicata i punti ranking salvati nelle voci di storico."""
+    import career_engine
+    voci = [e for a in atleti for e in a["stats"].get("storico_posizioni", []) if isinstance(e, dict)]
+    punti = career_engine.punti_ranking([e.get("pos", 10) for e in voci],
+                                        [e.get("n_squadre", 10) for e in voci], formula)
+    for e, p in zip(voci, punti.tolist()):
+        e["punti_ranking"] = p
+
+
+# ─── RANKING MATERIALIZZATO ───────────────────────────────────────────────────
+# state["ranking_globale"] è la tabella del ranking già calcolata e ordinata:
+# una riga per atleta con punti, medaglie, quozienti e overall. Le righe si
+# ricalcolano solo per gli atleti toccati da trasferisci_al_ranking e
+# ricalcola_stats_da_storico, non a ogni render. Ogni riga porta la firma
+# delle stats da cui è stata calcolata: get_ranking() ricalcola al volo solo
+# le righe mancanti o non più allineate (atleti nuovi, merge da un altro
+# dispositivo) senza riscorrere gli storici degli altri.
+# Lettori: get_ranking() → lista ordinata, indice_ranking() → {id: posizione}.
+# ─────────────────────────────────────────────────────────────────────────────
+
+_ATTRIBUTI_FIFA = ("attacco", "difesa", "muro", "ricezione", "battuta", "alzata")
+
+
+def regole_punteggio(state):
+    """Regole punti ranking della lega, completate con i default di career_engine."""
+    import career_engine
+    return career_engine.regole_punteggio(state.get("punteggio_ranking"))
+
+
+def calcola_punti_ranking(pos, n_squadre, formula="lineare"):
+    """Punti ranking di un piazzamento (career_engine.FORMULE)."""
+    import career_engine
+    return int(career_engine.punti_ranking(pos, n_squadre, formula))
+
+
+def punti_voce(entry, formula="lineare"):
+    """Punti ranking di una voce di storico: quelli salvati, o la formula per le voci legacy."""
+    e = _parse_storico_entry(entry)
+    if e.get("punti_ranking") is not None:
+        return e["punti_ranking"]
+    return calcola_punti_ranking(e.get("pos", 10), e.get("n_squadre", 10), formula)
+
+
+def _firma_ranking(atleta):
+    s = atleta["stats"]
+    return [s["tornei"], len(s["storico_posizioni"]), s["vittorie"], s["set_vinti"],
+            s["set_persi"], s["punti_fatti"], sum(s.get(a, 40) for a in _ATTRIBUTI_FIFA),
+            s.get("rating", {}).get("partite", 0)]
+
+
+def _righe_ranking(atleti, aggregati=None, regole=None):
+    """
+    Righe del ranking degli atleti indicati: punti e medaglie dal motore carriera
+    (aggregati già calcolati da career_engine.aggregati_per_id, se disponibili).
+    """
+    import career_engine
+    agg = career_engine.aggregati_per_id(atleti, regole=regole) if aggregati is None else aggregati
+    righe = {}
+    for atleta in atleti:
         s = atleta["stats"]
-        for entry in s.get("storico_posizioni", []):
-            e = _parse_storico_entry(entry)
-            pos       = e.get("pos", 10)
-            n_squadre = e.get("n_squadre", 10)
-            sv        = e.get("set_vinti", 0)
-            sp        = e.get("set_persi", 0)
-            pf        = e.get("punti_fatti", 0)
-            ps        = e.get("punti_subiti", 0)
+        r = agg.get(atleta["id"], {})
+        overall = calcola_overall_fifa(atleta)
+        righe[atleta["id"]] = {
+            "id": atleta["id"],
+            "tornei": s["tornei"], "vittorie": s["vittorie"], "sconfitte": s["sconfitte"],
+            "set_vinti": s["set_vinti"], "set_persi": s["set_persi"],
+            "punti_fatti": s["punti_fatti"], "punti_subiti": s["punti_subiti"],
+            "quoziente_punti": round(s["punti_fatti"] / max(s["set_vinti"] + s["set_persi"], 1), 2),
+            "quoziente_set": round(s["set_vinti"] / max(s["set_persi"], 1), 2),
+            "win_rate": round(s["vittorie"] / max(s["tornei"], 1) * 100, 1) if s["tornei"] > 0 else 0,
+            "rank_pts": r.get("rank_pts", 0), "oro": r.get("oro", 0),
+            "argento": r.get("argento", 0), "bronzo": r.get("bronzo", 0),
+            "overall": overall, "card_type": get_card_type(overall, s["tornei"], s["vittorie"]),
+            "elo": round(s.get("rating", {}).get("elo", 1500.0)),
+            "firma": _firma_ranking(atleta),
+        }
+    return righe
 
-            s["tornei"]       += 1
-            s["set_vinti"]    += sv
-            s["set_persi"]    += sp
-            s["punti_fatti"]  += pf
-            s["punti_subiti"] += ps
-            if pos == 1:
-                s["vittorie"]  += 1
-            else:
-                s["sconfitte"] += 1
 
-            # Ricalcola boost FIFA con la stessa formula proporzionale
-            _aggiorna_attributi_fifa(atleta, pos, n_squadre)
+def aggiorna_ranking(state, atleta_ids=None, aggregati=None):
+    """
+    Ricalcola le righe del ranking degli atleti indicati (None = tutti),
+    toglie quelle di atleti non più presenti e riordina la tabella.
+    """
+    atleti = {a["id"]: a for a in state.get("atleti", [])}
+    righe = {r["id"]: r for r in state.get("ranking_globale", [])
+             if isinstance(r, dict) and "firma" in r and r.get("id") in atleti}
+    ids = atleti if atleta_ids is None else atleta_ids
+    righe.update(_righe_ranking([atleti[aid] for aid in ids if aid in atleti], aggregati,
+                                regole_punteggio(state)))
+    # A parità vale l'ordine degli atleti nello state (come il vecchio sort stabile)
+    ordine = {aid: i for i, aid in enumerate(atleti)}
+    state["ranking_globale"] = sorted(righe.values(), key=lambda r: (
+        -r["rank_pts"], -r["oro"], -r["argento"], -r["win_rate"], ordine[r["id"]]))
+    return state["ranking_globale"]
+
 
-    return state
+_ranking_cache = {"tabella": None, "atleti": None, "lista": None, "indice": None}
+_ranking_cache_lock = _threading.Lock()
+
+
+def get_ranking(state):
+    """
+    Ranking globale ordinato: righe materializzate con in più "atleta", "nome"
+    e "storico" correnti. La lista è in cache finché tabella e atleti non cambiano.
+    """
+    tabella = state.get("ranking_globale") or []
+    atleti = state.get("atleti", [])
+    with _ranking_cache_lock:
+        c = dict(_ranking_cache)
+    chiave = [(a["id"], a["nome"], _firma_ranking(a)) for a in atleti]
+    if c["tabella"] is tabella and c["atleti"] == chiave:
+        return c["lista"]
+
+    per_id = {r.get("id"): r for r in tabella if isinstance(r, dict)}
+    da_rifare = [aid for aid, _nome, firma in chiave
+                 if aid not in per_id or per_id[aid].get("firma") != firma]
+    if da_rifare or len(per_id) != len(atleti):
+        tabella = aggiorna_ranking(state, da_rifare)
+
+    by_id = {a["id"]: a for a in atleti}
+    lista = []
+    for r in tabella:
+        a = by_id[r["id"]]
+        lista.append({**r, "atleta": a, "nome": a["nome"], "storico": a["stats"]["storico_posizioni"]})
+    indice = {r["id"]: i for i, r in enumerate(lista)}
+    with _ranking_cache_lock:
+        _ranking_cache.update(tabella=tabella, atleti=chiave, lista=lista, indice=indice)
+    return lista
+
+
+def indice_ranking(ranking):
+    """{id atleta: posizione 0-based} per una lista restituita da get_ranking."""
+    with _ranking_cache_lock:
+        if _ranking_cache["lista"] is ranking:
+            return _ranking_cache["indice"]
+    return {r["id"]: i for i, r in enumerate(ranking)}
+
+
+# ─── RANKING A FINESTRA ───────────────────────────────────────────────────────
+# Classifiche "ultimi 12 mesi", "stagione" e "ultimi N tornei" senza riscorrere
+# gli storici: ogni atleta tiene in stats un bucket per mese (punti, tornei,
+# medaglie, set) e le sue ultime _ULTIMI_MAX voci, aggiornati a fine torneo e
+# ricostruiti da ricalcola_stats_da_storico. Una finestra è la somma di al
+# massimo 12 bucket. I punti sono quelli salvati nelle voci, sommati senza la
+# regola di totale del ranking generale (la finestra è già la regola).
+# Le voci senza data contano solo negli "ultimi N tornei".
+# ─────────────────────────────────────────────────────────────────────────────
+
+_ULTIMI_MAX = 10
+FINESTRE_RANKING = {
+    "sempre":   "Sempre",
+    "12_mesi":  "Ultimi 12 mesi",
+    "stagione": "Stagione in corso",
+    "ultimi_n": f"Ultimi tornei (max {_ULTIMI_MAX})",
+}
+
+
+def _mese_voce(e):
+    data = str(e.get("data") or "")
+    return data[:7] if len(data) >= 7 and data[4] == "-" else None
+
+
+def _aggiungi_a_bucket(s, entry, formula="lineare"):
+    """Aggiunge una voce di storico ai bucket mensili e alle ultime voci dell'atleta."""
+    e = _parse_storico_entry(entry)
+    pos, punti = e.get("pos", 10), punti_voce(e, formula)
+    mese = _mese_voce(e)
+    if mese:
+        b = s.setdefault("ranking_mesi", {}).setdefault(
+            mese, {"punti": 0, "tornei": 0, "oro": 0, "argento": 0, "bronzo": 0,
+                   "set_vinti": 0, "set_persi": 0})
+        b["punti"] += punti
+        b["tornei"] += 1
+        if pos <= 3:
+            b[("oro", "argento", "bronzo")[pos - 1]] += 1
+        b["set_vinti"] += e.get("set_vinti", 0)
+        b["set_persi"] += e.get("set_persi", 0)
+    ultimi = s.setdefault("ranking_ultimi", [])
+    ultimi.append([pos, punti, e.get("set_vinti", 0), e.get("set_persi", 0)])
+    del ultimi[:-_ULTIMI_MAX]
+
+
+def _bucket_da_storico(s, formula="lineare"):
+    """Ricostruisce da zero bucket mensili e ultime voci dallo storico."""
+    s["ranking_mesi"], s["ranking_ultimi"] = {}, []
+    for e in s.get("storico_posizioni", []):
+        _aggiungi_a_bucket(s, e, formula)
+
+
+def _mesi_finestra(finestra, oggi):
+    if finestra == "stagione":
+        return [f"{oggi.year}-{m:02d}" for m in range(1, 13)]
+    # 12_mesi: il mese corrente e gli 11 precedenti
+    return [f"{(oggi.year * 12 + oggi.month - 1 - i) // 12}-{(oggi.month - 1 - i) % 12 + 1:02d}"
+            for i in range(12)]
+
+
+def _totali_finestra(s, finestra, n, mesi):
+    t = {"punti": 0, "tornei": 0, "oro": 0, "argento": 0, "bronzo": 0, "set_vinti": 0, "set_persi": 0}
+    if finestra == "ultimi_n":
+        for pos, punti, sv, sp in s.get("ranking_ultimi", [])[-n:]:
+            t["punti"] += punti
+            t["tornei"] += 1
+            if pos <= 3:
+                t[("oro", "argento", "bronzo")[pos - 1]] += 1
+            t["set_vinti"] += sv
+            t["set_persi"] += sp
+        return t
+    bucket = s.get("ranking_mesi", {})
+    for mese in mesi:
+        for k, v in bucket.get(mese, {}).items():
+            t[k] += v
+    return t
+
+
+_finestre_cache = {}
+_finestre_cache_lock = _threading.Lock()
+
+
+def get_ranking_finestra(state, finestra="sempre", n=_ULTIMI_MAX, oggi=None):
+    """
+    Ranking su una finestra di tempo (chiavi di FINESTRE_RANKING): righe di
+    get_ranking con punti, tornei, medaglie, set e win rate della sola finestra,
+    solo atleti con almeno un torneo nella finestra, riordinate.
+    """
+    base = get_ranking(state)
+    if finestra == "sempre":
+        return base
+    oggi = oggi or datetime.today().date()
+    n = max(1, min(int(n), _ULTIMI_MAX))
+    mesi = _mesi_finestra(finestra, oggi) if finestra != "ultimi_n" else []
+    chiave = (finestra, n, tuple(mesi))
+    with _finestre_cache_lock:
+        c = _finestre_cache.get(chiave)
+    if c is not None and c[0] is base:
+        return c[1]
+
+    lista = []
+    for r in base:
+        t = _totali_finestra(r["atleta"]["stats"], finestra, n, mesi)
+        if not t["tornei"]:
+            continue
+        lista.append({
+            **r,
+            "rank_pts": t["punti"], "tornei": t["tornei"],
+            "oro": t["oro"], "argento": t["argento"], "bronzo": t["bronzo"],
+            "vittorie": t["oro"], "sconfitte": t["tornei"] - t["oro"],
+            "set_vinti": t["set_vinti"], "set_persi": t["set_persi"],
+            "quoziente_set": round(t["set_vinti"] / max(t["set_persi"], 1), 2),
+            "win_rate": round(t["oro"] / t["tornei"] * 100, 1),
+        })
+    # Sort stabile: a parità resta l'ordine del ranking generale
+    lista.sort(key=lambda r: (-r["rank_pts"], -r["oro"], -r["argento"], -r["win_rate"]))
+    with _finestre_cache_lock:
+        _finestre_cache[chiave] = (base, lista)
+    return lista
 
 
 def calcola_overall_fifa(atleta):
@@ -898,7 +1944,7 @@ TROFEI_DEFINIZIONE = [
         "descrizione": "Conquista 1 podio (top 3)", "colore": "#cd7f32",
         "sfondo": "linear-gradient(135deg,#8b4513,#cd7f32)",
         "rarità": "non comune",
-        "check": lambda s: any(_parse_storico_entry(e)["pos"] <= 3 for e in s.get("storico_posizioni", []))
+        "check": lambda s: s["podi"] >= 1
     },
     {
         "id": "esperto", "nome": "Esperto", "icona": "🎖️",
@@ -933,21 +1979,21 @@ TROFEI_DEFINIZIONE = [
         "descrizione": "Conquista 20 medaglie totali", "colore": "#00f5ff",
         "sfondo": "linear-gradient(135deg,#003366,#00c8ff,#003366)",
         "rarità": "leggendario",
-        "check": lambda s: sum(1 for e in s.get("storico_posizioni", []) if _parse_storico_entry(e)["pos"] <= 3) >= 20
+        "check": lambda s: s["podi"] >= 20
     },
     {
         "id": "iron_man", "nome": "Iron Man", "icona": "💪",
         "descrizione": "Vinci 50 set in carriera", "colore": "#ff6600",
         "sfondo": "linear-gradient(135deg,#8B2500,#FF6600,#8B2500)",
         "rarità": "raro",
-        "check": lambda s: s.get("set_vinti", 0) >= 50
+        "check": lambda s: s["set_vinti"] >= 50
     },
     {
         "id": "cecchino", "nome": "Cecchino", "icona": "🎯",
         "descrizione": "Quoziente punti > 2.0 (min 10 set)", "colore": "#00ff88",
         "sfondo": "linear-gradient(135deg,#004422,#00FF88,#004422)",
         "rarità": "non comune",
-        "check": lambda s: (s.get("punti_fatti", 0) / max(s.get("set_vinti", 0) + s.get("set_persi", 0), 1)) > 2.0 and (s.get("set_vinti", 0) + s.get("set_persi", 0)) >= 10
+        "check": lambda s: s["quoziente_punti"] > 2.0 and s["set_vinti"] + s["set_persi"] >= 10
     },
     {
         "id": "veterano", "nome": "Veterano", "icona": "🦅",
@@ -961,33 +2007,93 @@ TROFEI_DEFINIZIONE = [
         "descrizione": "Win rate > 80% con almeno 5 tornei", "colore": "#ff4400",
         "sfondo": "linear-gradient(135deg,#660000,#FF4400,#660000)",
         "rarità": "epico",
-        "check": lambda s: s["tornei"] >= 5 and (s["vittorie"] / s["tornei"] * 100) > 80
+        "check": lambda s: s["tornei"] >= 5 and s["win_rate"] > 80
     },
 ]
 
+# ─── TROFEI SBLOCCATI ─────────────────────────────────────────────────────────
+# I check dei trofei leggono gli aggregati di carriera di career_engine (stessi
+# tornei, vittorie, podi, set, win rate e quozienti di ranking e profilo) e
+# vengono valutati quando cambiano, cioè a fine torneo (trasferisci_al_ranking).
+# Gli sblocchi restano salvati nell'atleta in stats["trofei"] = {id: data}: le
+# pagine trofei fanno solo una lookup. ricalcola_stats_da_storico li ricostruisce
+# dagli aggregati progressivi dello storico, voce dopo voce.
+# ─────────────────────────────────────────────────────────────────────────────
+
+def valuta_trofei(atleta, data=None, aggregati=None):
+    """
+    Sblocca i trofei non ancora ottenuti i cui requisiti sono ora soddisfatti.
+    aggregati: record dell'atleta da career_engine.aggregati_per_id (calcolato
+    dallo storico se non indicato). Ritorna i nuovi.
+    """
+    import career_engine
+    if aggregati is None:
+        aggregati = career_engine.aggregati_per_id([atleta]).get(atleta["id"])
+    if not aggregati:
+        return []
+    sbloccati = atleta["stats"].setdefault("trofei", {})
+    nuovi = [t for t in TROFEI_DEFINIZIONE if t["id"] not in sbloccati and t["check"](aggregati)]
+    for t in nuovi:
+        sbloccati[t["id"]] = data or str(datetime.today().date())
+    return nuovi
+
+
+def _trofei_da_storico(atleti):
+    """
+    {atleta_id: {id trofeo: data del torneo in cui è stato sbloccato}}: i check
+    girano sugli aggregati progressivi di career_engine, nell'ordine dello storico.
+    """
+    import career_engine
+    out = {a["id"]: {} for a in atleti}
+    df = career_engine.storico_df(atleti)
+    if df.empty:
+        return out
+    for r in career_engine.per_id(career_engine.aggregati_progressivi(df)).values():
+        sbloccati = out[r["atleta_id"]]
+        if len(sbloccati) == len(TROFEI_DEFINIZIONE):
+            continue
+        for t in TROFEI_DEFINIZIONE:
+            if t["id"] not in sbloccati and t["check"](r):
+                sbloccati[t["id"]] = r["data"] or ""
+    return out
+
+
+def _migra_trofei(atleta):
+    """Atleti salvati prima dei trofei persistiti: contatore podi e sblocchi dallo storico."""
+    import career_engine
+    s = atleta.get("stats", {})
+    if "trofei" in s:
+        return
+    storico = s.get("storico_posizioni", [])
+    s.setdefault("podi", sum(1 for e in map(_parse_storico_entry, storico) if e.get("pos", 10) <= 3))
+    s["trofei"] = _trofei_da_storico([atleta])[atleta["id"]]
+    # Quanto già mostrato dai contatori attuali resta sbloccato
+    valuta_trofei(atleta, aggregati=career_engine.aggregati_da_contatori(s))
+
+
 def get_trofei_atleta(atleta):
-    s = atleta["stats"]
-    return [(t, t["check"](s)) for t in TROFEI_DEFINIZIONE]
+    """[(trofeo, sbloccato)] per tutti i trofei: lookup su stats["trofei"]."""
+    sbloccati = atleta["stats"].get("trofei", {})
+    return [(t, t["id"] in sbloccati) for t in TROFEI_DEFINIZIONE]
+
+
+def data_trofeo(atleta, trofeo_id):
+    """Data di sblocco del trofeo ("" se la data non è nota), None se ancora bloccato."""
+    return atleta["stats"].get("trofei", {}).get(trofeo_id)
 
 def genera_gironi(squadre_ids, num_gironi=2, use_ranking=False, state=None):
     """
     Genera i gironi. Supporta girone unico (num_gironi=1).
     Gestisce automaticamente BYE con squadre ghost se il numero non è divisibile.
+    Con use_ranking le teste di serie vanno a serpentina (vedi teste_di_serie.py).
     """
+    teste_di_serie = None
     if use_ranking and state:
-        from ranking_page import build_ranking_data
         try:
-            ranking = build_ranking_data(state)
-            ranking_ids = [a["id"] for a in ranking]
-            def rank_key(sid):
-                sq = get_squadra_by_id(state, sid)
-                if not sq: return 9999
-                for aid in sq["atleti"]:
-                    for i, r in enumerate(ranking_ids):
-                        if r == aid: return i
-                return 9999
-            squadre_ids = sorted(squadre_ids, key=rank_key)
-        except:
+            import teste_di_serie
+            squadre_ids = teste_di_serie.ordina(state, squadre_ids)
+        except Exception:
+            teste_di_serie = None
             random.shuffle(squadre_ids)
     else:
         random.shuffle(squadre_ids)
@@ -1000,9 +2106,17 @@ def genera_gironi(squadre_ids, num_gironi=2, use_ranking=False, state=None):
             state["squadre"].append(ghost_sq)
             squadre_ids.append(ghost_sq["id"])
 
+    composizione = None
+    if teste_di_serie is not None:
+        try:
+            composizione = teste_di_serie.sorteggia(state, squadre_ids, num_gironi)
+        except Exception:
+            composizione = None
+    if composizione is None:
+        composizione = [squadre_ids[i::num_gironi] for i in range(num_gironi)]
+
     gironi = []
-    for i in range(num_gironi):
-        squadre_girone = squadre_ids[i::num_gironi]
+    for i, squadre_girone in enumerate(composizione):
         partite = []
         for j in range(len(squadre_girone)):
             for k in range(j+1, len(squadre_girone)):
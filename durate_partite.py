@@ -0,0 +1,135 @@
+"""
+durate_partite.py — Modello empirico della durata delle partite
+Durate reali (fine_reale − inizio_reale) delle partite dei tornei archiviati,
+raggruppate per formato set, punteggio massimo e divario di livello tra le
+squadre (differenza di Elo medio, a fasce di _FASCIA_ELO). La stima di un
+gruppo si restringe verso il livello superiore quando ha pochi dati:
+  fascia di divario → formato + punteggio → prior (20 min a set a 21 punti,
+  in proporzione al punteggio massimo)
+Il modello vive in memoria per processo: si costruisce dall'archivio e si
+aggiorna con un solo record a ogni torneo chiuso (archivio_tornei.archivia),
+le stime sono lookup su dict.
+"""
+import threading
+import time
+
+_FASCIA_ELO = 100          # punti Elo di divario per fascia
+_FASCE = 4                 # 0-100, 100-200, 200-300, 300+
+_PESO_PRIOR = 5            # partite "virtuali" del livello superiore in ogni stima
+_RISINCRONIZZA_DOPO = 300  # secondi tra due controlli di nuovi tornei archiviati
+
+_lock = threading.RLock()
+_gruppi = {}     # {(formato, punteggio_max) o (formato, punteggio_max, fascia): [n, somma minuti]}
+_tornei = set()  # id dei tornei archiviati già nel modello
+_sync = {"ts": 0.0}
+
+
+def minuti_prior(formato_set, punteggio_max=21):
+    """Durata di riferimento senza dati: quella storica, in proporzione ai punti del set."""
+    from data_manager import _minuti_per_partita
+    return _minuti_per_partita(formato_set) * max(5, int(punteggio_max or 21)) / 21
+
+
+def fascia(divario):
+    return min(int(abs(divario) // _FASCIA_ELO), _FASCE - 1)
+
+
+def _durata_reale(p, base_minuti):
+    """Minuti giocati da una partita archiviata, None se mancano o non sono plausibili."""
+    from datetime import datetime
+    try:
+        minuti = (datetime.fromisoformat(p["fine_reale"])
+                  - datetime.fromisoformat(p["inizio_reale"])).total_seconds() / 60
+    except (KeyError, TypeError, ValueError):
+        return None
+    # Scarta segnapunti dimenticati aperti o chiusi per sbaglio
+    return minuti if base_minuti * 0.3 <= minuti <= base_minuti * 4 else None
+
+
+def aggiungi_record(record):
+    """Aggiunge al modello le partite di un torneo archiviato (una volta sola)."""
+    import archivio_tornei
+    with _lock:
+        if record["id"] in _tornei:
+            return
+        _tornei.add(record["id"])
+        t = record.get("torneo", {})
+        formato, pmax = t.get("formato_set") or "Set Unico", int(t.get("punteggio_max") or 21)
+        prior = minuti_prior(formato, pmax)
+        elo = record.get("elo_squadre", {})
+        for p in archivio_tornei.partite(record):
+            minuti = _durata_reale(p, prior)
+            if minuti is None:
+                continue
+            chiavi = [(formato, pmax)]
+            if p.get("sq1") in elo and p.get("sq2") in elo:
+                chiavi.append((formato, pmax, fascia(elo[p["sq1"]] - elo[p["sq2"]])))
+            for k in chiavi:
+                g = _gruppi.setdefault(k, [0, 0.0])
+                g[0] += 1
+                g[1] += minuti
+
+
+def _sincronizza(forza=False):
+    import archivio_tornei
+    with _lock:
+        if not forza and time.time() - _sync["ts"] <= _RISINCRONIZZA_DOPO:
+            return
+        _sync["ts"] = time.time()
+    try:
+        voci = archivio_tornei.indice()
+    except Exception:
+        return   # archivio non raggiungibile: restano le stime già imparate
+    for voce in voci:
+        if voce["id"] in _tornei:
+            continue
+        record = archivio_tornei.carica(voce["id"])
+        if record is not None:
+            aggiungi_record(record)
+
+
+def _stima(chiave, prior):
+    n, somma = _gruppi.get(chiave, (0, 0.0))
+    return (somma + _PESO_PRIOR * prior) / (n + _PESO_PRIOR)
+
+
+def durata_prevista(formato_set, punteggio_max=21, divario=None):
+    """Minuti previsti per una partita; divario = differenza di Elo medio (None se ignoto)."""
+    _sincronizza()
+    pmax = int(punteggio_max or 21)
+    with _lock:
+        stima = _stima((formato_set, pmax), minuti_prior(formato_set, pmax))
+        if divario is not None:
+            stima = _stima((formato_set, pmax, fascia(divario)), stima)
+    return stima
+
+
+def stimatore(state):
+    """durata(partita) → minuti per lo state corrente (Elo medio delle squadre da rating_engine)."""
+    import rating_engine
+    from data_manager import get_squadra_by_id, get_atleta_by_id
+    torneo = state.get("torneo", {})
+    formato, pmax = torneo.get("formato_set", "Set Unico"), torneo.get("punteggio_max", 21)
+    cache = {}
+
+    def elo_squadra(sid):
+        if sid not in cache:
+            sq = get_squadra_by_id(state, sid)
+            atleti = [a for a in (get_atleta_by_id(state, aid) for aid in (sq or {}).get("atleti", [])) if a]
+            cache[sid] = (sum(a["stats"].get("rating", {}).get("elo", rating_engine.RATING_BASE)
+                              for a in atleti) / len(atleti) if atleti else None)
+        return cache[sid]
+
+    def durata(partita):
+        e1, e2 = elo_squadra(partita.get("sq1")), elo_squadra(partita.get("sq2"))
+        divario = e1 - e2 if e1 is not None and e2 is not None else None
+        return round(durata_prevista(formato, pmax, divario))
+    return durata
+
+
+def ricostruisci():
+    """Svuota e ricostruisce il modello dall'archivio."""
+    with _lock:
+        _gruppi.clear()
+        _tornei.clear()
+    _sincronizza(forza=True)
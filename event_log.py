@@ -0,0 +1,303 @@
+"""
+event_log.py — Registro eventi append-only
+Risultati partite, round playoff, chiusura torneo e movimenti di monete Rivals
+non modificano più direttamente i documenti: ogni azione diventa un evento
+(una riga piccola evento:<id>, solo append) applicato allo state da un riduttore.
+Lo state salvato (main_data + righe entità, rivals_data) è lo snapshot
+periodico: ricorda in "_ultimo_evento" l'ultimo evento che contiene.
+
+  - crash recovery:  al load si riapplicano gli eventi successivi allo snapshot
+  - audit / replay:  gli eventi del torneo in corso restano tutti nel registro
+                     finché il torneo non viene chiuso; ricostruisci_classifiche()
+                     rifà le classifiche ripartendo dai soli partita_confermata
+  - compattazione:   gli eventi già nello snapshot vengono cancellati quando il
+                     torneo che li contiene è chiuso; i flussi senza chiusure
+                     (Rivals) oltre _COMPATTA_DOPO eventi. Il registro si
+                     riscandisce solo dopo una chiusura (o ogni _COMPATTA_DOPO
+                     eventi nei flussi senza chiusure), non a ogni salvataggio
+
+Gli id sono "<ns dal 1970>-<casuale>": l'ordine delle chiavi è l'ordine
+cronologico anche con più dispositivi che scrivono in parallelo.
+"""
+import json
+import os
+import random
+import time
+from datetime import datetime
+
+EVENTO_PREFIX = "evento:"
+MARCA = "_ultimo_evento"     # campo dello snapshot: id dell'ultimo evento applicato
+
+_COMPATTA_DOPO = 200         # flussi senza chiusure: eventi coperti oltre cui si compatta
+
+# ─── TIPI DI EVENTO ───────────────────────────────────────────────────────────
+
+PARTITA_CONFERMATA     = "partita_confermata"
+ROUND_PLAYOFF_GENERATO = "round_playoff_generato"
+TORNEO_CHIUSO          = "torneo_chiuso"
+PACCHETTO_APERTO       = "pacchetto_aperto"
+MOSSA_APPRESA          = "mossa_appresa"
+SUPERPOTERE_POTENZIATO = "superpotere_potenziato"
+MONETE_AGGIUNTE        = "monete_aggiunte"
+
+# Flusso di appartenenza: "torneo" → state del torneo, "rivals" → rivals_data
+_FLUSSO = {
+    PARTITA_CONFERMATA:     "torneo",
+    ROUND_PLAYOFF_GENERATO: "torneo",
+    TORNEO_CHIUSO:          "torneo",
+    PACCHETTO_APERTO:       "rivals",
+    MOSSA_APPRESA:          "rivals",
+    SUPERPOTERE_POTENZIATO: "rivals",
+    MONETE_AGGIUNTE:        "rivals",
+}
+# Eventi dopo i quali tutto ciò che precede è definitivo nello snapshot
+_CHIUSURE = {TORNEO_CHIUSO}
+
+
+# ─── RIDUTTORI TORNEO ─────────────────────────────────────────────────────────
+# Ogni riduttore è idempotente: riapplicare un evento già presente nello
+# snapshot (es. dopo un merge tra dispositivi) non cambia nulla.
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _trova_partita(state, pid, sq1=None, sq2=None):
+    from data_manager import get_partita_by_id
+    p = get_partita_by_id(state, pid)
+    if p is not None and (sq1 is None or (p.get("sq1"), p.get("sq2")) == (sq1, sq2)):
+        return p
+    # Id ripetuto in un'altra fase (id casuali): scansione completa
+    tutte = [p for g in state.get("gironi", []) for p in g.get("partite", [])]
+    tutte += state.get("bracket", []) + state.get("bracket_extra", [])
+    for p in tutte:
+        if p.get("id") == pid and (sq1 is None or (p.get("sq1"), p.get("sq2")) == (sq1, sq2)):
+            return p
+    return None
+
+
+def _partita_confermata(state, d):
+    from data_manager import aggiorna_classifica_squadra
+    import rating_engine
+    import scontri_diretti
+    partita = _trova_partita(state, d["partita"], d.get("sq1"), d.get("sq2"))
+    if partita is None or partita.get("confermata"):
+        return
+    partita["punteggi"] = d["punteggi"]
+    partita["set_sq1"] = d["set_sq1"]
+    partita["set_sq2"] = d["set_sq2"]
+    partita["vincitore"] = d["vincitore"]
+    if "in_battuta" in d:
+        partita["in_battuta"] = d["in_battuta"]
+    # Orari reali (segnapunti / inserimento manuale; le simulazioni non li hanno)
+    for campo, chiave in (("inizio", "inizio_reale"), ("fine", "fine_reale")):
+        if d.get(campo):
+            partita[chiave] = d[campo]
+    partita["confermata"] = True
+    # Risultati simulati con "simulazione al ranking" spento: fuori da classifica e rating
+    partita["classifica"] = d.get("classifica", True)
+    if partita["classifica"]:
+        aggiorna_classifica_squadra(state, partita)
+        rating_engine.aggiorna_partita(state, partita)
+    scontri_diretti.aggiorna_partita(state, partita)
+
+
+def _round_playoff_generato(state, d):
+    ids_sq = {sq["id"] for sq in state.get("squadre", [])}
+    state.setdefault("squadre", []).extend(sq for sq in d.get("squadre", []) if sq["id"] not in ids_sq)
+    state["torneo"].update(d.get("torneo", {}))
+    lista = state.setdefault(d["campo"], [])
+    presenti = {p.get("id") for p in lista}
+    lista.extend(p for p in d["partite"] if p.get("id") not in presenti)
+    if d.get("fase"):
+        state["fase"] = d["fase"]
+
+
+def _torneo_chiuso(state, d):
+    from data_manager import trasferisci_al_ranking
+    podio = [list(x) for x in d["podio"]]
+    if state.get("fase") == "proclamazione" and [list(x) for x in state.get("podio", [])] == podio:
+        return
+    state["vincitore"] = d.get("vincitore")
+    state["podio"] = podio
+    if d.get("svuota_bracket"):
+        state["bracket"] = []
+        state["bracket_extra"] = []
+    if d.get("al_ranking"):
+        # Incrementi dal seme della lega (deterministici); gli eventi più vecchi
+        # portano un proprio seme, che rende il loro replay identico all'originale
+        rng = random.Random(d["seme"]) if "seme" in d else None
+        trasferisci_al_ranking(state, podio, rng=rng)
+    state["fase"] = "proclamazione"
+
+
+# ─── RIDUTTORI RIVALS ─────────────────────────────────────────────────────────
+# rivals_data è una riga sola: qui l'idempotenza la garantisce il marcatore.
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _pacchetto_aperto(data, d):
+    data["mbt_coins"] -= d["prezzo"]
+    data["collection"].extend(d["carte"])
+
+
+def _mossa_appresa(data, d):
+    data["mbt_coins"] -= d["costo"]
+    if d["mossa"] not in data["special_moves_learned"]:
+        data["special_moves_learned"].append(d["mossa"])
+
+
+def _superpotere_potenziato(data, d):
+    data["mbt_coins"] -= d["costo"]
+    data.setdefault("superpowers", {})[d["superpotere"]] = d["livello"]
+
+
+def _monete_aggiunte(data, d):
+    data["mbt_coins"] += d["monete"]
+
+
+_RIDUTTORI = {
+    PARTITA_CONFERMATA:     _partita_confermata,
+    ROUND_PLAYOFF_GENERATO: _round_playoff_generato,
+    TORNEO_CHIUSO:          _torneo_chiuso,
+    PACCHETTO_APERTO:       _pacchetto_aperto,
+    MOSSA_APPRESA:          _mossa_appresa,
+    SUPERPOTERE_POTENZIATO: _superpotere_potenziato,
+    MONETE_AGGIUNTE:        _monete_aggiunte,
+}
+
+
+# ─── API ──────────────────────────────────────────────────────────────────────
+
+def _nuovo_id():
+    return f"{time.time_ns():020d}-{os.urandom(3).hex()}"
+
+
+def emetti(state, tipo, **dati):
+    """
+    Registra un evento nel log (append di una riga) e lo applica allo state.
+    È l'unico modo in cui le azioni registrate modificano state / rivals_data.
+    Ritorna l'id dell'evento.
+    """
+    eid = _nuovo_id()
+    riga = json.dumps({"tipo": tipo, "ts": datetime.now().isoformat(timespec="seconds"),
+                       "dati": dati}, ensure_ascii=False)
+    try:
+        from data_manager import storage_write
+        storage_write({EVENTO_PREFIX + eid: riga})
+    except Exception:
+        pass   # log non raggiungibile: l'azione vale comunque, la salva lo snapshot
+    # Si applica la versione serializzata: identica a quella che vedrà un replay
+    _RIDUTTORI[tipo](state, json.loads(riga)["dati"])
+    state[MARCA] = eid
+    c = _compattazione.get(_FLUSSO[tipo])
+    if c is not None:
+        c["emessi"] += 1
+        c["chiusura"] = c["chiusura"] or tipo in _CHIUSURE
+    return eid
+
+
+def conferma_partita(state, partita, esito, classifica=True, **extra):
+    """
+    Evento partita_confermata per una partita dello state.
+    esito: dict con punteggi, set_sq1, set_sq2, vincitore (risultato inserito,
+    oppure il ritorno di simula_partita su una copia della partita).
+    """
+    return emetti(state, PARTITA_CONFERMATA, partita=partita["id"],
+                  sq1=partita["sq1"], sq2=partita["sq2"], punteggi=esito["punteggi"],
+                  set_sq1=esito["set_sq1"], set_sq2=esito["set_sq2"],
+                  vincitore=esito["vincitore"], classifica=classifica, **extra)
+
+
+def eventi(store, flusso, dopo=None):
+    """[(id, evento)] del flusso in ordine cronologico, solo quelli con id > dopo."""
+    from data_manager import _sheet_read_chunked
+    out = []
+    for k in store:
+        if not k.startswith(EVENTO_PREFIX) or k.count(":") != 1:
+            continue
+        eid = k[len(EVENTO_PREFIX):]
+        if dopo is not None and eid <= dopo:
+            continue
+        try:
+            ev = json.loads(_sheet_read_chunked(store, k))
+        except Exception:
+            continue
+        if _FLUSSO.get(ev.get("tipo")) == flusso:
+            out.append((eid, ev))
+    out.sort(key=lambda x: x[0])
+    return out
+
+
+def riapplica(state, flusso, store):
+    """
+    Crash recovery: applica allo snapshot gli eventi registrati dopo il suo marcatore.
+    Uno snapshot senza marcatore (dati vecchi, torneo appena creato) non ne ha di pendenti.
+    Ritorna il numero di eventi applicati.
+    """
+    marca = state.get(MARCA)
+    if not marca:
+        return 0
+    pendenti = eventi(store, flusso, dopo=marca)
+    for eid, ev in pendenti:
+        _RIDUTTORI[ev["tipo"]](state, ev.get("dati", {}))
+        state[MARCA] = eid
+    return len(pendenti)
+
+
+def marca_snapshot(state, flusso, store):
+    """Segna lo state come comprensivo di tutti gli eventi esistenti (es. dopo un reset)."""
+    esistenti = eventi(store, flusso)
+    state[MARCA] = esistenti[-1][0] if esistenti else _nuovo_id()
+
+
+def ricostruisci_classifiche(state, store):
+    """
+    Rifà da zero le classifiche delle squadre del torneo in corso riapplicando
+    gli eventi partita_confermata registrati dopo l'ultima chiusura di torneo.
+    """
+    from data_manager import aggiorna_classifica_squadra
+    for sq in state.get("squadre", []):
+        for campo in ("vittorie", "sconfitte", "set_vinti", "set_persi",
+                      "punti_fatti", "punti_subiti", "punti_classifica"):
+            sq[campo] = 0
+    log = eventi(store, "torneo")
+    chiusure = [i for i, (_eid, ev) in enumerate(log) if ev["tipo"] in _CHIUSURE]
+    for _eid, ev in log[chiusure[-1] + 1 if chiusure else 0:]:
+        d = ev.get("dati", {})
+        if ev["tipo"] != PARTITA_CONFERMATA or not d.get("classifica", True):
+            continue
+        partita = _trova_partita(state, d["partita"], d.get("sq1"), d.get("sq2"))
+        if partita is not None and partita.get("confermata"):
+            aggiorna_classifica_squadra(state, partita)
+    return state
+
+
+# {flusso: {"emessi", "chiusura"}} dall'ultima scansione di questo processo;
+# un flusso assente non è ancora stato scandito (la prima volta si scandisce sempre)
+_compattazione = {}
+
+
+def compatta(flusso, marca):
+    """
+    Cancella gli eventi già contenuti nello snapshot salvato (id <= marca)
+    fino all'ultima chiusura coperta: quelli del torneo in corso restano.
+    I flussi che non hanno chiusure (Rivals) si compattano per intero oltre
+    _COMPATTA_DOPO eventi coperti.
+    Il registro si rilegge solo se da questo processo è stata emessa una
+    chiusura (o, senza chiusure, almeno _COMPATTA_DOPO eventi) dall'ultima
+    scansione: i salvataggi dopo ogni partita confermata non lo toccano.
+    """
+    if not marca:
+        return
+    con_chiusure = any(_FLUSSO[t] == flusso for t in _CHIUSURE)
+    c = _compattazione.get(flusso)
+    if c is not None and not (c["chiusura"] if con_chiusure else c["emessi"] >= _COMPATTA_DOPO):
+        return
+    _compattazione[flusso] = {"emessi": 0, "chiusura": False}
+    from data_manager import storage_read_all, storage_delete
+    coperti = [(eid, ev) for eid, ev in eventi(storage_read_all(), flusso) if eid <= marca]
+    taglio = None
+    for eid, ev in coperti:
+        if ev["tipo"] in _CHIUSURE:
+            taglio = eid
+    if not con_chiusure and len(coperti) > _COMPATTA_DOPO:
+        taglio = coperti[-1][0]
+    if taglio:
+        storage_delete(EVENTO_PREFIX + eid for eid, _ev in coperti if eid <= taglio)
@@ -4,9 +4,11 @@ Include: Quarti → Semifinali → Finale 3°/4° + Finale 1°/2°
 """
 import streamlit as st
 from data_manager import (
-    save_state, simula_partita, aggiorna_classifica_squadra,
-    get_squadra_by_id, new_partita
+    save_state, simula_partita,
+    get_squadra_by_id, new_partita, calcola_schedule
 )
+from calendario import adesso, incroci_pronti
+from event_log import conferma_partita, emetti, ROUND_PLAYOFF_GENERATO, TORNEO_CHIUSO
 from ui_components import render_match_card
 
 
@@ -107,19 +109,17 @@ def _render_scoreboard_playoff(state, partita, key_prefix):
                 if not punteggi_validi:
                     st.error("Inserisci almeno un set.")
                     return
-                partita["punteggi"] = punteggi_validi
-                partita["set_sq1"] = s1v
-                partita["set_sq2"] = s2v
-                partita["vincitore"] = partita["sq1"] if s1v > s2v else partita["sq2"]
-                partita["confermata"] = True
-                aggiorna_classifica_squadra(state, partita)
+                conferma_partita(state, partita, {
+                    "punteggi": punteggi_validi, "set_sq1": s1v, "set_sq2": s2v,
+                    "vincitore": partita["sq1"] if s1v > s2v else partita["sq2"],
+                }, fine=adesso())
+                calcola_schedule(state)
                 save_state(state)
                 st.rerun()
         with col_btn2:
             if st.button("🎲 Simula", key=f"{key_prefix}_sim"):
-                simula_partita(state, partita)
-                if state["simulazione_al_ranking"]:
-                    aggiorna_classifica_squadra(state, partita)
+                esito = simula_partita(state, dict(partita))
+                conferma_partita(state, partita, esito, classifica=state["simulazione_al_ranking"])
                 save_state(state)
                 st.rerun()
 
@@ -170,39 +170,42 @@ def _check_e_genera_prossimi_round(state):
         if r_name not in rounds:
             continue
         partite_round = rounds[r_name]
-        tutti_confermati = all(p["confermata"] for p in partite_round)
-        if not tutti_confermati:
-            break
 
         if r_name in ROUND_FINALE:
             _genera_finali_da_semifinali(state, partite_round)
             return
 
         next_round = ROUND_SUCCESSIVO.get(r_name)
-        if next_round and next_round not in rounds:
-            # Raccogli solo i vincitori delle partite NON-BYE per il round successivo
-            # (le partite BYE sono già confermate e il vincitore avanza automaticamente)
-            vincitori = [p["vincitore"] for p in partite_round if p.get("vincitore")]
-            nuove_partite = []
-            for j in range(0, len(vincitori), 2):
-                if j + 1 < len(vincitori):
-                    sq1_id = vincitori[j]
-                    sq2_id = vincitori[j+1]
-                    np = new_partita(sq1_id, sq2_id, "eliminazione")
-                    np["round"] = next_round
-                    # Se uno dei due è ancora una ghost/BYE, auto-win
-                    sq1_data = get_squadra_by_id(state, sq1_id)
-                    sq2_data = get_squadra_by_id(state, sq2_id)
-                    if sq2_data and sq2_data.get("is_ghost"):
-                        np["squadra1_score"] = 1; np["squadra2_score"] = 0
-                        np["vincitore"] = sq1_id; np["perdente"] = sq2_id
-                        np["confermata"] = True;  np["is_bye"] = True
-                    elif sq1_data and sq1_data.get("is_ghost"):
-                        np["squadra1_score"] = 0; np["squadra2_score"] = 1
-                        np["vincitore"] = sq2_id; np["perdente"] = sq1_id
-                        np["confermata"] = True;  np["is_bye"] = True
-                    nuove_partite.append(np)
-            bracket.extend(nuove_partite)
+        if not next_round:
+            continue
+        # Ogni partita del turno successivo si genera appena le sue due squadre
+        # sono note, senza aspettare la fine dell'intero turno: la partita k
+        # mette di fronte i vincitori degli slot 2k e 2k+1 (non delle posizioni)
+        gia_generate = {p.get("slot", i) for i, p in enumerate(rounds.get(next_round, []))}
+        nuove_partite = []
+        for k, prima, seconda in incroci_pronti(partite_round):
+            if k in gia_generate:
+                continue
+            sq1_id = prima["vincitore"]
+            sq2_id = seconda["vincitore"]
+            np = new_partita(sq1_id, sq2_id, "eliminazione")
+            np["round"] = next_round
+            np["slot"] = k
+            # Se uno dei due è ancora una ghost/BYE, auto-win
+            sq1_data = get_squadra_by_id(state, sq1_id)
+            sq2_data = get_squadra_by_id(state, sq2_id)
+            if sq2_data and sq2_data.get("is_ghost"):
+                np["squadra1_score"] = 1; np["squadra2_score"] = 0
+                np["vincitore"] = sq1_id; np["perdente"] = sq2_id
+                np["confermata"] = True;  np["is_bye"] = True
+            elif sq1_data and sq1_data.get("is_ghost"):
+                np["squadra1_score"] = 0; np["squadra2_score"] = 1
+                np["vincitore"] = sq2_id; np["perdente"] = sq1_id
+                np["confermata"] = True;  np["is_bye"] = True
+            nuove_partite.append(np)
+        if nuove_partite:
+            emetti(state, ROUND_PLAYOFF_GENERATO, campo="bracket", partite=nuove_partite)
+            calcola_schedule(state)
             save_state(state)
             st.rerun()
 
@@ -217,40 +220,34 @@ def _genera_finali_da_semifinali(state, partite_semifinali):
     if "🏆 FINALE 1°/2° Posto" in round_esistenti:
         return  # già generate
 
-    vincitori = [p["vincitore"] for p in partite_semifinali if p["confermata"]]
-    perdenti = []
-    for p in partite_semifinali:
-        if p["confermata"]:
-            perdente = p["sq1"] if p["vincitore"] == p["sq2"] else p["sq2"]
-            perdenti.append(perdente)
-
-    if len(vincitori) >= 2:
-        # Finale 1°/2°
-        finale_1_2 = new_partita(vincitori[0], vincitori[1], "eliminazione")
-        finale_1_2["round"] = "🏆 FINALE 1°/2° Posto"
-        bracket_extra.append(finale_1_2)
-
-    if len(perdenti) >= 2:
-        # Finale 3°/4°
-        finale_3_4 = new_partita(perdenti[0], perdenti[1], "eliminazione")
-        finale_3_4["round"] = "🥉 Finale 3°/4° Posto"
-        bracket_extra.append(finale_3_4)
-
+    # Servono entrambe le semifinali (slot 0 e 1) concluse: con i turni generati
+    # partita per partita può esisterne una sola
+    pronti = [(prima, seconda) for k, prima, seconda in incroci_pronti(partite_semifinali)
+              if k == 0 and prima.get("confermata") and seconda.get("confermata")]
+    if not pronti:
+        return
+    semifinali = pronti[0]
+    vincitori = [p["vincitore"] for p in semifinali]
+    perdenti = [p["sq1"] if p["vincitore"] == p["sq2"] else p["sq2"] for p in semifinali]
+
+    # Finale 1°/2°
+    finale_1_2 = new_partita(vincitori[0], vincitori[1], "eliminazione")
+    finale_1_2["round"] = "🏆 FINALE 1°/2° Posto"
+    # Finale 3°/4°
+    finale_3_4 = new_partita(perdenti[0], perdenti[1], "eliminazione")
+    finale_3_4["round"] = "🥉 Finale 3°/4° Posto"
+
+    emetti(state, ROUND_PLAYOFF_GENERATO, campo="bracket_extra", partite=[finale_1_2, finale_3_4])
+    calcola_schedule(state)
     save_state(state)
     st.rerun()
 
 
 def _simula_tutti_playoff(state):
-    for partita in state["bracket"]:
-        if not partita["confermata"]:
-            simula_partita(state, partita)
-            if state["simulazione_al_ranking"]:
-                aggiorna_classifica_squadra(state, partita)
-    for partita in state.get("bracket_extra", []):
+    for partita in state["bracket"] + state.get("bracket_extra", []):
         if not partita["confermata"]:
-            simula_partita(state, partita)
-            if state["simulazione_al_ranking"]:
-                aggiorna_classifica_squadra(state, partita)
+            esito = simula_partita(state, dict(partita))
+            conferma_partita(state, partita, esito, classifica=state["simulazione_al_ranking"])
     # Genera prossimi round se servono
     _check_e_genera_prossimi_round(state)
     save_state(state)
@@ -295,14 +292,13 @@ def _check_finale(state):
 
     with col2:
         if st.button("🏆 PROCLAMAZIONE →", use_container_width=True):
-            state["vincitore"] = vincitore_id
             podio = [(1, vincitore_id), (2, perdente_id)]
             if terzo_id:
                 podio.append((3, terzo_id))
 
-            state["podio"] = podio
-            from data_manager import trasferisci_al_ranking
-            trasferisci_al_ranking(state, podio)
-            state["fase"] = "proclamazione"
+            from data_manager import flush
+            emetti(state, TORNEO_CHIUSO, podio=podio, vincitore=vincitore_id,
+                   al_ranking=True)
             save_state(state)
+            flush()
             st.rerun()
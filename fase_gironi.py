@@ -5,10 +5,12 @@ auto-BYE, classifica avulsa, scelta quante squadre passano.
 """
 import streamlit as st
 from data_manager import (
-    save_state, simula_partita, aggiorna_classifica_squadra, calcola_schedule,
+    save_state, flush, simula_partita, calcola_schedule,
     get_squadra_by_id, nome_squadra, genera_bracket_da_gironi,
     classifica_girone
 )
+from event_log import conferma_partita, emetti, ROUND_PLAYOFF_GENERATO, TORNEO_CHIUSO
+from calendario import adesso
 from ui_components import render_match_card
 
 
@@ -135,6 +137,7 @@ def _render_configurazione_gironi(state):
 def _genera_e_avanza(state):
     """Genera il bracket e avanza alla fase eliminazione."""
     squadre_passano = state["torneo"].get("squadre_per_girone_passano", 2)
+    n_squadre_prima = len(state["squadre"])
     bracket = genera_bracket_da_gironi(state["gironi"], state=state, squadre_per_girone_passano=squadre_passano)
 
     # Assegna round iniziale al bracket in base al bracket_size reale
@@ -148,9 +151,14 @@ def _genera_e_avanza(state):
         else:
             p["round"] = round_name      # stesso round, ma confermata=True
 
-    state["bracket"] = bracket
+    # BYE aggiunti da genera_bracket_da_gironi e metadati bracket viaggiano nell'evento
+    state["bracket"] = []
     state["bracket_extra"] = []
-    state["fase"] = "eliminazione"
+    emetti(state, ROUND_PLAYOFF_GENERATO, campo="bracket", partite=bracket,
+           squadre=state["squadre"][n_squadre_prima:], fase="eliminazione",
+           torneo={k: state["torneo"][k] for k in
+                   ("bracket_size", "n_bye_playoff", "n_qualificate_playoff") if k in state["torneo"]})
+    calcola_schedule(state)
     save_state(state)
     st.rerun()
 
@@ -240,20 +248,17 @@ def _render_scoreboard_live(state, partita, key_prefix):
                 if not punteggi_validi:
                     st.error("Inserisci almeno un set con punteggio.")
                     return
-                partita["punteggi"] = punteggi_validi
-                partita["set_sq1"] = s1v
-                partita["set_sq2"] = s2v
-                partita["vincitore"] = partita["sq1"] if s1v > s2v else partita["sq2"]
-                partita["confermata"] = True
-                aggiorna_classifica_squadra(state, partita)
+                conferma_partita(state, partita, {
+                    "punteggi": punteggi_validi, "set_sq1": s1v, "set_sq2": s2v,
+                    "vincitore": partita["sq1"] if s1v > s2v else partita["sq2"],
+                }, fine=adesso())
                 calcola_schedule(state)
                 save_state(state)
                 st.rerun()
         with col_btn2:
             if st.button("🎲 Simula", key=f"{key_prefix}_sim"):
-                simula_partita(state, partita)
-                if state["simulazione_al_ranking"]:
-                    aggiorna_classifica_squadra(state, partita)
+                esito = simula_partita(state, dict(partita))
+                conferma_partita(state, partita, esito, classifica=state["simulazione_al_ranking"])
                 save_state(state)
                 st.rerun()
 
@@ -300,9 +305,8 @@ def _simula_tutti(state):
     for girone in state["gironi"]:
         for partita in girone["partite"]:
             if not partita["confermata"]:
-                simula_partita(state, partita)
-                if state["simulazione_al_ranking"]:
-                    aggiorna_classifica_squadra(state, partita)
+                esito = simula_partita(state, dict(partita))
+                conferma_partita(state, partita, esito, classifica=state["simulazione_al_ranking"])
     save_state(state)
     st.rerun()
 
@@ -323,15 +327,9 @@ def _proclama_da_girone_unico(state):
     for i, sq in enumerate(squadre_reali[:3]):
         podio.append((i+1, sq["id"]))
 
-    state["vincitore"] = squadre_reali[0]["id"] if squadre_reali else None
-    state["podio"] = podio
-    state["bracket"] = []
-    state["bracket_extra"] = []
-
-    if state["simulazione_al_ranking"]:
-        from data_manager import trasferisci_al_ranking
-        trasferisci_al_ranking(state, podio)
-
-    state["fase"] = "proclamazione"
+    emetti(state, TORNEO_CHIUSO, podio=podio,
+           vincitore=squadre_reali[0]["id"] if squadre_reali else None,
+           svuota_bracket=True, al_ranking=state["simulazione_al_ranking"])
     save_state(state)
+    flush()
     st.rerun()
@@ -4,7 +4,7 @@ fase_proclamazione.py — Fase 4: Proclamazione vincitori e Ranking globale
 import streamlit as st
 import pandas as pd
 from data_manager import (
-    save_state, get_squadra_by_id, get_atleta_by_id
+    save_state, flush, get_squadra_by_id, get_atleta_by_id
 )
 from ui_components import render_winner_banner, render_podio, render_career_card
 
@@ -47,40 +47,14 @@ def render_ranking_globale(state):
         st.info("Nessun dato disponibile. Completa un torneo per generare il ranking.")
         return
     
-    # Costruisci dati ranking
-    atleti_stats = []
-    for a in state["atleti"]:
-        s = a["stats"]
-        if s["tornei"] == 0:
-            continue
-        quoziente = round(s["punti_fatti"] / max(s["set_vinti"], 1), 2)
-        win_rate = round(s["vittorie"] / max(s["tornei"], 1) * 100, 1)
-        
-        # Punteggio ranking: punti per posizioni
-        rank_pts = 0
-        for entry in s["storico_posizioni"]:
-            pos = entry[1]
-            rank_pts += {1: 100, 2: 70, 3: 50}.get(pos, 20)
-        
-        atleti_stats.append({
-            "atleta": a,
-            "nome": a["nome"],
-            "tornei": s["tornei"],
-            "vittorie": s["vittorie"],
-            "sconfitte": s["sconfitte"],
-            "set_vinti": s["set_vinti"],
-            "set_persi": s["set_persi"],
-            "quoziente": quoziente,
-            "win_rate": win_rate,
-            "rank_pts": rank_pts,
-        })
+    # Righe del ranking materializzato (stesse formule della pagina Ranking)
+    from data_manager import get_ranking
+    atleti_stats = [r for r in get_ranking(state) if r["tornei"] > 0]
     
     if not atleti_stats:
         st.info("Completa il torneo e trasferisci i dati al ranking per visualizzarli.")
         return
     
-    atleti_stats.sort(key=lambda x: -x["rank_pts"])
-    
     # Podio graficoo top 3
     if len(atleti_stats) >= 3:
         st.markdown("#### 🏅 Top 3 Atleti")
@@ -129,7 +103,7 @@ def render_ranking_globale(state):
             <td style="color:var(--green)">{a['vittorie']}</td>
             <td style="color:var(--accent-red)">{a['sconfitte']}</td>
             <td>{a['set_vinti']}</td><td>{a['set_persi']}</td>
-            <td>{a['quoziente']}</td>
+            <td>{a['quoziente_punti']}</td>
             <td>{a['win_rate']}%</td>
         </tr>"""
     
@@ -199,10 +173,13 @@ def _render_nuovo_torneo(state):
         nuovo = empty_state()
         nuovo["atleti"] = atleti_preservati
         nuovo["ranking_globale"] = ranking_preservato
+        nuovo["seme_lega"] = state.get("seme_lega", nuovo["seme_lega"])
+        nuovo["punteggio_ranking"] = state.get("punteggio_ranking", {})
         
         # Resetta sessione
         for key in list(st.session_state.keys()):
             del st.session_state[key]
         
         save_state(nuovo)
+        flush()
         st.rerun()
@@ -40,7 +40,7 @@ def render_setup(state):
         state["torneo"]["data"] = str(data)
 
         # ── Campi e orari ────────────────────────────────────────────────────
-        col_c1, col_c2 = st.columns(2)
+        col_c1, col_c2, col_c3 = st.columns(3)
         with col_c1:
             num_campi = st.number_input(
                 "🏖️ Numero di Campi",
@@ -61,6 +61,14 @@ def render_setup(state):
                 ora_default = _time(9, 0)
             orario_inp = st.time_input("⏰ Orario Inizio Torneo", value=ora_default)
             state["torneo"]["orario_inizio"] = orario_inp.strftime("%H:%M")
+        with col_c3:
+            state["torneo"]["riposo_minuti"] = int(st.number_input(
+                "😮‍💨 Riposo minimo (min)",
+                min_value=0, max_value=60,
+                value=int(state["torneo"].get("riposo_minuti", 10)),
+                step=5,
+                help="Minuti minimi tra due partite della stessa squadra nel calendario"
+            ))
 
         with st.expander("⚙️ Impostazioni Avanzate", expanded=False):
             st.markdown("#### Formato di Gioco")
@@ -158,7 +166,8 @@ def render_setup(state):
             )
             state["torneo"]["usa_ranking_teste_serie"] = usa_ranking
             if usa_ranking:
-                st.info("✅ Le squadre saranno distribuite nei gironi secondo il ranking globale.")
+                st.info("✅ Le squadre saranno distribuite nei gironi a serpentina secondo il ranking "
+                        "globale di entrambi gli atleti, separando club e avversari già incontrati.")
 
     with col2:
         st.markdown("### 👤 Gestione Atleti")
@@ -249,6 +258,8 @@ def render_setup(state):
     with col_b:
         if n_squadre >= min_sq and nome:
             if st.button("🚀 AVVIA TORNEO →", use_container_width=True):
+                import archivio_tornei
+                archivio_tornei.nuovo_id_torneo(state)   # chiave stabile di archivio e scontri diretti
                 ids = [s["id"] for s in state["squadre"]]
                 modalita_corrente = state["torneo"].get("modalita", "Gironi + Playoff")
                 if modalita_corrente == "Girone Unico":
@@ -269,6 +280,7 @@ def render_setup(state):
                 state["torneo"]["bracket_size"]  = b_size
                 state["torneo"]["n_bye_playoff"] = n_bye_auto
                 state["fase"] = "gironi"
+                calcola_schedule(state)
                 save_state(state)
                 st.rerun()
 
@@ -283,11 +295,13 @@ def _render_atleti_manager(state):
             nuovo_cognome = st.text_input("Cognome", key="new_atleta_cognome", placeholder="Cognome")
         with col_foto:
             foto_file = st.file_uploader("Foto (opz.)", type=["png","jpg","jpeg"], key="new_atleta_foto")
+        nuovo_club = st.text_input("Club (opz.)", key="new_atleta_club", placeholder="Club / società")
 
         if st.button("Aggiungi Atleta", key="btn_add_atleta"):
             full = f"{nuovo_nome.strip()} {nuovo_cognome.strip()}".strip()
             if full and full not in nomi_esistenti:
                 nuovo = new_atleta(nuovo_nome.strip(), nuovo_cognome.strip())
+                nuovo["club"] = nuovo_club.strip()
                 if foto_file:
                     import base64
                     nuovo["foto_b64"]  = base64.b64encode(foto_file.read()).decode()
@@ -6,12 +6,24 @@ import json
 from pathlib import Path
 from data_manager import save_state, get_squadra_by_id, get_atleta_by_id
 
-INCASSI_FILE = "beach_volley_incassi.json"
+INCASSI_FILE = "beach_volley_incassi.json"  # vecchio formato, solo migrazione
 
 
+# Storage di data_manager (Google Sheets + SQLite locale), una riga per torneo:
+#   incasso:<nome torneo>  → quota, data e pagamenti del torneo
+# Il vecchio file INCASSI_FILE viene letto solo per migrazione.
+
 def load_incassi():
-    """Carica incassi da file locale JSON."""
+    """Carica incassi dallo storage (fallback: vecchio file locale JSON)."""
     try:
+        from data_manager import storage_read_all, _sheet_read_chunked
+        store = storage_read_all()
+        tornei = {}
+        for k in store:
+            if k.startswith("incasso:") and not k.rpartition(":c")[2].isdigit():
+                tornei[k[len("incasso:"):]] = json.loads(_sheet_read_chunked(store, k))
+        if tornei:
+            return {"tornei": tornei}
         if Path(INCASSI_FILE).exists():
             with open(INCASSI_FILE, "r", encoding="utf-8") as f:
                 return json.load(f)
@@ -20,10 +32,11 @@ def load_incassi():
     return {"tornei": {}}
 
 def save_incassi(data):
-    """Salva incassi su file locale JSON."""
+    """Salva incassi nello storage, una riga per torneo."""
     try:
-        with open(INCASSI_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        from data_manager import storage_write
+        storage_write({f"incasso:{nome}": json.dumps(t, ensure_ascii=False)
+                       for nome, t in data.get("tornei", {}).items()})
     except Exception as e:
         import streamlit as st
         st.warning(f"Impossibile salvare incassi: {e}")
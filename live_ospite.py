@@ -1,6 +1,6 @@
 """
 live_ospite.py — Vista Live SOLO LETTURA per Ospiti
-Mostra in tempo reale: programma, gironi, bracket, classifiche.
+Mostra in tempo reale: programma, gironi, bracket, classifiche, pronostici.
 NESSUN bottone, input o widget interattivo — solo visione.
 Auto-refresh ogni 30 secondi.
 """
@@ -62,11 +62,12 @@ def render_live_ospite(state):
         _render_podio_live(state)
         return
 
-    tabs = st.tabs(["📋 Programma", "🏐 Gironi", "⚡ Playoff", "📊 Classifiche"])
+    tabs = st.tabs(["📋 Programma", "🏐 Gironi", "⚡ Playoff", "📊 Classifiche", "🎯 Pronostici"])
     with tabs[0]: _render_programma(state)
     with tabs[1]: _render_gironi_live(state)
     with tabs[2]: _render_bracket_live(state)
     with tabs[3]: _render_classifiche_live(state)
+    with tabs[4]: _render_pronostici_live(state)
 
 
 def _render_programma(state):
@@ -242,6 +243,40 @@ def _render_classifiche_live(state):
                 unsafe_allow_html=True)
 
 
+def _render_pronostici_live(state):
+    import pronostici
+    try:
+        prob = pronostici.probabilita(state)   # in cache: si ricalcola solo dopo un nuovo risultato
+    except Exception:
+        prob = {}
+    if not prob:
+        st.markdown(_empty_box("Pronostici non disponibili.")); return
+
+    girone_unico = state.get("torneo", {}).get("modalita") == "Girone Unico"
+    ordine = sorted(prob.items(), key=lambda x: (-x[1]["vittoria"], -x[1]["semifinale"],
+                                                 -(x[1]["qualificazione"] or 0)))
+    def cella(v, colore):
+        if v is None: return '<td style="color:#444;text-align:center">—</td>'
+        return (f'<td style="color:{colore};font-weight:700;text-align:center">'
+                f'{"<0.1" if 0 < v < 0.001 else round(v * 100, 1)}%</td>')
+    rows = ""
+    for sid, p in ordine:
+        sq = get_squadra_by_id(state, sid)
+        if not sq: continue
+        rows += (f'<tr><td style="font-weight:800;color:#fff">{sq["nome"]}</td>'
+                 f'{cella(p["qualificazione"], "#aaa")}{cella(p["semifinale"], "#00c851")}'
+                 f'{cella(p["vittoria"], "#ffd700")}</tr>')
+
+    st.markdown(f'<table class="rank-table"><tr><th style="text-align:left">Squadra</th>'
+                f'<th style="text-align:center">Qualificazione</th>'
+                f'<th style="text-align:center">{"Top 4" if girone_unico else "Semifinale"}</th>'
+                f'<th style="text-align:center">Vittoria</th></tr>{rows}</table>'
+                f'<div style="font-size:.62rem;color:#444;margin-top:8px;text-align:right">'
+                f'Simulazione Monte Carlo dei risultati mancanti (livello Elo delle squadre) · '
+                f'si aggiorna a ogni risultato confermato</div>',
+                unsafe_allow_html=True)
+
+
 def _render_podio_live(state):
     podio = state.get("podio",[])
     st.markdown('<div style="text-align:center;margin-bottom:20px">'
@@ -744,30 +744,27 @@ def render_limited_card_html(card_data, size="normal", show_effects=True):
 DRAFT_DB_FILE = "mbt_draft_cards.json"
 
 
-# ── Google Sheets helpers per Draft ──────────────────────────────────────────
-# Chiave usata nel foglio:
-#   draft_db_meta        → carte draft/limited senza foto
+# ── Storage helpers per Draft ────────────────────────────────────────────────
+# Chiavi usate nello storage di data_manager (Google Sheets + SQLite locale):
+#   draft_db_meta        → metadati DB carte draft/limited + ordine (card_ids)
+#   carta_draft:<id>     → una carta draft senza foto (una riga per carta)
 #   foto_draft:<id>_... → foto di ogni carta draft (una riga per carta)
 # ─────────────────────────────────────────────────────────────────────────────
 
-def _draft_sheet_write(updates: dict):
+def _draft_storage_write(updates: dict):
     try:
-        from data_manager import _get_gsheet, _sheet_write
-        sheet = _get_gsheet()
-        if sheet:
-            _sheet_write(sheet, updates)
-            return True
+        from data_manager import storage_write
+        storage_write(updates)
+        return True
     except Exception:
         pass
     return False
 
 
-def _draft_sheet_read_all():
+def _draft_storage_read_all():
     try:
-        from data_manager import _get_gsheet, _sheet_read_all
-        sheet = _get_gsheet()
-        if sheet:
-            return _sheet_read_all(sheet)
+        from data_manager import storage_read_all
+        return storage_read_all()
     except Exception:
         pass
     return {}
@@ -775,39 +772,49 @@ def _draft_sheet_read_all():
 
 def _strip_foto_draft(db):
     import copy
+    from blob_store import put_b64
     db_light = copy.deepcopy(db)
     foto = {}
     for card in db_light.get("cards", []):
         cid = str(card.get("id", ""))
         for campo in ("foto_path_b64", "card_png_b64", "foto_b64"):
             if card.get(campo):
-                foto[f"foto_draft:{cid}_{campo}"] = card[campo]
+                foto[f"foto_draft:{cid}_{campo}"] = put_b64(card[campo])
                 card[campo] = None
     return db_light, foto
 
 
 def _restore_foto_draft(db, store):
+    from blob_store import get_b64
     for card in db.get("cards", []):
         cid = str(card.get("id", ""))
         for campo in ("foto_path_b64", "card_png_b64", "foto_b64"):
             k = f"foto_draft:{cid}_{campo}"
             if k in store:
-                card[campo] = store[k]
+                card[campo] = get_b64(store[k])
     return db
 
 
 def load_draft_db():
-    store = _draft_sheet_read_all()
+    store = _draft_storage_read_all()
     if store:
         from data_manager import _sheet_read_chunked
         val = _sheet_read_chunked(store, "draft_db_meta") or None
         if val:
             try:
                 db = json.loads(val)
+                if "card_ids" in db:
+                    # Formato a righe: una riga carta_draft:<id> per carta
+                    db["cards"] = []
+                    for cid in db.pop("card_ids"):
+                        raw = _sheet_read_chunked(store, f"carta_draft:{cid}")
+                        if raw:
+                            db["cards"].append(json.loads(raw))
                 db = _restore_foto_draft(db, store)
                 return db
             except Exception:
                 pass
+    # Migrazione dal vecchio file locale
     if Path(DRAFT_DB_FILE).exists():
         with open(DRAFT_DB_FILE, "r", encoding="utf-8") as f:
             return json.load(f)
@@ -816,11 +823,20 @@ def load_draft_db():
 
 def save_draft_db(db):
     db_light, foto = _strip_foto_draft(db)
+    cards = db_light.pop("cards", [])
+    db_light["card_ids"] = [str(c.get("id", "")) for c in cards]
     updates = {"draft_db_meta": json.dumps(db_light, ensure_ascii=False)}
+    for c in cards:
+        updates[f"carta_draft:{c.get('id', '')}"] = json.dumps(c, ensure_ascii=False)
     updates.update(foto)
-    _draft_sheet_write(updates)
-    with open(DRAFT_DB_FILE, "w", encoding="utf-8") as f:
-        json.dump(db, f, ensure_ascii=False, indent=2)
+    _draft_storage_write(updates)
+    # Righe di carte eliminate dal DB
+    ids = set(db_light["card_ids"])
+    try:
+        from data_manager import storage_delete_where
+        storage_delete_where(lambda k: k.startswith("carta_draft:") and k[len("carta_draft:"):] not in ids)
+    except Exception:
+        pass
 
 
 def _pick_draft_prize(difficulty_name: str, draft_db: dict, cards_db: dict) -> dict:
@@ -487,41 +487,28 @@ RIVALS_CSS = """
 
 # ─── DATA HELPERS ─────────────────────────────────────────────────────────────
 
-# ── Google Sheets helpers per Rivals ─────────────────────────────────────────
-# Usa lo stesso foglio e lo stesso sistema a righe chiave-valore di data_manager
+# ── Storage helpers per Rivals ───────────────────────────────────────────────
+# Usa lo storage chiave-valore di data_manager (Google Sheets + SQLite locale)
 # Chiavi usate:
 #   rivals_data          → dati giocatore (monete, livello, collezione, team)
-#   cards_db_meta        → tutte le carte senza foto
-#   foto_card:<id>       → foto di ogni carta (una riga per carta)
+#   cards_db_meta        → metadati DB carte + ordine (card_ids)
+#   carta:<id>           → una carta senza foto (una riga per carta)
+#   foto_card:<id>       → foto di ogni carta (riferimento blob, vedi blob_store.py)
 # ─────────────────────────────────────────────────────────────────────────────
 
-def _get_rivals_sheet():
+def _rivals_storage_write(updates: dict):
     try:
-        from data_manager import _get_gsheet
-        return _get_gsheet()
-    except Exception:
-        return None
-
-
-def _rivals_sheet_write(updates: dict):
-    sheet = _get_rivals_sheet()
-    if sheet is None:
-        return False
-    try:
-        from data_manager import _sheet_write
-        _sheet_write(sheet, updates)
+        from data_manager import storage_write
+        storage_write(updates)
         return True
     except Exception:
         return False
 
 
-def _rivals_sheet_read_all():
-    sheet = _get_rivals_sheet()
-    if sheet is None:
-        return {}
+def _rivals_storage_read_all():
     try:
-        from data_manager import _sheet_read_all
-        return _sheet_read_all(sheet)
+        from data_manager import storage_read_all
+        return storage_read_all()
     except Exception:
         return {}
 
@@ -529,38 +516,46 @@ def _rivals_sheet_read_all():
 def _strip_foto_cards(db):
     """Rimuove foto dalle carte e le ritorna come dict {foto_card:<id>_<campo>: b64}."""
     import copy
+    from blob_store import put_b64
     db_light = copy.deepcopy(db)
     foto = {}
     for card in db_light.get("cards", []):
         cid = str(card.get("id", ""))
         for campo in ("foto_path_b64", "card_png_b64", "foto_b64"):
             if card.get(campo):
-                foto[f"foto_card:{cid}_{campo}"] = card[campo]
+                foto[f"foto_card:{cid}_{campo}"] = put_b64(card[campo])
                 card[campo] = None
     return db_light, foto
 
 
 def _restore_foto_cards(db, store):
     """Reinserisce le foto nelle carte leggendo dal dict del foglio."""
+    from blob_store import get_b64
     for card in db.get("cards", []):
         cid = str(card.get("id", ""))
         for campo in ("foto_path_b64", "card_png_b64", "foto_b64"):
             k = f"foto_card:{cid}_{campo}"
             if k in store:
-                card[campo] = store[k]
+                card[campo] = get_b64(store[k])
     return db
 
 
 def load_rivals_data():
-    store = _rivals_sheet_read_all()
+    store = _rivals_storage_read_all()
     if store:
         from data_manager import _sheet_read_chunked
         val = _sheet_read_chunked(store, "rivals_data") or None
         if val:
             try:
-                return json.loads(val)
+                data = json.loads(val)
             except Exception:
-                pass
+                data = None
+            if data is not None:
+                # Acquisti e monete registrati dopo l'ultimo salvataggio
+                from event_log import riapplica
+                riapplica(data, "rivals", store)
+                return data
+    # Migrazione dal vecchio file locale
     if Path(RIVALS_FILE).exists():
         with open(RIVALS_FILE, "r", encoding="utf-8") as f:
             return json.load(f)
@@ -568,23 +563,31 @@ def load_rivals_data():
 
 
 def save_rivals_data(data):
-    _rivals_sheet_write({"rivals_data": json.dumps(data, ensure_ascii=False)})
-    with open(RIVALS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    if _rivals_storage_write({"rivals_data": json.dumps(data, ensure_ascii=False)}):
+        from event_log import compatta, MARCA
+        compatta("rivals", data.get(MARCA))
 
 
 def load_cards_db():
-    store = _rivals_sheet_read_all()
+    store = _rivals_storage_read_all()
     if store:
         from data_manager import _sheet_read_chunked
         val = _sheet_read_chunked(store, "cards_db_meta") or None
         if val:
             try:
                 db = json.loads(val)
+                if "card_ids" in db:
+                    # Formato a righe: una riga carta:<id> per carta
+                    db["cards"] = []
+                    for cid in db.pop("card_ids"):
+                        raw = _sheet_read_chunked(store, f"carta:{cid}")
+                        if raw:
+                            db["cards"].append(json.loads(raw))
                 db = _restore_foto_cards(db, store)
                 return db
             except Exception:
                 pass
+    # Migrazione dal vecchio file locale
     if Path(CARDS_DB_FILE).exists():
         with open(CARDS_DB_FILE, "r", encoding="utf-8") as f:
             return json.load(f)
@@ -593,11 +596,20 @@ def load_cards_db():
 
 def save_cards_db(db):
     db_light, foto = _strip_foto_cards(db)
+    cards = db_light.pop("cards", [])
+    db_light["card_ids"] = [str(c.get("id", "")) for c in cards]
     updates = {"cards_db_meta": json.dumps(db_light, ensure_ascii=False)}
+    for c in cards:
+        updates[f"carta:{c.get('id', '')}"] = json.dumps(c, ensure_ascii=False)
     updates.update(foto)
-    _rivals_sheet_write(updates)
-    with open(CARDS_DB_FILE, "w", encoding="utf-8") as f:
-        json.dump(db, f, ensure_ascii=False, indent=2)
+    _rivals_storage_write(updates)
+    # Righe di carte eliminate dal DB
+    ids = set(db_light["card_ids"])
+    try:
+        from data_manager import storage_delete_where
+        storage_delete_where(lambda k: k.startswith("carta:") and k[len("carta:"):] not in ids)
+    except Exception:
+        pass
 
 def empty_rivals_state():
     return {
@@ -1813,13 +1825,12 @@ def _render_shop_tab(rivals_data, cards_db):
                 disabled=not can_afford
             ):
                 st.session_state["opening_pack"] = pack_name
-                rivals_data["mbt_coins"] -= pack_info["price"]
                 drawn = draw_cards_from_pack(pack_name, cards_db)
                 st.session_state["drawn_cards"] = drawn
-                for card in drawn:
-                    cid = card.get("id", card.get("instance_id", ""))
-                    if cid:
-                        rivals_data["collection"].append(cid)
+                carte = [c.get("id", c.get("instance_id", "")) for c in drawn]
+                from event_log import emetti, PACCHETTO_APERTO
+                emetti(rivals_data, PACCHETTO_APERTO, pacchetto=pack_name,
+                       prezzo=pack_info["price"], carte=[cid for cid in carte if cid])
                 st.rerun()
 
     if st.session_state.get("drawn_cards"):
@@ -1887,8 +1898,8 @@ def _render_shop_tab(rivals_data, cards_db):
             if not already_learned:
                 if st.button("Apprendi", key="learn_{}".format(move["id"]),
                              disabled=not can_afford_move, use_container_width=True):
-                    rivals_data["special_moves_learned"].append(move["id"])
-                    rivals_data["mbt_coins"] -= move["cost_coins"]
+                    from event_log import emetti, MOSSA_APPRESA
+                    emetti(rivals_data, MOSSA_APPRESA, mossa=move["id"], costo=move["cost_coins"])
                     st.rerun()
 
 
@@ -1973,8 +1984,9 @@ def _render_powers_tab(rivals_data):
                 can_up = coins >= cost
                 if st.button("⬆️ Potenzia", key="up_power_{}".format(power["id"]),
                              disabled=not can_up, use_container_width=True):
-                    superpowers[power["id"]] = current_level + 1
-                    rivals_data["mbt_coins"] -= cost
+                    from event_log import emetti, SUPERPOTERE_POTENZIATO
+                    emetti(rivals_data, SUPERPOTERE_POTENZIATO, superpotere=power["id"],
+                           livello=current_level + 1, costo=cost)
                     st.rerun()
             else:
                 st.markdown('<div style="color:#ffd700;text-align:center;padding:20px 0">✅ MAX</div>',
@@ -2812,7 +2824,8 @@ def _render_coins_manager(rivals_data):
     with col1:
         add_coins = st.number_input("Aggiungi MBT Coins", 0, 99999, 500, key="admin_add_coins")
         if st.button("➕ Aggiungi Coins", key="admin_btn_coins"):
-            rivals_data["mbt_coins"] += add_coins
+            from event_log import emetti, MONETE_AGGIUNTE
+            emetti(rivals_data, MONETE_AGGIUNTE, monete=add_coins)
             st.success("✅ Aggiunti {} coins! Totale: {}".format(add_coins, rivals_data["mbt_coins"]))
     with col2:
         add_xp = st.number_input("Aggiungi XP", 0, 99999, 100, key="admin_add_xp")
@@ -2836,6 +2849,9 @@ def _render_coins_manager(rivals_data):
     if st.button("🔄 Reset Dati Rivals", key="admin_reset_rivals"):
         st.session_state.rivals_data = empty_rivals_state()
         st.session_state.rivals_data["mbt_coins"] = 1000
+        # Il reset assorbe gli eventi precedenti: non vanno riapplicati al prossimo load
+        from event_log import marca_snapshot
+        marca_snapshot(st.session_state.rivals_data, "rivals", _rivals_storage_read_all())
         save_rivals_data(st.session_state.rivals_data)
         st.success("✅ Dati resettati con 1000 Coins di partenza.")
         st.rerun()
@@ -0,0 +1,309 @@
+"""
+pronostici.py — Probabilità di qualificazione, semifinale e vittoria (Monte Carlo)
+Simula in blocco decine di migliaia di volte il resto del torneo: partite dei
+gironi non ancora giocate, classifica dei gironi (stesso ordine di
+classifica_girone), tabellone come genera_bracket_da_gironi e turni playoff
+fino alla finale. I risultati già confermati restano fissi.
+
+Motore NumPy: la probabilità di vincere un punto viene dal divario di Elo
+medio delle squadre (rating_engine). Per ogni coppia di squadre si calcola una
+volta la distribuzione esatta del punteggio finale di un set (vittoria a
+limit − k, o ai vantaggi), e ogni set simulato costa un'estrazione uniforme
+cercata nella cumulata: niente ciclo punto per punto.
+Il risultato è in cache finché non cambia un risultato confermato.
+"""
+import hashlib
+import json
+import math
+import threading
+
+import numpy as np
+
+SIMULAZIONI = 20000
+_SCALA_PUNTO = 2200.0      # 200 Elo di divario → 0.55 a punto → ~0.76 a set da 21, come l'attesa Elo
+_VANTAGGI_MAX = 8          # coppie di punti ai vantaggi modellate (la coda restante è trascurabile)
+_BUDGET_SET = 5_000_000    # set simulati per calcolo (~0.5 s): con tornei grandi si riducono le simulazioni
+_TIE_BREAK = 15
+
+_lock = threading.Lock()
+_cache = {"chiave": None, "risultato": None}
+
+
+# ─── DISTRIBUZIONE DEL SET ────────────────────────────────────────────────────
+
+def _tabella_set(p, limit):
+    """
+    Distribuzione del punteggio finale di un set per le probabilità di punto p
+    (array): (cdf [len(p), K], punti_1 [K], punti_2 [K]) sulle K categorie
+    "vince 1 a limit-k", "vince 2 a limit-k", "vantaggi j" per ciascuno.
+    """
+    p = np.asarray(p, dtype=float)[:, None]
+    q = 1.0 - p
+    k = np.arange(limit - 1)
+    comb = np.array([math.comb(limit - 1 + x, x) for x in k], dtype=float)
+    vince1 = comb * p ** limit * q ** k          # 1 arriva a limit con l'ultimo punto, 2 ne ha k
+    vince2 = comb * q ** limit * p ** k
+    # Ai vantaggi da (limit-1, limit-1): ogni coppia di punti chiude o si ripete
+    pari = math.comb(2 * limit - 2, limit - 1) * (p * q) ** (limit - 1)
+    j = np.arange(_VANTAGGI_MAX)
+    ripeti = (2 * p * q) ** j
+    vant1 = pari * ripeti * p ** 2
+    vant2 = pari * ripeti * q ** 2
+    prob = np.concatenate([vince1, vince2, vant1, vant2], axis=1)
+    prob /= prob.sum(axis=1, keepdims=True)
+    punti_1 = np.concatenate([np.full(limit - 1, limit), k, limit + 1 + j, limit - 1 + j])
+    punti_2 = np.concatenate([k, np.full(limit - 1, limit), limit - 1 + j, limit + 1 + j])
+    return np.cumsum(prob, axis=1), punti_1, punti_2
+
+
+class _Motore:
+    """Tabelle dei set per tutte le coppie di squadre e simulazione vettoriale delle partite."""
+
+    def __init__(self, elo, ghost, formato, pmax, rng):
+        self.n = len(elo)
+        self.ghost = ghost
+        self.formato = formato
+        self.pmax = pmax
+        self.rng = rng
+        divario = elo[:, None] - elo[None, :]
+        p = (1.0 / (1.0 + 10.0 ** (-divario / _SCALA_PUNTO))).ravel()
+        self.tabelle = {limit: _tabella_set(p, limit) for limit in {pmax, _TIE_BREAK}}
+
+    def _set(self, righe, limit):
+        cdf, punti_1, punti_2 = self.tabelle[limit]
+        u = self.rng.random(righe.shape[0])
+        if np.all(righe == righe[0]):
+            cat = np.searchsorted(cdf[righe[0]], u)
+        else:
+            cat = (cdf[righe] < u[:, None]).sum(axis=1)
+        cat = np.minimum(cat, cdf.shape[1] - 1)
+        return punti_1[cat], punti_2[cat]
+
+    def partita(self, a, b):
+        """
+        Partite tra le squadre a e b (array di indici, una per simulazione):
+        (vince_a, set_a, set_b, punti_a, punti_b). Le ghost perdono pmax-0 in un set.
+        """
+        righe = a * self.n + b
+        da_vincere = {"Best of 3": 2, "Best of 5": 3}.get(self.formato, 1)
+        set_a = np.zeros(len(a), dtype=np.int64)
+        set_b = np.zeros(len(a), dtype=np.int64)
+        punti_a = np.zeros(len(a), dtype=np.int64)
+        punti_b = np.zeros(len(a), dtype=np.int64)
+        for s in range(2 * da_vincere - 1):
+            in_gioco = (set_a < da_vincere) & (set_b < da_vincere)
+            if not in_gioco.any():
+                break
+            limit = _TIE_BREAK if da_vincere > 1 and s == 2 * da_vincere - 2 else self.pmax
+            pa, pb = self._set(righe, limit)
+            set_a += in_gioco & (pa > pb)
+            set_b += in_gioco & (pb > pa)
+            punti_a += np.where(in_gioco, pa, 0)
+            punti_b += np.where(in_gioco, pb, 0)
+        ga, gb = self.ghost[a], self.ghost[b]
+        finta = ga | gb
+        if finta.any():
+            set_a = np.where(finta, (~ga).astype(np.int64), set_a)
+            set_b = np.where(finta, ga.astype(np.int64), set_b)
+            punti_a = np.where(finta, np.where(ga, 0, self.pmax), punti_a)
+            punti_b = np.where(finta, np.where(ga, self.pmax, 0), punti_b)
+        return set_a > set_b, set_a, set_b, punti_a, punti_b
+
+
+# ─── SIMULAZIONE DEL TORNEO ───────────────────────────────────────────────────
+
+def _elo_squadre(state, squadre):
+    import rating_engine
+    from data_manager import get_atleta_by_id
+    out = []
+    for sq in squadre:
+        atleti = [a for a in (get_atleta_by_id(state, aid) for aid in sq.get("atleti", [])) if a]
+        out.append(sum(a["stats"].get("rating", {}).get("elo", rating_engine.RATING_BASE) for a in atleti)
+                   / len(atleti) if atleti else rating_engine.RATING_BASE)
+    return np.array(out, dtype=float)
+
+
+def _gironi(state, motore, idx, S):
+    """Classifiche simulate dei gironi: lista di array [S, squadre reali del girone] in ordine."""
+    # Statistiche [squadra, simulazione]: ogni partita aggiorna due righe contigue
+    squadre = state.get("squadre", [])
+    base = np.array([[sq.get("punti_classifica", 0), sq.get("vittorie", 0),
+                      sq.get("set_vinti", 0) - sq.get("set_persi", 0),
+                      sq.get("punti_fatti", 0) - sq.get("punti_subiti", 0)] for sq in squadre], dtype=np.int64)
+    pc, vit, dset, dpun = (np.repeat(base[:, c:c + 1], S, axis=1) for c in range(4))
+    for g in state.get("gironi", []):
+        for p in g.get("partite", []):
+            if p.get("confermata") or p.get("sq1") not in idx or p.get("sq2") not in idx:
+                continue
+            a, b = idx[p["sq1"]], idx[p["sq2"]]
+            vince, sa, sb, pa, pb = motore.partita(np.full(S, a), np.full(S, b))
+            pc[a] += np.where(vince, 3, 1)
+            pc[b] += np.where(vince, 1, 3)
+            vit[a] += vince
+            vit[b] += ~vince
+            dset[a] += sa - sb
+            dset[b] += sb - sa
+            dpun[a] += pa - pb
+            dpun[b] += pb - pa
+    classifiche = []
+    for g in state.get("gironi", []):
+        membri = np.array([idx[sid] for sid in g.get("squadre", [])
+                           if sid in idx and not motore.ghost[idx[sid]]], dtype=np.int64)
+        if not len(membri):
+            continue
+        # Stesso ordine di classifica_girone (a parità resta l'ordine del girone)
+        ordine = np.lexsort((np.broadcast_to(np.arange(len(membri)), (S, len(membri))),
+                             -dpun[membri].T, -dset[membri].T, -vit[membri].T, -pc[membri].T), axis=-1)
+        classifiche.append(membri[ordine])
+    return classifiche
+
+
+def _turni_reali(state, idx):
+    """{(livello, slot): (indice squadra 1, indice squadra 2, indice vincitore o None)} delle partite playoff."""
+    from calendario import ordine_tabellone
+    turni, nomi = {}, []
+    for p in state.get("bracket", []):
+        r = p.get("round", "Playoff")
+        if r not in turni:
+            turni[r] = []
+            nomi.append(r)
+        turni[r].append(p)
+    reali = {}
+    for livello, nome in enumerate(nomi):
+        for k, p in enumerate(ordine_tabellone(turni[nome])):
+            vincitore = p.get("vincitore") if p.get("confermata") else None
+            reali[(livello, p.get("slot", k))] = (idx.get(p.get("sq1"), -1), idx.get(p.get("sq2"), -1),
+                                                  idx.get(vincitore) if vincitore else None)
+    finale = next((p for p in state.get("bracket_extra", [])
+                   if p.get("round") == "🏆 FINALE 1°/2° Posto" and p.get("confermata")), None)
+    return reali, (idx.get(finale.get("vincitore")) if finale else None)
+
+
+def simula(state, n=SIMULAZIONI, seme=0):
+    """
+    {id squadra: {"qualificazione", "semifinale", "vittoria"}} (probabilità 0-1)
+    per le squadre reali del torneo in corso. In Girone Unico qualificazione
+    è None, semifinale = prime quattro e vittoria = primo posto.
+    """
+    from data_manager import _bracket_size_from_n
+    squadre = state.get("squadre", [])
+    if not squadre:
+        return {}
+    torneo = state.get("torneo", {})
+    idx = {sq["id"]: i for i, sq in enumerate(squadre)}
+    ghost = np.array([bool(sq.get("is_ghost")) for sq in squadre])
+    formato = torneo.get("formato_set", "Set Unico")
+    pmax = int(torneo.get("punteggio_max", 21))
+    da_giocare = sum(1 for g in state.get("gironi", []) for p in g.get("partite", []) if not p.get("confermata"))
+    set_per_partita = {"Best of 3": 3, "Best of 5": 5}.get(formato, 1)
+    S = max(500, min(n, _BUDGET_SET // max(1, (da_giocare + len(squadre)) * set_per_partita)))
+    rng = np.random.default_rng(seme)
+    motore = _Motore(_elo_squadre(state, squadre), ghost, formato, pmax, rng)
+
+    T = len(squadre)
+    qualif = np.zeros(T)
+    semi = np.zeros(T)
+    vittorie = np.zeros(T)
+    reali, vincitore_finale = _turni_reali(state, idx)
+    girone_unico = torneo.get("modalita") == "Girone Unico"
+
+    if girone_unico or not state.get("bracket"):
+        classifiche = _gironi(state, motore, idx, S)
+        if girone_unico:
+            if classifiche:
+                c = classifiche[0]
+                np.add.at(vittorie, c[:, 0], 1)
+                np.add.at(semi, c[:, :4].ravel(), 1)
+            return _probabilita(squadre, None, semi / S, vittorie / S)
+        passano = int(torneo.get("squadre_per_girone_passano", 2))
+        # Prima tutte le prime, poi tutte le seconde... (genera_bracket_da_gironi)
+        colonne = [c[:, pos] for pos in range(passano) for c in classifiche if pos < c.shape[1]]
+        if not colonne:
+            return _probabilita(squadre, qualif, semi, vittorie)
+        qualificate = np.stack(colonne, axis=1)
+        np.add.at(qualif, qualificate.ravel(), 1)
+        dimensione = _bracket_size_from_n(qualificate.shape[1])
+        seeded = np.full((S, dimensione), -1, dtype=np.int64)
+        seeded[:, :qualificate.shape[1]] = qualificate
+        sq1 = seeded[:, :dimensione // 2]
+        sq2 = seeded[:, ::-1][:, :dimensione // 2]
+    else:
+        primo = sorted((k, v) for k, v in reali.items() if k[0] == 0)
+        sq1 = np.tile([v[0] for _k, v in primo], (S, 1))
+        sq2 = np.tile([v[1] for _k, v in primo], (S, 1))
+        in_tabellone = {i for _k, v in primo for i in v[:2] if i >= 0 and not ghost[i]}
+        qualif[list(in_tabellone)] = S
+
+    livello = 0
+    while True:
+        m = sq1.shape[1]
+        if m <= 2:
+            presenti = np.concatenate([sq1, sq2], axis=1).ravel()
+            np.add.at(semi, presenti[presenti >= 0], 1)
+        vincenti = _turno(motore, sq1, sq2, reali, livello)
+        if m == 1:
+            vincenti = vincenti[:, 0]
+            break
+        if m == 2:
+            # Finale tra i vincitori delle semifinali
+            if vincitore_finale is not None:
+                vincenti = np.full(S, vincitore_finale)
+            else:
+                vince, *_ = motore.partita(np.maximum(vincenti[:, 0], 0), np.maximum(vincenti[:, 1], 0))
+                vincenti = np.where(vince, vincenti[:, 0], vincenti[:, 1])
+            break
+        sq1, sq2 = vincenti[:, 0::2], vincenti[:, 1::2]
+        livello += 1
+    np.add.at(vittorie, vincenti[vincenti >= 0], 1)
+    return _probabilita(squadre, qualif / S, semi / S, vittorie / S)
+
+
+def _turno(motore, sq1, sq2, reali, livello):
+    """Vincenti [S, partite] di un turno; -1 = BYE (vince l'altra squadra)."""
+    vincenti = np.empty_like(sq1)
+    for k in range(sq1.shape[1]):
+        a, b = sq1[:, k], sq2[:, k]
+        reale = reali.get((livello, k))
+        if reale is not None and reale[2] is not None:
+            vincenti[:, k] = reale[2]
+            continue
+        bye_a, bye_b = a < 0, b < 0
+        vince, *_ = motore.partita(np.maximum(a, 0), np.maximum(b, 0))
+        vincenti[:, k] = np.where(bye_b | (~bye_a & vince), a, b)
+    return vincenti
+
+
+def _probabilita(squadre, qualif, semi, vittorie):
+    out = {}
+    for i, sq in enumerate(squadre):
+        if sq.get("is_ghost"):
+            continue
+        out[sq["id"]] = {"qualificazione": None if qualif is None else float(qualif[i]),
+                         "semifinale": float(semi[i]), "vittoria": float(vittorie[i])}
+    return out
+
+
+# ─── CACHE ────────────────────────────────────────────────────────────────────
+
+def _firma(state):
+    """Cambia solo quando cambia qualcosa che sposta le probabilità (risultati, squadre, tabellone)."""
+    partite = [p for g in state.get("gironi", []) for p in g.get("partite", [])]
+    partite += state.get("bracket", []) + state.get("bracket_extra", [])
+    dati = [[sq["id"] for sq in state.get("squadre", [])],
+            [[p.get("id"), p.get("sq1"), p.get("sq2"), p.get("vincitore") if p.get("confermata") else None]
+             for p in partite],
+            {k: state.get("torneo", {}).get(k) for k in ("modalita", "formato_set", "punteggio_max",
+                                                          "squadre_per_girone_passano")}]
+    return hashlib.blake2b(json.dumps(dati).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def probabilita(state, n=SIMULAZIONI):
+    """simula() in cache: si ricalcola solo dopo un nuovo risultato (seme fisso = numeri stabili)."""
+    chiave = (_firma(state), n)
+    with _lock:
+        if _cache["chiave"] == chiave:
+            return _cache["risultato"]
+    risultato = simula(state, n, seme=int(chiave[0], 16) & 0xFFFFFFFF)
+    with _lock:
+        _cache.update(chiave=chiave, risultato=risultato)
+    return risultato
@@ -6,54 +6,19 @@ import streamlit as st
 import pandas as pd
 from data_manager import (
     get_atleta_by_id, get_squadra_by_id, save_state,
-    calcola_overall_fifa, get_card_type, get_trofei_atleta, TROFEI_DEFINIZIONE
+    calcola_overall_fifa, get_card_type, get_trofei_atleta, data_trofeo, TROFEI_DEFINIZIONE,
+    get_ranking, punti_voce, regole_punteggio, _parse_storico_entry,
+    get_ranking_finestra, FINESTRE_RANKING
 )
 
 
-def calcola_punti_ranking(pos, n_squadre):
-    pts_massimi = n_squadre * 10
-    return max(10, pts_massimi - ((pos - 1) * 10))
-
-
-def build_ranking_data(state):
-    atleti_stats = []
-    for a in state["atleti"]:
-        s = a["stats"]
-        # Nuovi atleti partono con overall 40 (bronzo_raro) anche senza tornei
-        rank_pts = 0
-        for entry in s["storico_posizioni"]:
-            if len(entry) == 3:
-                tn, pos, n_sq = entry
-            else:
-                tn, pos = entry
-                n_sq = _get_n_squadre_torneo(state, tn)
-            rank_pts += calcola_punti_ranking(pos, n_sq)
-        quoziente_punti = round(s["punti_fatti"] / max(s["set_vinti"] + s["set_persi"], 1), 2)
-        quoziente_set = round(s["set_vinti"] / max(s["set_persi"], 1), 2)
-        win_rate = round(s["vittorie"] / max(s["tornei"], 1) * 100, 1) if s["tornei"] > 0 else 0
-        def _pos(entry): return entry[1]
-        medaglie_oro = sum(1 for e in s["storico_posizioni"] if _pos(e) == 1)
-        medaglie_argento = sum(1 for e in s["storico_posizioni"] if _pos(e) == 2)
-        medaglie_bronzo = sum(1 for e in s["storico_posizioni"] if _pos(e) == 3)
-        overall = calcola_overall_fifa(a)
-        card_type = get_card_type(overall, s["tornei"], s["vittorie"])
-        atleti_stats.append({
-            "atleta": a, "id": a["id"], "nome": a["nome"],
-            "tornei": s["tornei"], "vittorie": s["vittorie"], "sconfitte": s["sconfitte"],
-            "set_vinti": s["set_vinti"], "set_persi": s["set_persi"],
-            "punti_fatti": s["punti_fatti"], "punti_subiti": s["punti_subiti"],
-            "quoziente_punti": quoziente_punti, "quoziente_set": quoziente_set,
-            "win_rate": win_rate, "rank_pts": rank_pts,
-            "oro": medaglie_oro, "argento": medaglie_argento, "bronzo": medaglie_bronzo,
-            "storico": s["storico_posizioni"],
-            "overall": overall, "card_type": card_type,
-        })
-    atleti_stats.sort(key=lambda x: (-x["rank_pts"], -x["oro"], -x["argento"], -x["win_rate"]))
-    return atleti_stats
-
-
-def _get_n_squadre_torneo(state, torneo_nome):
-    return max(len(state["squadre"]), 4)
+def build_ranking_data(state, finestra="sempre", n=10):
+    """
+    Ranking ordinato dalla tabella materializzata (vedi data_manager.get_ranking).
+    finestra: una chiave di FINESTRE_RANKING; le finestre di tempo sommano i
+    bucket mensili precalcolati (n = tornei contati per "ultimi_n").
+    """
+    return get_ranking_finestra(state, finestra, n)
 
 
 def render_ranking_page(state):
@@ -473,13 +438,27 @@ def _render_carte_fifa(state, ranking):
 
 
 def _render_classifica_completa(state, ranking):
-    n_sq = len(state["squadre"])
+    import career_engine
+    fc1, fc2 = st.columns([3, 1])
+    with fc1:
+        finestra = st.radio("Periodo", list(FINESTRE_RANKING), format_func=FINESTRE_RANKING.get,
+                            horizontal=True, key="ranking_finestra")
+    with fc2:
+        n_ultimi = st.number_input("N tornei", 1, 10, 5, key="ranking_ultimi_n",
+                                   disabled=finestra != "ultimi_n")
+    if finestra != "sempre":
+        ranking = build_ranking_data(state, finestra, n_ultimi)
+        if not ranking:
+            st.info("Nessun torneo disputato nel periodo selezionato.")
+            return
+    regole = regole_punteggio(state)
+    totale = "somma dei tornei nel periodo" if finestra != "sempre" else career_engine.ETICHETTE_TOTALI[regole["totale"]].lower()
     st.markdown(f"""
     <div style="background:var(--bg-card2);border:1px solid var(--border);border-radius:var(--radius,12px);
         padding:12px 20px;margin-bottom:20px;font-size:0.8rem;color:var(--text-secondary)">
-        💡 <strong>Formula punti:</strong> {n_sq} squadre × 10 =
-        <strong style="color:var(--accent-gold)">{n_sq*10} pt per il 1°</strong>
-        · Ogni posizione successiva: -10 pt
+        💡 <strong>Formula punti:</strong>
+        <strong style="color:var(--accent-gold)">{career_engine.ETICHETTE_FORMULE[regole["formula"]]}</strong>
+        · Totale: {totale}
     </div>
     """, unsafe_allow_html=True)
 
@@ -511,7 +490,7 @@ def _render_classifica_completa(state, ranking):
     <table class="rank-table">
     <tr>
         <th>#</th><th style="text-align:left">ATLETA</th>
-        <th>OVR</th><th>PTS RANK</th><th>T</th><th>V</th><th>P</th>
+        <th>OVR</th><th>PTS RANK</th><th>ELO</th><th>T</th><th>V</th><th>P</th>
         <th>SV</th><th>SP</th><th>WIN%</th>
     </tr>"""
     pos_cls = {1: "gold", 2: "silver", 3: "bronze"}
@@ -528,6 +507,7 @@ def _render_classifica_completa(state, ranking):
             </td>
             <td style="font-weight:800;color:var(--accent-gold)">{a['overall']}</td>
             <td style="font-weight:700;color:var(--accent-gold)">{a['rank_pts']}</td>
+            <td>{a.get('elo', 1500)}</td>
             <td>{a['tornei']}</td>
             <td style="color:var(--green)">{a['vittorie']}</td>
             <td style="color:var(--accent-red)">{a['sconfitte']}</td>
@@ -585,7 +565,7 @@ def _render_trofei_page(state, ranking):
                     {trofeo['descrizione']}</div>
                 <div style="margin-top:8px;font-size:0.55rem;font-weight:700;letter-spacing:2px;text-transform:uppercase;
                     color:{'rgba(0,0,0,0.6)' if sbloccato else tc}">{trofeo['rarità'].upper()}</div>
-                {'<div style="margin-top:6px;font-size:0.8rem;font-weight:700;color:rgba(0,0,0,0.8)">✓ SBLOCCATO</div>' if sbloccato else '<div style="margin-top:6px;font-size:0.7rem;color:var(--text-secondary)">🔒 Bloccato</div>'}
+                {f'<div style="margin-top:6px;font-size:0.8rem;font-weight:700;color:rgba(0,0,0,0.8)">✓ SBLOCCATO {data_trofeo(atleta, trofeo["id"]) or ""}</div>' if sbloccato else '<div style="margin-top:6px;font-size:0.7rem;color:var(--text-secondary)">🔒 Bloccato</div>'}
             </div>
             """, unsafe_allow_html=True)
     st.divider()
@@ -605,7 +585,7 @@ def _render_global_trophy_board(state, ranking):
         html += f'<tr><td style="text-align:left;font-weight:700">{atleta["nome"]}</td>'
         for trofeo, sbloccato in trofei:
             if sbloccato:
-                html += f'<td title="{trofeo["nome"]}">✅</td>'
+                html += f'<td title="{trofeo["nome"]} · {data_trofeo(atleta, trofeo["id"]) or ""}">✅</td>'
             else:
                 html += '<td style="opacity:0.2">🔒</td>'
         html += '</tr>'
@@ -698,12 +678,15 @@ def _render_schede_atleti(state, ranking, atleta_id_preselect=None):
             """, unsafe_allow_html=True)
 
     if a["storico"]:
+        # Punti delle voci: quelli salvati a fine torneo (pipeline unica in career_engine)
+        formula = regole_punteggio(state)["formula"]
+        voci = [_parse_storico_entry(e) for e in a["storico"]]
         col1, col2 = st.columns(2)
         with col1:
             st.markdown("#### 📈 Andamento Posizioni")
             df_pos = pd.DataFrame({
-                "Torneo": [e[0] for e in a["storico"]],
-                "Posizione": [e[1] for e in a["storico"]]
+                "Torneo": [e["nome"] for e in voci],
+                "Posizione": [e["pos"] for e in voci]
             }).set_index("Torneo")
             max_pos = df_pos["Posizione"].max()
             df_pos["Inv"] = max_pos + 1 - df_pos["Posizione"]
@@ -711,21 +694,82 @@ def _render_schede_atleti(state, ranking, atleta_id_preselect=None):
             st.caption("↑ = Migliore posizione")
         with col2:
             st.markdown("#### 📊 Punti per Torneo")
-            storico_pts = []
-            for entry in a["storico"]:
-                t_nome, pos = entry[0], entry[1]
-                n_sq_e = entry[2] if len(entry) == 3 else (len(state["squadre"]) or 8)
-                storico_pts.append({"Torneo": t_nome, "Punti": calcola_punti_ranking(pos, n_sq_e)})
+            storico_pts = [{"Torneo": e["nome"], "Punti": punti_voce(e, formula)} for e in voci]
             df_pts = pd.DataFrame(storico_pts).set_index("Torneo")
             st.bar_chart(df_pts, height=200, color="#ffd700")
+        rating_storico = a["atleta"]["stats"].get("rating_storico", [])
+        if rating_storico:
+            st.markdown("#### 📉 Rating Elo partita per partita")
+            df_elo = pd.DataFrame({"Elo": [r[2] for r in rating_storico]})
+            st.line_chart(df_elo, height=180, color="#00c8ff")
+            valutate = a["atleta"]["stats"].get("rating", {}).get("partite", len(rating_storico))
+            st.caption(f"Elo attuale {a.get('elo', 1500)} · {valutate} partite valutate"
+                       + (f" (grafico: ultime {len(rating_storico)})" if valutate > len(rating_storico) else ""))
         st.markdown("#### 📋 Storico Tornei")
         medals = {1: "🥇", 2: "🥈", 3: "🥉"}
-        for entry in a["storico"]:
-            t_nome, pos = entry[0], entry[1]
-            n_sq_entry = entry[2] if len(entry) == 3 else (len(state["squadre"]) or 8)
+        for e in voci:
+            t_nome, pos = e["nome"], e["pos"]
             icon = medals.get(pos, f"#{pos}")
-            pts = calcola_punti_ranking(pos, n_sq_entry)
+            pts = punti_voce(e, formula)
             st.markdown(f"• {icon} **{t_nome}** — {pos}° posto → +{pts} pt ranking")
+        _render_partite_archiviate(a["atleta"])
+    _render_compagni_avversari(state, a["atleta"])
+
+
+def _render_compagni_avversari(state, atleta):
+    """Intesa con i compagni e scontri diretti (indice scontri_diretti, lookup)."""
+    import scontri_diretti
+    nomi = {x["id"]: x["nome"] for x in state.get("atleti", [])}
+    migliori = scontri_diretti.migliori_compagni(atleta["id"], state)
+    if not migliori:
+        return
+    st.markdown("#### 🤝 Compagni e Avversari")
+    st.dataframe(pd.DataFrame([{
+        "Compagno": nomi.get(b, b), "Partite": r["partite"], "Vinte": r["vinte"],
+        "Win %": r["win_rate"], "Diff. set": r["diff_set"], "Diff. punti": r["diff_punti"],
+    } for b, r in migliori]), hide_index=True, use_container_width=True)
+    altri = [aid for aid in nomi if aid != atleta["id"]]
+    if not altri:
+        return
+    avv = st.selectbox("Scontri diretti contro", altri, format_func=nomi.get, key=f"h2h_sel_{atleta['id']}")
+    r = scontri_diretti.scontri_diretti(atleta["id"], avv, state)
+    if r["partite"]:
+        st.markdown(f"**{r['vinte']}–{r['perse']}** in {r['partite']} partite · set {r['set_fatti']}-{r['set_subiti']} "
+                    f"· punti {r['punti_fatti']}-{r['punti_subiti']}")
+    else:
+        st.caption("Nessuno scontro diretto registrato.")
+
+
+def _render_partite_archiviate(atleta):
+    """Partite dell'atleta nei tornei archiviati: si carica solo il torneo scelto."""
+    import archivio_tornei
+    tornei = archivio_tornei.indice(atleta["id"])
+    if not tornei:
+        return
+    st.markdown("#### 🗂️ Partite Archiviate")
+    etichette = {v["id"]: f"{v.get('data') or '—'} · {v.get('nome') or 'Torneo'}" for v in reversed(tornei)}
+    tid = st.selectbox("Torneo", list(etichette), format_func=etichette.get, key=f"archivio_sel_{atleta['id']}")
+    record = archivio_tornei.carica(tid)
+    if not record:
+        return
+    squadre = {sid: (nome, ids) for sid, nome, ids, _ghost in record["squadre"]}
+    mie = {sid for sid, (_nome, ids) in squadre.items() if atleta["id"] in ids}
+    righe = []
+    for p in archivio_tornei.partite(record):
+        if p["sq1"] not in mie and p["sq2"] not in mie:
+            continue
+        set_str = " ".join(f"{x[0]}-{x[1]}" for x in (p.get("punteggi") or []))
+        righe.append({
+            "Fase": p.get("round") or p.get("girone") or p.get("fase") or "",
+            "Partita": f"{squadre.get(p['sq1'], ('?',))[0]} vs {squadre.get(p['sq2'], ('?',))[0]}",
+            "Set": f"{p.get('set_sq1', 0)}-{p.get('set_sq2', 0)}",
+            "Punteggi": set_str,
+            "Esito": "✅" if p.get("vincitore") in mie else "❌",
+            "Campo": p.get("campo") or "",
+            "Orario": p.get("orario_schedulato") or "",
+        })
+    if righe:
+        st.dataframe(pd.DataFrame(righe), hide_index=True, use_container_width=True)
 
 
 def _render_modifica_profilo(state, atleta):
@@ -0,0 +1,175 @@
+"""
+rating_engine.py — Rating Elo degli atleti dalle singole partite
+Ogni partita confermata (gironi, bracket, bracket_extra) aggiorna il rating di
+tutti gli atleti delle due squadre: la forza di una squadra è la media dei
+rating dei suoi atleti, e ogni atleta si sposta di K × (risultato − atteso).
+K dipende dalle partite già giocate dall'atleta (stile TrueSkill: chi ha pochi
+risultati è incerto e si muove di più, poi si assesta).
+
+  - incrementale: aggiorna_partita() a ogni conferma, O(1) per partita
+  - batch:        riclassifica() riparte da zero e rigioca tutte le partite,
+                  vettoriale per strati di partite senza atleti in comune
+
+Per ogni atleta: stats["rating"] = {"elo", "partite"} e stats["rating_storico"]
+= [[data, id partita, elo dopo la partita], ...] con le ultime _STORICO_MAX
+partite (la storia completa sta nell'archivio dei tornei).
+Le partite con "classifica" False (simulate fuori ranking) non contano.
+"""
+import numpy as np
+
+RATING_BASE = 1500.0
+_SCALA = 400.0
+_K_MAX = 48.0
+_K_MIN = 16.0
+_PARTITE_ASSESTAMENTO = 20   # dopo ~20 partite K è a metà strada verso _K_MIN
+_STORICO_MAX = 200           # voci di rating_storico tenute nel documento dell'atleta
+
+
+def fattore_k(partite):
+    """K di un atleta con il numero di partite indicato (scalare o array)."""
+    return np.maximum(_K_MIN, _K_MAX / (1 + np.asarray(partite) / _PARTITE_ASSESTAMENTO))
+
+
+def atteso(r1, r2):
+    """Probabilità attesa di vittoria della squadra con rating r1 contro r2."""
+    return 1.0 / (1.0 + 10.0 ** ((np.asarray(r2) - np.asarray(r1)) / _SCALA))
+
+
+def rating_atleta(atleta):
+    """stats["rating"] dell'atleta (creato al valore base se manca)."""
+    return atleta["stats"].setdefault("rating", {"elo": RATING_BASE, "partite": 0})
+
+
+# ─── AGGIORNAMENTO INCREMENTALE ───────────────────────────────────────────────
+
+def _atleti_squadra(state, sid):
+    from data_manager import get_squadra_by_id, get_atleta_by_id
+    sq = get_squadra_by_id(state, sid)
+    if not sq or sq.get("is_ghost"):
+        return []
+    return [a for a in (get_atleta_by_id(state, aid) for aid in sq.get("atleti", [])) if a]
+
+
+def aggiorna_partita(state, partita, data=None):
+    """
+    Applica ai rating il risultato di una partita confermata.
+    Partite contro squadre ghost, senza vincitore o fuori classifica non contano.
+    """
+    if not partita.get("vincitore") or partita.get("classifica") is False:
+        return
+    t1 = _atleti_squadra(state, partita.get("sq1"))
+    t2 = _atleti_squadra(state, partita.get("sq2"))
+    if not t1 or not t2:
+        return
+    data = data or state.get("torneo", {}).get("data", "")
+    r1 = sum(rating_atleta(a)["elo"] for a in t1) / len(t1)
+    r2 = sum(rating_atleta(a)["elo"] for a in t2) / len(t2)
+    e1 = float(atteso(r1, r2))
+    s1 = 1.0 if partita["vincitore"] == partita["sq1"] else 0.0
+    for squadra, delta in ((t1, s1 - e1), (t2, e1 - s1)):
+        for a in squadra:
+            r = rating_atleta(a)
+            r["elo"] += float(fattore_k(r["partite"])) * delta
+            r["partite"] += 1
+            storico = a["stats"].setdefault("rating_storico", [])
+            storico.append([data, partita.get("id"), round(r["elo"], 1)])
+            del storico[:-_STORICO_MAX]
+
+
+# ─── RICALCOLO BATCH ──────────────────────────────────────────────────────────
+
+def partite_da_state(state):
+    """
+    Partite confermate dello state come record per riclassifica():
+    {"id", "data", "sq1": [id atleti], "sq2": [id atleti], "vince_sq1": bool}.
+    """
+    from data_manager import get_squadra_by_id
+    data = state.get("torneo", {}).get("data", "")
+    tutte = [p for g in state.get("gironi", []) for p in g.get("partite", [])]
+    tutte += state.get("bracket", []) + state.get("bracket_extra", [])
+    out = []
+    for p in tutte:
+        if not p.get("confermata") or not p.get("vincitore") or p.get("classifica") is False:
+            continue
+        sq1, sq2 = get_squadra_by_id(state, p.get("sq1")), get_squadra_by_id(state, p.get("sq2"))
+        if not sq1 or not sq2 or sq1.get("is_ghost") or sq2.get("is_ghost"):
+            continue
+        out.append({"id": p.get("id"), "data": data, "sq1": list(sq1["atleti"]),
+                    "sq2": list(sq2["atleti"]), "vince_sq1": p["vincitore"] == p["sq1"]})
+    return out
+
+
+def _strati(partite, n_max):
+    """Strato di ogni partita: 1 + ultimo strato dei suoi atleti (ordine per atleta preservato)."""
+    ultimo = [0] * n_max
+    strato = np.empty(len(partite), dtype=np.int64)
+    for i, (g1, g2) in enumerate(partite):
+        giocatori = g1 + g2
+        s = max(ultimo[g] for g in giocatori) + 1
+        strato[i] = s
+        for g in giocatori:
+            ultimo[g] = s
+    return strato
+
+
+def riclassifica(atleti, partite):
+    """
+    Rating da zero per tutti gli atleti rigiocando le partite nell'ordine dato.
+    Le partite di uno stesso strato non hanno atleti in comune: si calcolano
+    insieme con NumPy e il risultato è identico all'applicazione una per una.
+    Scrive stats["rating"] e stats["rating_storico"] (ultime _STORICO_MAX) di ogni atleta.
+    """
+    indice = {a["id"]: i for i, a in enumerate(atleti)}
+    validi = []
+    for p in partite:
+        g1 = [indice[x] for x in p["sq1"] if x in indice]
+        g2 = [indice[x] for x in p["sq2"] if x in indice]
+        if g1 and g2 and not set(g1) & set(g2):
+            validi.append((p, g1, g2))
+
+    n = len(atleti)
+    elo = np.full(n, RATING_BASE)
+    giocate = np.zeros(n, dtype=np.int64)
+    storia_p, storia_a, storia_elo = [], [], []
+    if validi:
+        larghezza = max(max(len(g1), len(g2)) for _p, g1, g2 in validi)
+
+        def _matrice(gruppi):
+            m = np.full((len(gruppi), larghezza), -1, dtype=np.int64)
+            for i, g in enumerate(gruppi):
+                m[i, :len(g)] = g
+            return m
+
+        T1 = _matrice([g1 for _p, g1, _g2 in validi])
+        T2 = _matrice([g2 for _p, _g1, g2 in validi])
+        S1 = np.array([1.0 if p["vince_sq1"] else 0.0 for p, _g1, _g2 in validi])
+        strato = _strati([(g1, g2) for _p, g1, g2 in validi], n)
+
+        for s in np.unique(strato):
+            righe = np.flatnonzero(strato == s)
+            t1, t2 = T1[righe], T2[righe]
+            m1, m2 = t1 >= 0, t2 >= 0
+            r1 = np.where(m1, elo[t1], 0.0).sum(axis=1) / m1.sum(axis=1)
+            r2 = np.where(m2, elo[t2], 0.0).sum(axis=1) / m2.sum(axis=1)
+            e1 = atteso(r1, r2)
+            for t, m, delta in ((t1, m1, S1[righe] - e1), (t2, m2, e1 - S1[righe])):
+                chi = t[m]
+                # Nessun atleta compare due volte nello strato: assegnazione diretta
+                elo[chi] += fattore_k(giocate[chi]) * np.broadcast_to(delta[:, None], t.shape)[m]
+                giocate[chi] += 1
+                storia_p.append(np.broadcast_to(righe[:, None], t.shape)[m])
+                storia_a.append(chi)
+                storia_elo.append(elo[chi])
+
+    storico = {i: [] for i in range(n)}
+    if storia_p:
+        sp, sa, se = np.concatenate(storia_p), np.concatenate(storia_a), np.concatenate(storia_elo)
+        ordine = np.lexsort((sp, sa))
+        for i_p, i_a, v in zip(sp[ordine].tolist(), sa[ordine].tolist(), se[ordine].tolist()):
+            p = validi[i_p][0]
+            storico[i_a].append([p.get("data", ""), p.get("id"), round(v, 1)])
+
+    for i, a in enumerate(atleti):
+        a["stats"]["rating"] = {"elo": float(elo[i]), "partite": int(giocate[i])}
+        a["stats"]["rating_storico"] = storico[i][-_STORICO_MAX:]
+    return atleti
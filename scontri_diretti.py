@@ -0,0 +1,164 @@
+"""
+scontri_diretti.py — Indice scontri diretti e intesa tra compagni
+Indice precalcolato sulle partite dei tornei archiviati più quelle confermate
+nel torneo in corso:
+  - coppia di avversari (a, b) → partite, vittorie, differenza set e punti
+  - atleta → compagno → partite, vittorie, differenza set e punti
+Si costruisce una volta per processo dall'archivio (archivio_tornei) e si
+aggiorna a ogni partita confermata (riduttore partita_confermata); le query
+sono lookup su dict. Ogni partita è registrata una sola volta, con chiave
+(id torneo, id partita): quando il torneo in corso viene archiviato le sue
+partite sono già nell'indice e non vengono contate di nuovo.
+Le partite simulate fuori classifica ("classifica" False) non entrano
+nell'indice, come per classifiche e rating.
+"""
+import threading
+import time
+
+_RISINCRONIZZA_DOPO = 60   # secondi tra due controlli di nuovi tornei archiviati
+
+_lock = threading.RLock()
+_avversari = {}      # {(a, b) con a < b: [partite, vinte_a, set_a, set_b, punti_a, punti_b]}
+_compagni = {}       # {a: {b: [partite, vinte, set_fatti, set_subiti, punti_fatti, punti_subiti]}}
+_viste = set()       # {(id torneo, id partita)} già registrate
+_archiviati = set()  # id dei tornei archiviati già letti
+_sync = {"ts": 0.0, "torneo": None}
+
+
+def _registra(tid, partita, t1, t2):
+    """
+    Aggiunge all'indice una partita tra le squadre di atleti t1 e t2 (una volta
+    sola). Le simulate fuori classifica non contano.
+    """
+    chiave = (tid, partita.get("id"))
+    if (chiave in _viste or not partita.get("vincitore") or partita.get("classifica") is False
+            or not t1 or not t2):
+        return
+    _viste.add(chiave)
+    vince1 = partita["vincitore"] == partita.get("sq1")
+    s1, s2 = partita.get("set_sq1", 0) or 0, partita.get("set_sq2", 0) or 0
+    punteggi = partita.get("punteggi") or []
+    p1, p2 = sum(x[0] for x in punteggi), sum(x[1] for x in punteggi)
+
+    for a in t1:
+        for b in t2:
+            if a == b:
+                continue
+            if a < b:
+                r = _avversari.setdefault((a, b), [0, 0, 0, 0, 0, 0])
+                r[0] += 1; r[1] += vince1; r[2] += s1; r[3] += s2; r[4] += p1; r[5] += p2
+            else:
+                r = _avversari.setdefault((b, a), [0, 0, 0, 0, 0, 0])
+                r[0] += 1; r[1] += not vince1; r[2] += s2; r[3] += s1; r[4] += p2; r[5] += p1
+    for squadra, vinta, sf, ss, pf, ps in ((t1, vince1, s1, s2, p1, p2), (t2, not vince1, s2, s1, p2, p1)):
+        for a in squadra:
+            for b in squadra:
+                if a == b:
+                    continue
+                r = _compagni.setdefault(a, {}).setdefault(b, [0, 0, 0, 0, 0, 0])
+                r[0] += 1; r[1] += vinta; r[2] += sf; r[3] += ss; r[4] += pf; r[5] += ps
+
+
+def _squadre_state(state):
+    return {sq["id"]: ([] if sq.get("is_ghost") else list(sq.get("atleti", [])))
+            for sq in state.get("squadre", [])}
+
+
+def aggiorna_partita(state, partita):
+    """Registra una partita appena confermata nel torneo in corso."""
+    import archivio_tornei
+    squadre = _squadre_state(state)
+    with _lock:
+        _registra(archivio_tornei.id_torneo(state), partita,
+                  squadre.get(partita.get("sq1"), []), squadre.get(partita.get("sq2"), []))
+
+
+def _sincronizza(state=None, forza=False):
+    """Porta nell'indice i tornei archiviati non ancora letti e le partite del torneo in corso."""
+    import archivio_tornei
+    with _lock:
+        scaduto = forza or time.time() - _sync["ts"] > _RISINCRONIZZA_DOPO
+        if scaduto:
+            _sync["ts"] = time.time()
+            for voce in archivio_tornei.indice():
+                if voce["id"] in _archiviati:
+                    continue
+                record = archivio_tornei.carica(voce["id"])
+                if record is None:
+                    continue
+                _archiviati.add(voce["id"])
+                squadre = {sid: ([] if ghost else ids) for sid, _nome, ids, ghost in record["squadre"]}
+                for p in archivio_tornei.partite(record):
+                    _registra(voce["id"], p, squadre.get(p["sq1"], []), squadre.get(p["sq2"], []))
+        # Il torneo in corso si riscandisce solo se è cambiato o a intervalli:
+        # nel frattempo lo tiene aggiornato aggiorna_partita()
+        tid = archivio_tornei.id_torneo(state) if state is not None else None
+        if tid is not None and (scaduto or tid != _sync["torneo"]):
+            _sync["torneo"] = tid
+            squadre = _squadre_state(state)
+            tutte = [p for g in state.get("gironi", []) for p in g.get("partite", [])]
+            tutte += state.get("bracket", []) + state.get("bracket_extra", [])
+            for p in tutte:
+                if p.get("confermata") and (tid, p.get("id")) not in _viste:
+                    _registra(tid, p, squadre.get(p.get("sq1"), []), squadre.get(p.get("sq2"), []))
+
+
+def _risultato(r):
+    partite, vinte, sf, ss, pf, ps = r
+    return {"partite": partite, "vinte": vinte, "perse": partite - vinte,
+            "set_fatti": sf, "set_subiti": ss, "diff_set": sf - ss,
+            "punti_fatti": pf, "punti_subiti": ps, "diff_punti": pf - ps,
+            "win_rate": round(vinte / partite * 100, 1) if partite else 0}
+
+
+# ─── QUERY ────────────────────────────────────────────────────────────────────
+
+def scontri_diretti(a, b, state=None):
+    """Bilancio di a contro b (partite in cui erano avversari), dal punto di vista di a."""
+    _sincronizza(state)
+    with _lock:
+        if a < b:
+            r = list(_avversari.get((a, b), [0] * 6))
+        else:
+            partite, vinte_b, sb, sa, pb, pa = _avversari.get((b, a), [0] * 6)
+            r = [partite, partite - vinte_b, sa, sb, pa, pb]
+    return _risultato(r)
+
+
+def compagni(a, state=None):
+    """{compagno: risultati giocando insieme} per l'atleta a."""
+    _sincronizza(state)
+    with _lock:
+        return {b: _risultato(r) for b, r in _compagni.get(a, {}).items()}
+
+
+def intesa(a, b, state=None):
+    """Risultati di a e b quando giocano nella stessa squadra."""
+    _sincronizza(state)
+    with _lock:
+        return _risultato(_compagni.get(a, {}).get(b, [0] * 6))
+
+
+def migliori_compagni(a, state=None, min_partite=1, n=5):
+    """I compagni con cui a vince di più (win rate, poi differenza punti)."""
+    righe = [(b, r) for b, r in compagni(a, state).items() if r["partite"] >= min_partite]
+    righe.sort(key=lambda x: (-x[1]["win_rate"], -x[1]["diff_punti"], -x[1]["partite"]))
+    return righe[:n]
+
+
+def precedenti(atleti_ids, state=None):
+    """{(a, b) con a < b: partite da avversari} per le coppie tra gli atleti indicati."""
+    ids = set(atleti_ids)
+    _sincronizza(state)
+    with _lock:
+        return {(a, b): r[0] for (a, b), r in _avversari.items() if a in ids and b in ids}
+
+
+def ricostruisci(state=None):
+    """Svuota e ricostruisce l'indice da archivio e torneo in corso."""
+    with _lock:
+        _avversari.clear()
+        _compagni.clear()
+        _viste.clear()
+        _archiviati.clear()
+        _sincronizza(state, forza=True)
@@ -3,8 +3,10 @@ segnapunti_live.py — Segnapunti LIVE gigante con 8 stili e modalità libera
 """
 import streamlit as st
 from data_manager import (
-    save_state, get_squadra_by_id, aggiorna_classifica_squadra
+    save_state, get_squadra_by_id, calcola_schedule
 )
+from event_log import conferma_partita
+from calendario import adesso
 from theme_manager import get_active_scoreboard
 
 
@@ -203,6 +205,7 @@ def _render_scoreboard_core(state, key_base, sq1, sq2, sb_style, pmax, formato,
             if st.button("➕ PUNTO", key=f"{key_base}_add1", use_container_width=True):
                 st.session_state[f"{key_base}_p1"] += 1
                 st.session_state[f"{key_base}_battuta"] = 1
+                st.session_state.setdefault(f"{key_base}_inizio", adesso())
                 _check_set_win(state, key_base, pmax, formato)
                 st.rerun()
         with c1b:
@@ -223,6 +226,7 @@ def _render_scoreboard_core(state, key_base, sq1, sq2, sb_style, pmax, formato,
             if st.button("➕ PUNTO", key=f"{key_base}_add2", use_container_width=True):
                 st.session_state[f"{key_base}_p2"] += 1
                 st.session_state[f"{key_base}_battuta"] = 2
+                st.session_state.setdefault(f"{key_base}_inizio", adesso())
                 _check_set_win(state, key_base, pmax, formato)
                 st.rerun()
         with c2b:
@@ -253,7 +257,7 @@ def _render_scoreboard_core(state, key_base, sq1, sq2, sb_style, pmax, formato,
             st.session_state[f"{key_base}_p2"] = 0; st.rerun()
     with col_b:
         if st.button("🔄 Reset TUTTO", use_container_width=True):
-            for k in [f"{key_base}_s1",f"{key_base}_s2",f"{key_base}_p1",f"{key_base}_p2",f"{key_base}_battuta",f"{key_base}_punteggi_sets"]:
+            for k in [f"{key_base}_s1",f"{key_base}_s2",f"{key_base}_p1",f"{key_base}_p2",f"{key_base}_battuta",f"{key_base}_punteggi_sets",f"{key_base}_inizio"]:
                 if k in st.session_state: del st.session_state[k]
             st.rerun()
     with col_c:
@@ -262,6 +266,7 @@ def _render_scoreboard_core(state, key_base, sq1, sq2, sb_style, pmax, formato,
         if torneo and partita and sets_history and (s1 > s2 or s2 > s1):
             if st.button("📤 INVIA AL TABELLONE ✅", use_container_width=True):
                 _invia_al_tabellone(state, partita, key_base)
+                calcola_schedule(state)
                 save_state(state)
                 st.success("✅ Dati inviati al tabellone!")
                 st.rerun()
@@ -300,13 +305,12 @@ def _invia_al_tabellone(state, partita, key_base):
     if not sets: return
     s1v = sum(1 for a, b in sets if a > b)
     s2v = sum(1 for a, b in sets if b > a)
-    partita["punteggi"] = sets
-    partita["set_sq1"] = s1v; partita["set_sq2"] = s2v
-    partita["vincitore"] = partita["sq1"] if s1v >= s2v else partita["sq2"]
-    partita["in_battuta"] = st.session_state.get(f"{key_base}_battuta", 1)
-    partita["confermata"] = True
-    aggiorna_classifica_squadra(state, partita)
-    for k in [f"{key_base}_s1",f"{key_base}_s2",f"{key_base}_p1",f"{key_base}_p2",f"{key_base}_battuta",f"{key_base}_punteggi_sets"]:
+    conferma_partita(state, partita, {
+        "punteggi": sets, "set_sq1": s1v, "set_sq2": s2v,
+        "vincitore": partita["sq1"] if s1v >= s2v else partita["sq2"],
+    }, in_battuta=st.session_state.get(f"{key_base}_battuta", 1),
+       inizio=st.session_state.get(f"{key_base}_inizio"), fine=adesso())
+    for k in [f"{key_base}_s1",f"{key_base}_s2",f"{key_base}_p1",f"{key_base}_p2",f"{key_base}_battuta",f"{key_base}_punteggi_sets",f"{key_base}_inizio"]:
         if k in st.session_state: del st.session_state[k]
 
 
@@ -0,0 +1,178 @@
+"""
+storage_sqlite.py — Backend SQLite locale per lo storage chiave → valore
+Stesse chiavi del foglio Google Sheets, ma ogni famiglia di chiavi ha la sua
+tabella (atleti, squadre, partite, tornei, utenti, carte, incassi, ...).
+Ogni save aggiorna solo le righe cambiate, in una transazione.
+Le tabelle delle entità del torneo (atleti, squadre, partite, tornei) hanno
+anche colonne vere ricavate dal JSON della riga (colonne generate, sempre
+allineate al valore e indicizzabili): si possono interrogare in SQL senza
+decodificare i documenti. Le altre famiglie (utenti, carte, incassi, eventi,
+archivio, immagini) si leggono sempre per intero e restano chiave → valore.
+Journal in WAL: letture concorrenti dalle sessioni mentre un'altra scrive.
+Usato da data_manager come copia locale sempre aggiornata e come unico
+backend quando si lavora offline al campo.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+
+DB_FILE = "mbt_bvl.sqlite3"
+
+# Prefisso chiave (prima dei ':') → tabella. Il resto finisce in "kv".
+TABELLE = {
+    "atleta":        "atleti",
+    "squadra":       "squadre",
+    "partita":       "partite",
+    "girone":        "gironi",
+    "torneo_prog":   "tornei",
+    "utente":        "utenti",
+    "carta":         "carte",
+    "carta_draft":   "carte",
+    "incasso":       "incassi",
+    "evento":        "eventi",
+    "archivio":      "archivio",
+    "archivio_idx":  "archivio",
+    "blob":          "immagini",
+    "cover":         "immagini",
+    "foto_atleta":   "immagini",
+    "foto_card":     "immagini",
+    "foto_draft":    "immagini",
+}
+_TUTTE = sorted(set(TABELLE.values()) | {"kv"})
+
+# Colonne vere per tabella: (nome, tipo, percorso JSON nel valore)
+COLONNE = {
+    "atleti": (("nome", "TEXT", "$.nome"), ("club", "TEXT", "$.club"),
+               ("elo", "REAL", "$.stats.rating.elo")),
+    "squadre": (("nome", "TEXT", "$.nome"), ("is_ghost", "INTEGER", "$.is_ghost")),
+    "partite": (("fase", "TEXT", "$.fase"), ("girone", "TEXT", "$.girone"), ("round", "TEXT", "$.round"),
+                ("sq1", "TEXT", "$.sq1"), ("sq2", "TEXT", "$.sq2"), ("vincitore", "TEXT", "$.vincitore"),
+                ("confermata", "INTEGER", "$.confermata"), ("campo", "INTEGER", "$.campo"),
+                ("orario_schedulato", "TEXT", "$.orario_schedulato")),
+    "tornei": (("nome", "TEXT", "$.nome"), ("data", "TEXT", "$.data")),
+}
+INDICI = {"partite": ("sq1", "sq2"), "atleti": ("nome",), "squadre": ("nome",)}
+
+
+def tabella_per_chiave(key):
+    return TABELLE.get(key.split(":", 1)[0], "kv") if ":" in key else "kv"
+
+
+def _hash_val(value):
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SqliteStore:
+    """Store chiave → valore su SQLite, una tabella per tipo di entità."""
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self._lock = threading.RLock()
+        # Una connessione per processo condivisa tra i thread delle sessioni (serializzata dal lock)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for t in _TUTTE:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {t} ("
+                "chiave TEXT PRIMARY KEY, valore TEXT NOT NULL, aggiornato REAL NOT NULL)"
+            )
+        self._aggiungi_colonne()
+        self._hashes = None   # {chiave: hash} di quanto è nel DB, caricato al primo uso
+
+    def _aggiungi_colonne(self):
+        """Colonne generate dal JSON (anche su DB già esistenti) e relativi indici."""
+        for t, colonne in COLONNE.items():
+            esistenti = {r[1] for r in self._conn.execute(f"PRAGMA table_xinfo({t})").fetchall()}
+            try:
+                for nome, tipo, percorso in colonne:
+                    if nome not in esistenti:
+                        self._conn.execute(
+                            f"ALTER TABLE {t} ADD COLUMN {nome} {tipo} GENERATED ALWAYS AS "
+                            f"(CASE WHEN json_valid(valore) THEN json_extract(valore, '{percorso}') END) VIRTUAL"
+                        )
+                for nome in INDICI.get(t, ()):
+                    self._conn.execute(f"CREATE INDEX IF NOT EXISTS {t}_{nome} ON {t} ({nome})")
+            except sqlite3.OperationalError:
+                return   # SQLite < 3.31 senza colonne generate: resta il solo chiave → valore
+
+    def _known(self):
+        if self._hashes is None:
+            self._hashes = {k: _hash_val(v) for k, v in self._select_all().items()}
+        return self._hashes
+
+    def _select_all(self):
+        out = {}
+        for t in _TUTTE:
+            out.update(self._conn.execute(f"SELECT chiave, valore FROM {t}").fetchall())
+        return out
+
+    def read_all(self):
+        with self._lock:
+            store = self._select_all()
+            self._hashes = {k: _hash_val(v) for k, v in store.items()}
+            return store
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT valore FROM {tabella_per_chiave(key)} WHERE chiave = ?", (key,)
+            ).fetchone()
+            return row[0] if row else None
+
+    def keys(self):
+        with self._lock:
+            return list(self._known())
+
+    def write(self, updates):
+        """Scrive in una transazione solo le righe cambiate. Ritorna True se ne ha scritta almeno una."""
+        with self._lock:
+            known = self._known()
+            rows = []
+            for k, v in updates.items():
+                v = v if isinstance(v, str) else str(v)
+                h = _hash_val(v)
+                if known.get(k) != h:
+                    rows.append((k, v, h))
+            if not rows:
+                return False
+            ora = time.time()
+            with self._transaction():
+                for k, v, _h in rows:
+                    self._conn.execute(
+                        f"INSERT INTO {tabella_per_chiave(k)} (chiave, valore, aggiornato) "
+                        "VALUES (?, ?, ?) ON CONFLICT(chiave) DO UPDATE SET "
+                        "valore = excluded.valore, aggiornato = excluded.aggiornato",
+                        (k, v, ora),
+                    )
+            for k, _v, h in rows:
+                known[k] = h
+            return True
+
+    def delete(self, keys):
+        with self._lock:
+            keys = list(keys)
+            if not keys:
+                return
+            with self._transaction():
+                for k in keys:
+                    self._conn.execute(f"DELETE FROM {tabella_per_chiave(k)} WHERE chiave = ?", (k,))
+            known = self._known()
+            for k in keys:
+                known.pop(k, None)
+
+    def _transaction(self):
+        conn = self._conn
+
+        class _Tx:
+            def __enter__(self_):
+                conn.execute("BEGIN IMMEDIATE")
+
+            def __exit__(self_, exc_type, exc, tb):
+                conn.execute("ROLLBACK" if exc_type else "COMMIT")
+                if exc_type:
+                    # Il DB non ha le righe che pensavamo: ricarica gli hash al prossimo uso
+                    self._hashes = None
+
+        return _Tx()
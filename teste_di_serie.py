@@ -0,0 +1,117 @@
+"""
+teste_di_serie.py — Sorteggio dei gironi con teste di serie dal ranking
+Forza di una squadra dalle righe del ranking di TUTTI i suoi atleti (punti
+ranking sommati, poi Elo medio), lette da una mappa id → riga costruita una
+volta sola. Le squadre ordinate per forza formano fasce di num_gironi squadre
+distribuite a serpentina (A→H, poi H→A, ...). Dentro ogni fascia si scambiano
+le squadre tra gironi quando questo riduce i conflitti con chi è già nel
+girone:
+  - stesso club (atleti["club"], se indicato)
+  - avversari già incontrati in passato (indice scontri_diretti)
+Gli scambi restano nella fascia, quindi l'equilibrio delle teste di serie non
+cambia. Tutto è lineare nel numero di squadre: 128 squadre restano istantanee.
+"""
+
+PESO_CLUB = 100       # un club in comune pesa più di qualsiasi numero di precedenti
+_PASSATE_MAX = 10     # passate di scambi per fascia (di solito ne basta una)
+
+
+def forza_squadre(state, squadre_ids):
+    """
+    {id squadra: chiave di ordinamento} (minore = più forte): punti ranking
+    sommati degli atleti, Elo medio, miglior posizione in classifica.
+    Le squadre ghost e gli atleti fuori ranking contano zero.
+    """
+    from data_manager import get_ranking, indice_ranking
+    ranking = get_ranking(state)
+    posizioni = indice_ranking(ranking)
+    squadre = {sq["id"]: sq for sq in state.get("squadre", [])}
+    fuori = len(ranking)
+    forza = {}
+    for sid in squadre_ids:
+        sq = squadre.get(sid)
+        atleti = [] if not sq or sq.get("is_ghost") else sq.get("atleti", [])
+        righe = [ranking[posizioni[aid]] for aid in atleti if aid in posizioni]
+        punti = sum(r["rank_pts"] for r in righe)
+        elo = sum(r.get("elo", 1500) for r in righe) / len(righe) if righe else 0
+        migliore = min((posizioni[r["id"]] for r in righe), default=fuori)
+        forza[sid] = (-punti, -elo, migliore)
+    return forza
+
+
+def conflitti(state, squadre_ids):
+    """
+    Funzione costo(sid1, sid2) del conflitto tra due squadre nello stesso
+    girone: PESO_CLUB per club in comune + partite già giocate tra i loro atleti.
+    """
+    import scontri_diretti
+    squadre = {sq["id"]: sq for sq in state.get("squadre", [])}
+    atleti = {a["id"]: a for a in state.get("atleti", [])}
+    membri, club = {}, {}
+    for sid in squadre_ids:
+        sq = squadre.get(sid)
+        membri[sid] = [] if not sq or sq.get("is_ghost") else list(sq.get("atleti", []))
+        club[sid] = {atleti[aid].get("club", "").strip().lower()
+                     for aid in membri[sid] if aid in atleti} - {""}
+    try:
+        gia_visti = scontri_diretti.precedenti({aid for ids in membri.values() for aid in ids}, state)
+    except Exception:
+        gia_visti = {}   # archivio non raggiungibile: solo il vincolo del club
+
+    def costo(s1, s2):
+        c = PESO_CLUB * len(club[s1] & club[s2])
+        for a in membri[s1]:
+            for b in membri[s2]:
+                c += gia_visti.get((a, b) if a < b else (b, a), 0)
+        return c
+    return costo
+
+
+def serpentina(ordinati, num_gironi, costo=None):
+    """
+    Gironi (liste di id) dalle squadre in ordine di forza: fasce da num_gironi
+    distribuite a serpentina, poi scambi dentro la fascia finché riducono il
+    costo dei conflitti con le squadre già nei gironi.
+    """
+    gironi = [[] for _ in range(num_gironi)]
+    for f, inizio in enumerate(range(0, len(ordinati), num_gironi)):
+        fascia = ordinati[inizio:inizio + num_gironi]
+        posti = list(range(num_gironi)) if f % 2 == 0 else list(range(num_gironi - 1, -1, -1))
+        posti = posti[:len(fascia)]
+        if costo is not None and f > 0:
+            _scambi(fascia, posti, gironi, costo)
+        for sid, g in zip(fascia, posti):
+            gironi[g].append(sid)
+    return gironi
+
+
+def _scambi(fascia, posti, gironi, costo):
+    """Migliora in place l'assegnazione fascia → posti con scambi a coppie."""
+    cache = {}
+
+    def c(sid, g):
+        if (sid, g) not in cache:
+            cache[(sid, g)] = sum(costo(sid, altra) for altra in gironi[g])
+        return cache[(sid, g)]
+
+    for _ in range(_PASSATE_MAX):
+        migliorato = False
+        for i in range(len(fascia)):
+            for j in range(i + 1, len(fascia)):
+                gi, gj = posti[i], posti[j]
+                if c(fascia[i], gj) + c(fascia[j], gi) < c(fascia[i], gi) + c(fascia[j], gj):
+                    posti[i], posti[j] = gj, gi
+                    migliorato = True
+        if not migliorato:
+            break
+
+
+def sorteggia(state, ordinati, num_gironi):
+    """Gironi con teste di serie per squadre già ordinate da ordina() (ghost comprese)."""
+    return serpentina(ordinati, num_gironi, conflitti(state, ordinati))
+
+
+def ordina(state, squadre_ids):
+    """Squadre dalla più forte alla più debole (a parità resta l'ordine d'iscrizione)."""
+    forza = forza_squadre(state, squadre_ids)
+    return sorted(squadre_ids, key=forza.__getitem__)
@@ -0,0 +1,35 @@
+"""Abbinamenti dei turni playoff generati partita per partita (calendario.incroci_pronti)."""
+from calendario import incroci_pronti
+
+
+def _partita(slot, vincitore=None, sq1=None, sq2=None):
+    p = {"sq1": sq1 or f"T{2 * slot}", "sq2": sq2 or f"T{2 * slot + 1}",
+         "vincitore": vincitore, "confermata": vincitore is not None}
+    if slot is not None:
+        p["slot"] = slot
+    return p
+
+
+def test_completamento_fuori_ordine_non_incrocia_slot_lontani():
+    # Quarti 0 e 2 conclusi (1 e 3 ancora da giocare): nessuna semifinale pronta
+    quarti = [_partita(0, "T0"), _partita(1), _partita(2, "T4"), _partita(3)]
+    assert incroci_pronti(quarti) == []
+
+
+def test_abbina_per_slot_non_per_posizione():
+    # Nella lista i quarti sono in ordine di generazione, non di slot
+    q2, q0, q3, q1 = _partita(2, "T4"), _partita(0, "T0"), _partita(3, "T7"), _partita(1, "T3")
+    pronti = incroci_pronti([q2, q0, q3])
+    assert [(k, a["vincitore"], b["vincitore"]) for k, a, b in pronti] == [(1, "T4", "T7")]
+    pronti = incroci_pronti([q2, q0, q3, q1])
+    assert [(k, a["vincitore"], b["vincitore"]) for k, a, b in pronti] == [(0, "T0", "T3"), (1, "T4", "T7")]
+
+
+def test_turno_incompleto_senza_slot_mancanti():
+    # Una sola semifinale generata e conclusa: le finali non sono pronte
+    assert incroci_pronti([_partita(0, "T0")]) == []
+
+
+def test_primo_turno_senza_slot_usa_ordine_della_lista():
+    primo = [{"sq1": "A", "sq2": "B", "vincitore": "A"}, {"sq1": "C", "sq2": "D", "vincitore": "D"}]
+    assert [(k, a["vincitore"], b["vincitore"]) for k, a, b in incroci_pronti(primo)] == [(0, "A", "D")]
@@ -0,0 +1,62 @@
+"""Attributi FIFA: incrementi di fine torneo identici a quelli del ricalcolo da zero."""
+import copy
+
+import pytest
+
+pytest.importorskip("streamlit")   # trasferisci_al_ranking sta in data_manager
+import career_engine
+import data_manager as dm
+
+_TORNEI = [  # (nome, data): stesso nome e data ripetuti e date mancanti compresi
+    ("Coppa Estate", "2026-06-01"),
+    ("Coppa Estate", "2026-06-01"),
+    ("Memorial", None),
+    ("Memorial", None),
+    ("Open", ""),
+    ("Finale", "2026-09-12"),
+]
+
+
+@pytest.fixture
+def storage_locale(tmp_path, monkeypatch):
+    # L'archivio dei tornei scrive nello storage: SQLite in una cartella temporanea
+    monkeypatch.setenv("MBT_STORAGE", "sqlite")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dm, "_local_db_inst", None)
+
+
+def _lega():
+    state = dm.empty_state()
+    state["seme_lega"] = 20260917
+    state["atleti"] = [dm.new_atleta(f"Atleta {i}") for i in range(8)]
+    ids = [a["id"] for a in state["atleti"]]
+    state["squadre"] = [{"id": f"s{j}", "nome": f"S{j}", "atleti": ids[2 * j:2 * j + 2]} for j in range(4)]
+    return state
+
+
+def _attributi(atleti):
+    return {a["id"]: {k: a["stats"][k] for k in career_engine.ATTRIBUTI_FIFA} for a in atleti}
+
+
+def test_fine_torneo_e_ricalcolo_danno_gli_stessi_attributi(storage_locale):
+    state = _lega()
+    for k, (nome, data) in enumerate(_TORNEI):
+        state["torneo"].update(nome=nome, data=data, id=f"t{k}")
+        ordine = state["squadre"][k % 4:] + state["squadre"][:k % 4]
+        dm.trasferisci_al_ranking(state, [(i + 1, sq["id"]) for i, sq in enumerate(ordine[:3])])
+
+    _agg, attributi = career_engine.ricalcola_carriere(copy.deepcopy(state["atleti"]),
+                                                      state["seme_lega"], processi=1)
+    assert {aid: {k: int(v) for k, v in a.items()} for aid, a in attributi.items()} == _attributi(state["atleti"])
+
+
+def test_semi_di_voci_senza_data_sono_interi():
+    atleti = [{"id": "a1", "stats": {"storico_posizioni": [
+        {"nome": "Memorial", "pos": 1, "data": None},
+        {"nome": "Memorial", "pos": 2, "data": None},
+        {"nome": "Open", "pos": 3, "data": "2026-05-01"},
+    ]}}]
+    semi = career_engine._semi(career_engine.storico_df(atleti), 7).tolist()
+    assert semi == [career_engine.seme_voce(7, "a1", "Memorial", "", 0),
+                    career_engine.seme_voce(7, "a1", "Memorial", "", 1),
+                    career_engine.seme_voce(7, "a1", "Open", "2026-05-01", 0)]
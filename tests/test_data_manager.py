@@ -0,0 +1,101 @@
+"""Funzioni pure dello storage: merge a tre vie dei salvataggi concorrenti e codec dei valori."""
+import base64
+import json
+import os
+
+import pytest
+
+pytest.importorskip("streamlit")   # data_manager importa streamlit
+from data_manager import _codifica, _decodifica, _expand_chunks, _merge3, _sheet_read_chunked
+
+
+def _merge(base, ours, theirs, percorso="partita:p1"):
+    conflitti = []
+    return _merge3(base, ours, theirs, percorso, conflitti), conflitti
+
+
+def test_modifiche_di_un_solo_lato():
+    base = {"punteggi": [], "confermata": False}
+    nostra = {"punteggi": [[21, 15]], "confermata": True}
+    assert _merge(base, nostra, base) == (nostra, [])
+    assert _merge(base, base, nostra) == (nostra, [])
+
+
+def test_campi_diversi_modificati_da_entrambi():
+    base = {"campo": 1, "orario": "10:00", "note": ""}
+    nostra = {"campo": 2, "orario": "10:00", "note": ""}
+    loro = {"campo": 1, "orario": "10:00", "note": "ritardo"}
+    assert _merge(base, nostra, loro) == ({"campo": 2, "orario": "10:00", "note": "ritardo"}, [])
+
+
+def test_conflitto_vince_la_versione_salvata():
+    base = {"stats": {"elo": 1500, "tornei": 3}}
+    nostra = {"stats": {"elo": 1510, "tornei": 3}}
+    loro = {"stats": {"elo": 1490, "tornei": 4}}
+    unito, conflitti = _merge(base, nostra, loro, "atleta:a1")
+    assert unito == {"stats": {"elo": 1490, "tornei": 4}}
+    assert conflitti == ["atleta:a1.stats.elo"]
+
+
+def test_campi_aggiunti_e_tolti():
+    base = {"a": 1, "b": 2}
+    nostra = {"a": 1}                     # b tolto da noi
+    loro = {"a": 1, "b": 2, "c": 3}      # c aggiunto da loro
+    assert _merge(base, nostra, loro) == ({"a": 1, "c": 3}, [])
+
+
+def test_liste_di_chiavi_uniscono_aggiunte_e_rimozioni():
+    base = {"partite": ["p1", "p2", "p3"]}
+    nostra = {"partite": ["p1", "p3", "p4"]}        # tolta p2, aggiunta p4
+    loro = {"partite": ["p1", "p2", "p3", "p5"]}    # aggiunta p5
+    assert _merge(base, nostra, loro, "girone:g1") == ({"partite": ["p1", "p3", "p5", "p4"]}, [])
+
+
+def test_campi_con_regola_propria_non_sono_conflitti():
+    base = {"_ultimo_evento": "001", "ranking_globale": [], "seme_lega": None}
+    nostra = {"_ultimo_evento": "005", "ranking_globale": [{"id": "a"}], "seme_lega": 11}
+    loro = {"_ultimo_evento": "003", "ranking_globale": [{"id": "b"}], "seme_lega": 22}
+    unito, conflitti = _merge(base, nostra, loro, "main_data")
+    assert unito == {"_ultimo_evento": "005", "ranking_globale": [{"id": "b"}], "seme_lega": 22}
+    assert conflitti == []
+
+
+# ─── CODEC VALORI ─────────────────────────────────────────────────────────────
+
+_STORICO = json.dumps([{"nome": f"Torneo d'estate {i}", "pos": i % 7 + 1, "luogo": "Cesenatico",
+                        "compagni": ["Élodie", "Łukasz"]} for i in range(200)], ensure_ascii=False)
+
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma"])
+def test_codifica_decodifica_andata_e_ritorno(monkeypatch, codec):
+    monkeypatch.setenv("MBT_CODEC", codec)
+    codificato = _codifica(_STORICO)
+    assert codificato.startswith(f"<{codec}85>")
+    assert len(codificato) < len(_STORICO) / 3
+    assert _decodifica(codificato) == _STORICO
+
+
+def test_ogni_codec_si_legge_con_qualunque_impostazione(monkeypatch):
+    monkeypatch.setenv("MBT_CODEC", "lzma")
+    codificato = _codifica(_STORICO)
+    monkeypatch.setenv("MBT_CODEC", "zlib")
+    assert _decodifica(codificato) == _STORICO
+
+
+def test_valori_lasciati_in_chiaro(monkeypatch):
+    monkeypatch.setenv("MBT_CODEC", "zlib")
+    corto = '{"id": "a1"}'
+    casuale = base64.b85encode(os.urandom(2400)).decode()   # non abbastanza comprimibile
+    for valore in (corto, casuale, "<chunk:3>"):
+        assert _codifica(valore) == valore
+        assert _decodifica(valore) == valore
+    monkeypatch.setenv("MBT_CODEC", "nessuno")
+    assert _codifica(_STORICO) == _STORICO
+
+
+def test_valore_codificato_e_diviso_in_chunk(monkeypatch):
+    monkeypatch.setenv("MBT_CODEC", "zlib")
+    lungo = json.dumps([os.urandom(64).hex() for _ in range(2000)])   # compresso supera _CELL_LIMIT
+    righe = _expand_chunks({"atleta:a1": _codifica(lungo)})
+    assert righe["atleta:a1"].startswith("<chunk:")
+    assert _sheet_read_chunked(righe, "atleta:a1") == lungo
@@ -0,0 +1,70 @@
+"""Ricalcolo batch dei rating (rating_engine.riclassifica) contro l'aggiornamento partita per partita."""
+import copy
+import random
+
+import pytest
+
+pytest.importorskip("streamlit")   # rating_engine legge squadre e atleti tramite data_manager
+import rating_engine
+
+
+def _lega(seme, n_atleti=24, n_partite=300):
+    """State con atleti e una squadra per lato di ogni partita, più le partite confermate in ordine."""
+    rng = random.Random(seme)
+    state = {"torneo": {"data": "2026-03-01"}, "squadre": [],
+             "atleti": [{"id": f"a{i}", "stats": {}} for i in range(n_atleti)]}
+    partite = []
+    for k in range(n_partite):
+        n1, n2 = rng.randint(1, 3), rng.randint(1, 3)
+        giocatori = rng.sample([a["id"] for a in state["atleti"]], n1 + n2)
+        sq1 = {"id": f"s{k}a", "atleti": giocatori[:n1]}
+        sq2 = {"id": f"s{k}b", "atleti": giocatori[n1:]}
+        state["squadre"] += [sq1, sq2]
+        partite.append({"id": f"p{k}", "sq1": sq1["id"], "sq2": sq2["id"],
+                        "vincitore": rng.choice([sq1["id"], sq2["id"]]), "confermata": True})
+    return state, partite
+
+
+def _record(state, partite):
+    squadre = {sq["id"]: sq["atleti"] for sq in state["squadre"]}
+    return [{"id": p["id"], "data": state["torneo"]["data"], "sq1": squadre[p["sq1"]],
+             "sq2": squadre[p["sq2"]], "vince_sq1": p["vincitore"] == p["sq1"]} for p in partite]
+
+
+def _confronta(sequenziale, batch):
+    for a, b in zip(sequenziale, batch):
+        assert b["stats"]["rating"]["elo"] == pytest.approx(a["stats"]["rating"]["elo"], abs=1e-9)
+        assert b["stats"]["rating"]["partite"] == a["stats"]["rating"]["partite"]
+        storico_a, storico_b = a["stats"]["rating_storico"], b["stats"]["rating_storico"]
+        assert [v[:2] for v in storico_b] == [v[:2] for v in storico_a]
+        assert [v[2] for v in storico_b] == pytest.approx([v[2] for v in storico_a], abs=0.11)
+
+
+@pytest.mark.parametrize("seme", [1, 2, 3])
+def test_riclassifica_uguale_a_partita_per_partita(seme):
+    state, partite = _lega(seme)
+    batch = copy.deepcopy(state["atleti"])
+    for p in partite:
+        rating_engine.aggiorna_partita(state, p)
+    rating_engine.riclassifica(batch, _record(state, partite))
+    _confronta(state["atleti"], batch)
+
+
+def test_storico_limitato_uguale_nei_due_calcoli(monkeypatch):
+    monkeypatch.setattr(rating_engine, "_STORICO_MAX", 5)
+    state, partite = _lega(4, n_atleti=8, n_partite=120)
+    batch = copy.deepcopy(state["atleti"])
+    for p in partite:
+        rating_engine.aggiorna_partita(state, p)
+    rating_engine.riclassifica(batch, _record(state, partite))
+    assert all(len(a["stats"]["rating_storico"]) == 5 for a in state["atleti"])
+    _confronta(state["atleti"], batch)
+
+
+def test_simulate_fuori_classifica_non_contano():
+    state, partite = _lega(5, n_partite=10)
+    for p in partite:
+        p["classifica"] = False
+        rating_engine.aggiorna_partita(state, p)
+    assert all("rating" not in a["stats"] for a in state["atleti"])
+    assert rating_engine.partite_da_state({**state, "gironi": [{"partite": partite}]}) == []
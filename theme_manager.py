@@ -212,23 +212,19 @@ _THEME_DEFAULT = {
 }
 
 def load_theme_config():
-    # 1. Prova Google Sheets (chiave: "theme_cfg")
+    # 1. Storage di data_manager (chiave: "theme_cfg")
     try:
-        from data_manager import _get_gsheet, _sheet_read_all
-        sheet = _get_gsheet()
-        if sheet is not None:
-            store = _sheet_read_all(sheet)
-            from data_manager import _sheet_read_chunked
-            val = _sheet_read_chunked(store, "theme_cfg")
-            if val:
-                cfg = json.loads(val)
-                # Assicura campi mancanti per compatibilità
-                for k, v in _THEME_DEFAULT.items():
-                    cfg.setdefault(k, v)
-                return cfg
+        from data_manager import storage_get
+        val = storage_get("theme_cfg")
+        if val:
+            cfg = json.loads(val)
+            # Assicura campi mancanti per compatibilità
+            for k, v in _THEME_DEFAULT.items():
+                cfg.setdefault(k, v)
+            return cfg
     except Exception:
         pass
-    # 2. Fallback locale
+    # 2. Migrazione dal vecchio file locale
     if Path(THEME_FILE).exists():
         with open(THEME_FILE, "r") as f:
             cfg = json.load(f)
@@ -239,41 +235,36 @@ def load_theme_config():
 
 
 def save_theme_config(cfg):
-    # 1. Salva su Google Sheets
     try:
-        from data_manager import _get_gsheet, _sheet_write
-        sheet = _get_gsheet()
-        if sheet is not None:
-            # Il logo e il banner possono essere grandi: li salviamo separati
-            import copy
-            cfg_light = copy.deepcopy(cfg)
-            extra = {}
-            if cfg_light.get("logo_b64"):
-                extra["theme_logo_b64"] = cfg_light["logo_b64"]
-                cfg_light["logo_b64"] = None
-            if cfg_light.get("banner_b64"):
-                extra["theme_banner_b64"] = cfg_light["banner_b64"]
-                cfg_light["banner_b64"] = None
-            updates = {"theme_cfg": json.dumps(cfg_light, ensure_ascii=False)}
-            updates.update(extra)
-            _sheet_write(sheet, updates)
+        from data_manager import storage_write
+        # Il logo e il banner possono essere grandi: li salviamo separati
+        import copy
+        from blob_store import put_b64
+        cfg_light = copy.deepcopy(cfg)
+        extra = {}
+        if cfg_light.get("logo_b64"):
+            extra["theme_logo_b64"] = put_b64(cfg_light["logo_b64"])
+            cfg_light["logo_b64"] = None
+        if cfg_light.get("banner_b64"):
+            extra["theme_banner_b64"] = put_b64(cfg_light["banner_b64"])
+            cfg_light["banner_b64"] = None
+        updates = {"theme_cfg": json.dumps(cfg_light, ensure_ascii=False)}
+        updates.update(extra)
+        storage_write(updates)
     except Exception:
         pass
-    # 2. Backup locale silenzioso
-    with open(THEME_FILE, "w") as f:
-        json.dump(cfg, f)
 
 def _restore_theme_images(cfg):
-    """Reinserisce logo e banner nel cfg leggendo dal foglio."""
+    """Reinserisce logo e banner nel cfg leggendo dallo storage."""
     try:
-        from data_manager import _get_gsheet, _sheet_read_all
-        sheet = _get_gsheet()
-        if sheet is not None:
-            store = _sheet_read_all(sheet)
-            if store.get("theme_logo_b64"):
-                cfg["logo_b64"] = store["theme_logo_b64"]
-            if store.get("theme_banner_b64"):
-                cfg["banner_b64"] = store["theme_banner_b64"]
+        from data_manager import storage_get
+        from blob_store import get_b64
+        logo = storage_get("theme_logo_b64")
+        if logo:
+            cfg["logo_b64"] = get_b64(logo)
+        banner = storage_get("theme_banner_b64")
+        if banner:
+            cfg["banner_b64"] = get_b64(banner)
     except Exception:
         pass
     return cfg